@@ -1,7 +1,23 @@
-from django.contrib import admin
+import os
+from datetime import timedelta
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from .models import Perfil, CalificacionTributaria, CargaMasiva, LogOperacion
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from . import auditoria, busqueda, correcciones, ejercicios, perfiles, resumenes
+from .facetas import ValoresCacheadosFilter
+from .formato_dj1948 import CAMPOS_FACTOR
+from .models import (
+    AYUDA_FACTORES, DEFINICION_FACTOR, Perfil, CalificacionTributaria, CargaMasiva, EjercicioCerrado, LogOperacion,
+)
+from .paginacion import ConteoEstimadoPaginator
 
 
 # ============================================
@@ -18,10 +34,27 @@ class PerfilInline(admin.StackedInline):
 # ============================================
 # EXTENDER ADMIN DE USUARIO
 # ============================================
+def _sin_ejercicios_cerrados(eliminados, **objetos):
+    """
+    Agrega a los protegidos de get_deleted_objects los ejercicios cerrados
+    que cambiaría la eliminación (ver ejercicios.rechazar_eliminacion): el
+    admin muestra el motivo y no elimina. En ese caso no devuelve permisos
+    faltantes: las calificaciones cerradas también los agregan y el admin
+    los mostraría en lugar del motivo.
+    """
+    a_eliminar, cantidades, permisos, protegidos = eliminados
+    try:
+        ejercicios.rechazar_eliminacion(**objetos)
+    except ValidationError as exc:
+        return a_eliminar, cantidades, set(), [*protegidos, *exc.messages]
+    return a_eliminar, cantidades, permisos, protegidos
+
+
 class CustomUserAdmin(UserAdmin):
     inlines = (PerfilInline,)
     list_display = ('username', 'email', 'get_rol', 'get_nombre_completo', 'is_active', 'date_joined')
     list_filter = ('is_active',)
+    list_select_related = ('perfil',)
     
     def get_rol(self, obj):
         return obj.perfil.get_rol_display() if hasattr(obj, 'perfil') else '-'
@@ -30,6 +63,9 @@ class CustomUserAdmin(UserAdmin):
     def get_nombre_completo(self, obj):
         return obj.perfil.nombre_completo if hasattr(obj, 'perfil') else '-'
     get_nombre_completo.short_description = 'Nombre Completo'
+    
+    def get_deleted_objects(self, objs, request):
+        return _sin_ejercicios_cerrados(super().get_deleted_objects(objs, request), usuarios=objs)
 
 
 # Re-registrar User con el nuevo admin
@@ -40,8 +76,68 @@ admin.site.register(User, CustomUserAdmin)
 # ============================================
 # ADMIN: CALIFICACIÓN TRIBUTARIA
 # ============================================
+def _campo_factor(campo):
+    return forms.DecimalField(
+        label=campo.replace('_', ' ').capitalize(),
+        max_digits=DEFINICION_FACTOR.max_digits,
+        decimal_places=DEFINICION_FACTOR.decimal_places,
+        validators=DEFINICION_FACTOR.validators,
+        initial=DEFINICION_FACTOR.default,
+        help_text=AYUDA_FACTORES.get(campo, ''),
+    )
+
+
+# Un campo de formulario por factor_N: en el modelo son posiciones de `factores`
+FactoresForm = type('FactoresForm', (forms.Form,), {campo: _campo_factor(campo) for campo in CAMPOS_FACTOR})
+
+
+class CalificacionTributariaForm(forms.ModelForm, FactoresForm):
+    class Meta:
+        model = CalificacionTributaria
+        exclude = ('factores',)
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for campo in CAMPOS_FACTOR:
+            self.initial.setdefault(campo, getattr(self.instance, campo))
+    
+    def _post_clean(self):
+        # Antes de la validación del modelo, que revisa la suma de factores en clean()
+        for campo in CAMPOS_FACTOR:
+            if self.cleaned_data.get(campo) is not None:
+                setattr(self.instance, campo, self.cleaned_data[campo])
+        super()._post_clean()
+
+
+class CorreccionForm(forms.Form):
+    """Campo y valor nuevo de la acción de corrección masiva"""
+    campo = forms.ChoiceField(choices=[(campo, campo) for campo in correcciones.CAMPOS_CORREGIBLES])
+    valor = forms.CharField(required=False, help_text='Fechas AAAA-MM-DD; decimales con punto; sí/no: True o False')
+
+    def clean(self):
+        datos = super().clean()
+        if 'campo' in datos:
+            try:
+                datos['cambios'] = correcciones.limpiar_cambios({datos['campo']: datos.get('valor', '')})
+            except ValidationError as exc:
+                self.add_error('valor', exc.messages)
+        return datos
+
+
+class BusquedaChangeList(ChangeList):
+    """Al buscar, sin un orden elegido por columna, primero lo más relevante"""
+
+    def get_ordering(self, request, queryset):
+        ordering = super().get_ordering(request, queryset)
+        if 'relevancia' in queryset.query.annotations and not self.params.get(ORDER_VAR):
+            return ['-relevancia', *ordering]
+        return ordering
+
+
 @admin.register(CalificacionTributaria)
 class CalificacionTributariaAdmin(admin.ModelAdmin):
+    form = CalificacionTributariaForm
+    change_list_template = 'admin/gestion_tributaria/calificaciontributaria/change_list.html'
     list_display = (
         'instrumento', 
         'ejercicio', 
@@ -54,19 +150,26 @@ class CalificacionTributariaAdmin(admin.ModelAdmin):
         'updated_at'
     )
     list_filter = (
-        'ejercicio', 
+        ('ejercicio', ValoresCacheadosFilter),
         'mercado', 
         'origen', 
         'es_local',
         'tipo_sociedad',
         'acogido_isfut'
     )
+    # Se resuelven en get_search_results (ver busqueda.py)
     search_fields = (
         'instrumento', 
         'descripcion',
         'usuario__username',
     )
+    list_select_related = ('usuario__perfil',)
+    # Sin COUNT(*) de la tabla completa ni conteos por filtro en cada página
+    paginator = ConteoEstimadoPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
     readonly_fields = ('created_at', 'updated_at')
+    actions = ['corregir_calificaciones']
     
     fieldsets = (
         ('Información Básica', {
@@ -121,17 +224,152 @@ class CalificacionTributariaAdmin(admin.ModelAdmin):
     )
     
     def get_usuario(self, obj):
-        return obj.usuario.perfil.nombre_completo if hasattr(obj.usuario, 'perfil') else obj.usuario.username
+        return perfiles.nombre_usuario(obj.usuario)
     get_usuario.short_description = 'Corredor'
     
+    def save_model(self, request, obj, form, change):
+        """Guarda y registra en LogOperacion solo los campos modificados"""
+        anterior = None
+        if change:
+            anterior = auditoria.instantanea(CalificacionTributaria.objects.get(pk=obj.pk))
+        super().save_model(request, obj, form, change)
+        nuevo = auditoria.instantanea(obj)
+        if anterior == nuevo:
+            return
+        auditoria.registrar(
+            request.user.pk,
+            'UPDATE' if change else 'CREATE',
+            obj.pk,
+            anterior=anterior,
+            nuevo=nuevo,
+            ip_address=request.META.get('REMOTE_ADDR'),
+        )
+    
+    def delete_model(self, request, obj):
+        auditoria.registrar(
+            request.user.pk, 'DELETE', obj.pk,
+            anterior=auditoria.instantanea(obj),
+            ip_address=request.META.get('REMOTE_ADDR'),
+        )
+        super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        if not perfiles.es_administrador(request):
+            # Las compartidas seleccionadas en la acción no se eliminan
+            queryset = queryset.filter(usuario=request.user)
+        # Ni las de ejercicios cerrados (particiones de solo lectura)
+        queryset = queryset.exclude(ejercicio__in=ejercicios.cerrados())
+        with auditoria.BufferAuditoria() as buffer:
+            for obj in queryset.iterator():
+                buffer.agregar(
+                    request.user.pk, 'DELETE', obj.pk,
+                    anterior=auditoria.instantanea(obj),
+                    ip_address=request.META.get('REMOTE_ADDR'),
+                )
+        super().delete_queryset(request, queryset)
+    
+    @admin.action(permissions=['change'], description='Corregir calificaciones seleccionadas')
+    def corregir_calificaciones(self, request, queryset):
+        """Un mismo valor para toda la selección, con un solo UPDATE (ver correcciones.py)"""
+        if not perfiles.es_administrador(request):
+            # Como al eliminar: las compartidas seleccionadas no se corrigen
+            queryset = queryset.filter(usuario=request.user)
+        form = CorreccionForm(request.POST if 'aplicar' in request.POST else None)
+        if form.is_valid():
+            try:
+                log = correcciones.corregir(
+                    queryset,
+                    form.cleaned_data['cambios'],
+                    request.user.pk,
+                    filtro=request.GET.urlencode(),
+                    ip_address=request.META.get('REMOTE_ADDR'),
+                )
+            except ValidationError as exc:
+                form.add_error(None, exc)
+            else:
+                total = log.datos_nuevos['registros'] if log else 0
+                self.message_user(request, f'{total} calificaciones corregidas')
+                return None
+        elif not form.is_bound and not queryset.exists():
+            self.message_user(request, 'No hay calificaciones propias en la selección', messages.WARNING)
+            return None
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Corregir calificaciones',
+            'form': form,
+            'cantidad': queryset.count(),
+            'seleccionadas': request.POST.getlist(ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'action_checkbox_name': ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, 'admin/gestion_tributaria/correccion.html', context)
+    
     def get_queryset(self, request):
-        """Administradores ven todo, corredores solo lo suyo"""
-        qs = super().get_queryset(request)
-        if request.user.is_superuser:
-            return qs
-        if hasattr(request.user, 'perfil') and request.user.perfil.rol == 'ADMIN':
-            return qs
-        return qs.filter(usuario=request.user)
+        """Administradores ven todo; corredores lo suyo y las compartidas del sistema"""
+        # El tsvector solo se usa en la búsqueda, no hace falta leerlo
+        qs = super().get_queryset(request).defer('descripcion_busqueda')
+        return qs.visibles_para(request.user.pk, perfiles.es_administrador(request))
+    
+    def _modificable(self, request, obj):
+        """Propia (o administrador) y de un ejercicio abierto"""
+        return perfiles.puede_modificar(request, obj) and not ejercicios.esta_cerrado(obj.ejercicio)
+    
+    def has_change_permission(self, request, obj=None):
+        if obj is not None and not self._modificable(request, obj):
+            return False
+        return super().has_change_permission(request, obj)
+    
+    def has_delete_permission(self, request, obj=None):
+        if obj is not None and not self._modificable(request, obj):
+            return False
+        return super().has_delete_permission(request, obj)
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Búsqueda con índices y orden por relevancia (ver busqueda.py)"""
+        if not search_term.strip():
+            return queryset, False
+        return busqueda.buscar(queryset, search_term), False
+    
+    def get_changelist(self, request, **kwargs):
+        return BusquedaChangeList
+    
+    # ----- Tablero de resúmenes (vista materializada, ver resumenes.py) -----
+    
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {'mostrar_resumen': perfiles.es_administrador(request), **(extra_context or {})}
+        return super().changelist_view(request, extra_context)
+    
+    def get_urls(self):
+        return [
+            path(
+                'resumen/',
+                self.admin_site.admin_view(self.resumen_view),
+                name='gestion_tributaria_calificaciontributaria_resumen',
+            ),
+        ] + super().get_urls()
+    
+    def resumen_view(self, request):
+        if not perfiles.es_administrador(request):
+            raise PermissionDenied
+        agrupar_por = [
+            dimension for dimension in request.GET.getlist('agrupar') if dimension in resumenes.DIMENSIONES
+        ] or ['ejercicio', 'mercado']
+        filtros = {}
+        if request.GET.get('ejercicio', '').isdigit():
+            filtros['ejercicio'] = int(request.GET['ejercicio'])
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Resumen de calificaciones',
+            'dimensiones': resumenes.DIMENSIONES,
+            'agrupar_por': agrupar_por,
+            'ejercicio': filtros.get('ejercicio', ''),
+            'filas': resumenes.resumen(agrupar_por, **filtros),
+            'actualizado': resumenes.actualizado(),
+            'campos_factor': CAMPOS_FACTOR,
+        }
+        return TemplateResponse(request, 'admin/gestion_tributaria/resumen.html', context)
 
 
 # ============================================
@@ -142,24 +380,99 @@ class CargaMasivaAdmin(admin.ModelAdmin):
     list_display = (
         'nombre_archivo',
         'tipo_carga',
+        'modo',
+        'estado',
         'get_usuario',
         'registros_procesados',
         'registros_exitosos',
         'registros_fallidos',
         'fecha_carga'
     )
-    list_filter = ('tipo_carga', 'fecha_carga')
+    list_filter = ('estado', 'tipo_carga', 'modo', 'fecha_carga')
+    list_select_related = ('usuario__perfil',)
     search_fields = ('nombre_archivo', 'usuario__username')
-    readonly_fields = ('fecha_carga',)
+    readonly_fields = (
+        'nombre_archivo', 'estado', 'worker', 'intentos', 'tamano_lote', 'latido', 'fecha_inicio', 'fecha_fin',
+        'registros_procesados', 'registros_exitosos', 'registros_fallidos',
+        'registros_insertados', 'registros_actualizados', 'registros_sin_cambios',
+        'errores_detalle', 'fecha_carga',
+    )
+    actions = ['reencolar']
+    
+    def get_fields(self, request, obj=None):
+        """Al crear solo se sube el archivo: el worker procesa la carga en segundo plano"""
+        if obj is None:
+            return ('usuario', 'tipo_carga', 'modo', 'archivo')
+        return ('usuario', 'tipo_carga', 'modo', 'archivo') + self.readonly_fields
+    
+    def get_readonly_fields(self, request, obj=None):
+        if obj is None:
+            return ()
+        return ('usuario', 'tipo_carga', 'modo', 'archivo') + self.readonly_fields
+    
+    def get_form(self, request, obj=None, **kwargs):
+        form = super().get_form(request, obj, **kwargs)
+        if obj is None:
+            form.base_fields['archivo'].required = True
+        return form
+    
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.nombre_archivo = os.path.basename(obj.archivo.name)
+            obj.estado = 'PENDIENTE'
+        super().save_model(request, obj, form, change)
     
     def get_usuario(self, obj):
-        return obj.usuario.perfil.nombre_completo if hasattr(obj.usuario, 'perfil') else obj.usuario.username
+        return perfiles.nombre_usuario(obj.usuario)
     get_usuario.short_description = 'Usuario'
+    
+    def get_deleted_objects(self, objs, request):
+        return _sin_ejercicios_cerrados(super().get_deleted_objects(objs, request), cargas=objs)
+    
+    @admin.action(description='Reencolar cargas fallidas')
+    def reencolar(self, request, queryset):
+        total = queryset.filter(estado='FALLIDA').exclude(archivo='').update(estado='PENDIENTE', intentos=0)
+        self.message_user(request, f'{total} cargas reencoladas')
 
 
 # ============================================
 # ADMIN: LOG DE OPERACIONES
 # ============================================
+class PeriodoLogFilter(admin.SimpleListFilter):
+    """
+    Acota el listado a un período reciente (por defecto 3 meses) para que
+    las consultas lean solo las particiones mensuales de esos meses.
+    """
+    title = 'Período'
+    parameter_name = 'periodo'
+    por_defecto = '3'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('1', 'Último mes'),
+            ('3', 'Últimos 3 meses'),
+            ('12', 'Últimos 12 meses'),
+            ('todo', 'Todo el historial'),
+        )
+
+    def value(self):
+        return super().value() or self.por_defecto
+
+    def choices(self, changelist):
+        for valor, titulo in self.lookup_choices:
+            yield {
+                'selected': self.value() == valor,
+                'query_string': changelist.get_query_string({self.parameter_name: valor}),
+                'display': titulo,
+            }
+
+    def queryset(self, request, queryset):
+        if self.value() == 'todo':
+            return queryset
+        meses = int(self.value()) if self.value().isdigit() else int(self.por_defecto)
+        return queryset.filter(fecha_hora__gte=timezone.now() - timedelta(days=31 * meses))
+
+
 @admin.register(LogOperacion)
 class LogOperacionAdmin(admin.ModelAdmin):
     list_display = (
@@ -169,15 +482,20 @@ class LogOperacionAdmin(admin.ModelAdmin):
         'get_calificacion',
         'ip_address'
     )
-    list_filter = ('operacion', 'fecha_hora')
+    list_filter = (PeriodoLogFilter, 'operacion')
+    list_select_related = ('usuario__perfil', 'calificacion')
+    paginator = ConteoEstimadoPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    date_hierarchy = 'fecha_hora'
     search_fields = ('usuario__username', 'calificacion__instrumento')
     readonly_fields = (
-        'usuario', 'calificacion', 'carga_masiva', 'operacion',
-        'datos_anteriores', 'datos_nuevos', 'ip_address', 'fecha_hora'
+        'usuario', 'calificacion', 'calificacion_ref', 'carga_masiva', 'operacion',
+        'datos_anteriores', 'datos_nuevos', 'es_checkpoint', 'ip_address', 'fecha_hora'
     )
     
     def get_usuario(self, obj):
-        return obj.usuario.perfil.nombre_completo if hasattr(obj.usuario, 'perfil') else obj.usuario.username
+        return perfiles.nombre_usuario(obj.usuario)
     get_usuario.short_description = 'Usuario'
     
     def get_calificacion(self, obj):
@@ -191,6 +509,22 @@ class LogOperacionAdmin(admin.ModelAdmin):
         return False
 
 
+# ============================================
+# ADMIN: EJERCICIOS CERRADOS
+# ============================================
+@admin.register(EjercicioCerrado)
+class EjercicioCerradoAdmin(admin.ModelAdmin):
+    """Solo consulta: se cierran y reabren con manage.py cerrar_ejercicio"""
+    list_display = ('ejercicio', 'registros', 'usuario', 'fecha_cierre')
+    readonly_fields = ('ejercicio', 'registros', 'usuario', 'fecha_cierre')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 # ============================================
 # PERSONALIZACIÓN DEL SITIO ADMIN
 # ============================================
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class GestionTributariaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gestion_tributaria'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,352 @@
+"""
+Registro de LogOperacion para calificaciones tributarias.
+
+Los logs guardan solo los campos que cambiaron: en un UPDATE los valores
+anteriores y nuevos de esos campos, y en CREATE / DELETE los campos que
+difieren de los valores por defecto del modelo (VALORES_INICIALES). Así el
+registro sigue siendo completo sin copiar los 30 factores en cada fila.
+
+Los factores se registran como factor_8 ... factor_37 (no como el arreglo
+`factores` del modelo), así un cambio en un factor guarda solo ese factor.
+
+Cada CHECKPOINT_CADA actualizaciones de una calificación, el UPDATE se
+guarda como checkpoint (datos_nuevos con el estado completo), de modo que
+estado_en() reconstruye cualquier estado pasado leyendo a lo más
+CHECKPOINT_CADA logs.
+
+Las cargas masivas acumulan los logs de un lote en un BufferAuditoria y los
+escriben con un solo bulk_create dentro de la misma transacción del lote.
+
+Las correcciones masivas (correcciones.py) escriben un solo log CORRECCION
+sin calificacion_ref: los ids corregidos van como rangos en datos_nuevos y
+los valores anteriores, agrupados por rangos de ids, en datos_anteriores.
+estado_en() los aplica a las calificaciones incluidas en esos rangos.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import chain
+
+from django.db.models import BooleanField, Count, OuterRef, Q, Subquery, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+
+from .formato_dj1948 import CAMPOS_FACTOR, factor_a_escalado, texto_factor
+from .models import CalificacionTributaria, LogOperacion, factores_en_cero
+
+CAMPOS_EXCLUIDOS = {'id', 'created_at', 'updated_at', 'hash_contenido', 'factores', 'descripcion_busqueda'}
+TAMANO_BUFFER = 1000
+CHECKPOINT_CADA = 20
+
+
+def _campos_auditados():
+    return [
+        campo for campo in CalificacionTributaria._meta.concrete_fields
+        if campo.name not in CAMPOS_EXCLUIDOS
+    ]
+
+
+CAMPOS = _campos_auditados()
+# Columnas para .values() que bastan para instantanea_desde_valores()
+CAMPOS_AUDITADOS = [campo.attname for campo in CAMPOS] + ['factores']
+
+
+def _serializar(campo, valor):
+    if isinstance(valor, Decimal):
+        # Misma representación sin importar cómo se escribió el número ('0.5' / '0.50000000')
+        return format(valor.quantize(Decimal(1).scaleb(-campo.decimal_places)), 'f')
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return valor
+
+
+def _serializar_factores(factores):
+    return dict(zip(CAMPOS_FACTOR, map(texto_factor, factores)))
+
+
+def instantanea(objeto):
+    """Estado auditable de una calificación como dict serializable a JSON"""
+    estado = {campo.attname: _serializar(campo, getattr(objeto, campo.attname)) for campo in CAMPOS}
+    estado.update(_serializar_factores(objeto.factores))
+    return estado
+
+
+def instantanea_desde_valores(valores):
+    """Igual que instantanea(), a partir de un dict de .values(*CAMPOS_AUDITADOS)"""
+    estado = {campo.attname: _serializar(campo, valores[campo.attname]) for campo in CAMPOS}
+    estado.update(_serializar_factores(valores['factores']))
+    return estado
+
+
+def instantanea_parcial(valores):
+    """Como instantanea(), solo con los campos de `valores` (factor_N como Decimal)"""
+    estado = {}
+    for campo in CAMPOS:
+        if campo.attname in valores:
+            estado[campo.attname] = _serializar(campo, valores[campo.attname])
+    for campo in CAMPOS_FACTOR:
+        if campo in valores:
+            estado[campo] = texto_factor(factor_a_escalado(valores[campo]))
+    return estado
+
+
+# Estado de una calificación recién creada con los valores por defecto
+VALORES_INICIALES = {campo.attname: _serializar(campo, campo.get_default()) for campo in CAMPOS}
+VALORES_INICIALES.update(_serializar_factores(factores_en_cero()))
+
+
+def diferencias(anterior, nuevo):
+    """(antes, después) con solo los campos que cambiaron entre dos instantáneas"""
+    cambiados = [campo for campo in nuevo if anterior.get(campo) != nuevo[campo]]
+    return (
+        {campo: anterior.get(campo) for campo in cambiados},
+        {campo: nuevo[campo] for campo in cambiados},
+    )
+
+
+def entrada(usuario_id, operacion, calificacion_id=None, anterior=None, nuevo=None,
+            carga_masiva_id=None, ip_address=None):
+    """
+    LogOperacion (sin guardar) para una operación sobre una calificación.
+
+    `anterior` y `nuevo` son instantáneas completas; el log guarda la diferencia.
+    """
+    if operacion == 'CREATE':
+        _, datos_nuevos = diferencias(VALORES_INICIALES, nuevo)
+        datos_anteriores = None
+    elif operacion == 'DELETE':
+        _, datos_anteriores = diferencias(VALORES_INICIALES, anterior)
+        datos_nuevos = None
+    else:
+        datos_anteriores, datos_nuevos = diferencias(anterior, nuevo)
+    return LogOperacion(
+        usuario_id=usuario_id,
+        calificacion_id=calificacion_id,
+        calificacion_ref=calificacion_id,
+        carga_masiva_id=carga_masiva_id,
+        operacion=operacion,
+        datos_anteriores=datos_anteriores,
+        datos_nuevos=datos_nuevos,
+        ip_address=ip_address,
+    )
+
+
+def registrar(usuario_id, operacion, calificacion_id=None, anterior=None, nuevo=None,
+              carga_masiva_id=None, ip_address=None):
+    """Guarda inmediatamente un log (operaciones individuales, p. ej. desde el admin)"""
+    with BufferAuditoria() as buffer:
+        buffer.agregar(usuario_id, operacion, calificacion_id, anterior, nuevo, carga_masiva_id, ip_address)
+    return buffer.escritos[0]
+
+
+def registrar_carga(carga):
+    """Log resumen de una carga masiva (los logs por fila se escriben en cada lote)"""
+    return LogOperacion.objects.create(
+        usuario_id=carga.usuario_id,
+        carga_masiva=carga,
+        operacion='CARGA',
+        datos_nuevos={
+            'nombre_archivo': carga.nombre_archivo,
+            'modo': carga.modo,
+            'estado': carga.estado,
+            'registros_procesados': carga.registros_procesados,
+            'registros_exitosos': carga.registros_exitosos,
+            'registros_fallidos': carga.registros_fallidos,
+            'registros_insertados': carga.registros_insertados,
+            'registros_actualizados': carga.registros_actualizados,
+            'registros_sin_cambios': carga.registros_sin_cambios,
+        },
+    )
+
+
+def registrar_correccion(usuario_id, valores, rangos, anteriores, registros, actualizados,
+                         filtro='', ip_address=None):
+    """
+    Log único de una corrección masiva. `rangos` son los ids seleccionados
+    ([desde, hasta]), `anteriores` los valores previos de cada campo con sus
+    rangos de ids (ver correcciones._valores_anteriores) y `actualizados`
+    las filas que cambiaron.
+    """
+    return LogOperacion.objects.create(
+        usuario_id=usuario_id,
+        operacion='CORRECCION',
+        datos_anteriores=anteriores,
+        datos_nuevos={
+            'cambios': instantanea_parcial(valores),
+            'filtro': filtro,
+            'registros': registros,
+            'actualizados': actualizados,
+            'ids': rangos,
+        },
+        ip_address=ip_address,
+    )
+
+
+class BufferAuditoria:
+    """
+    Acumula logs y los escribe con bulk_create.
+
+    Se vacía al llegar a `tamano` entradas y al salir del bloque `with`, que
+    debe estar dentro de la transacción de los datos auditados para que el
+    log se confirme (o se descarte) junto con ellos. Al vaciar decide con
+    una sola consulta qué UPDATE deben guardarse como checkpoint.
+    """
+
+    def __init__(self, tamano=TAMANO_BUFFER):
+        self.tamano = tamano
+        self.pendientes = []
+        self.escritos = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        if tipo is None:
+            self.vaciar()
+        else:
+            self.pendientes.clear()
+
+    def agregar(self, usuario_id, operacion, calificacion_id=None, anterior=None, nuevo=None,
+                carga_masiva_id=None, ip_address=None):
+        log = entrada(usuario_id, operacion, calificacion_id, anterior, nuevo, carga_masiva_id, ip_address)
+        self.pendientes.append((log, nuevo))
+        if len(self.pendientes) >= self.tamano:
+            self.vaciar()
+
+    def vaciar(self):
+        if not self.pendientes:
+            return
+        self._marcar_checkpoints()
+        logs = [log for log, _ in self.pendientes]
+        LogOperacion.objects.bulk_create(logs, batch_size=self.tamano)
+        self.escritos.extend(logs)
+        self.pendientes = []
+
+    def _marcar_checkpoints(self):
+        refs = {log.calificacion_ref for log, _ in self.pendientes if log.operacion == 'UPDATE'}
+        if not refs:
+            return
+        desde_base = actualizaciones_desde_base(refs)
+        for log, nuevo in self.pendientes:
+            if log.operacion == 'CREATE':
+                desde_base[log.calificacion_ref] = 0
+            elif log.operacion == 'UPDATE':
+                desde_base[log.calificacion_ref] = desde_base.get(log.calificacion_ref, 0) + 1
+                if desde_base[log.calificacion_ref] >= CHECKPOINT_CADA:
+                    log.datos_nuevos = nuevo
+                    log.es_checkpoint = True
+                    desde_base[log.calificacion_ref] = 0
+
+
+# ============================================
+# RECONSTRUCCIÓN DEL HISTORIAL
+# ============================================
+def _es_base():
+    """Logs desde los que se puede reconstruir el estado completo"""
+    return Q(es_checkpoint=True) | Q(operacion='CREATE')
+
+
+def actualizaciones_desde_base(refs):
+    """calificacion_ref -> cantidad de UPDATE desde su último checkpoint o CREATE"""
+    ultima_base = (
+        LogOperacion.objects
+        .filter(_es_base(), calificacion_ref=OuterRef('calificacion_ref'))
+        .order_by('-id')
+        .values('id')[:1]
+    )
+    filas = (
+        LogOperacion.objects
+        .filter(calificacion_ref__in=refs, operacion='UPDATE')
+        .filter(id__gt=Coalesce(Subquery(ultima_base), Value(0)))
+        .order_by()
+        .values('calificacion_ref')
+        .annotate(total=Count('id'))
+    )
+    return {fila['calificacion_ref']: fila['total'] for fila in filas}
+
+
+def estado_en(calificacion_id, momento):
+    """
+    Estado (instantánea) de la calificación en `momento`, o None si en ese
+    momento no existía o ya estaba eliminada.
+
+    Parte del último checkpoint/CREATE anterior a `momento` y aplica las
+    diferencias siguientes. Si no hay uno (historial anterior a la
+    auditoría) o el historial desde él está incompleto, deshace los cambios
+    posteriores sobre el estado actual.
+    """
+    logs = LogOperacion.objects.filter(calificacion_ref=calificacion_id, fecha_hora__lte=momento)
+    base = logs.filter(_es_base()).order_by('-id').values_list('id', flat=True).first()
+    if base is None:
+        return _estado_hacia_atras(calificacion_id, momento)
+
+    campos = ('operacion', 'datos_nuevos', 'es_checkpoint')
+    siguientes = chain(
+        logs.filter(id__gte=base).only(*campos),
+        correcciones_de(calificacion_id).filter(id__gt=base, fecha_hora__lte=momento).only(*campos),
+    )
+    estado = None
+    for log in sorted(siguientes, key=lambda log: log.id):
+        if log.operacion == 'CORRECCION':
+            if estado is not None:
+                estado.update(log.datos_nuevos['cambios'])
+        elif log.es_checkpoint:
+            estado = dict(log.datos_nuevos)
+        elif log.operacion == 'CREATE':
+            estado = {**VALORES_INICIALES, **(log.datos_nuevos or {})}
+        elif log.operacion == 'UPDATE':
+            if estado is None:
+                # UPDATE sin estado desde el cual aplicarlo (historial incompleto,
+                # p. ej. logs archivados): se deshace desde el estado actual
+                return _estado_hacia_atras(calificacion_id, momento)
+            estado.update(log.datos_nuevos or {})
+        elif log.operacion == 'DELETE':
+            estado = None
+    return estado
+
+
+def _estado_hacia_atras(calificacion_id, momento):
+    actual = CalificacionTributaria.objects.filter(pk=calificacion_id).first()
+    estado = instantanea(actual) if actual else None
+    posteriores = chain(
+        LogOperacion.objects
+        .filter(calificacion_ref=calificacion_id, fecha_hora__gt=momento)
+        .only('operacion', 'datos_anteriores'),
+        correcciones_de(calificacion_id).filter(fecha_hora__gt=momento).only('operacion', 'datos_anteriores'),
+    )
+    for log in sorted(posteriores, key=lambda log: log.id, reverse=True):
+        if log.operacion == 'CORRECCION':
+            if estado is not None:
+                estado.update(_anteriores_de(log, calificacion_id))
+        elif log.operacion == 'CREATE':
+            estado = None
+        elif log.operacion == 'DELETE':
+            estado = {**VALORES_INICIALES, **(log.datos_anteriores or {})}
+        elif log.operacion == 'UPDATE' and estado is not None:
+            estado.update(log.datos_anteriores or {})
+    return estado
+
+
+def correcciones_de(calificacion_id):
+    """Logs CORRECCION cuyos rangos de ids incluyen la calificación"""
+    # 'strict': en modo lax el filtro desarma cada par [desde, hasta]
+    incluida = RawSQL(
+        "jsonb_path_exists(datos_nuevos, 'strict $.ids[*] ? (@[0] <= $id && @[1] >= $id)', "
+        "jsonb_build_object('id', %s))",
+        [calificacion_id],
+        output_field=BooleanField(),
+    )
+    return LogOperacion.objects.filter(operacion='CORRECCION').alias(incluida=incluida).filter(incluida=True)
+
+
+def _en_rangos(calificacion_id, rangos):
+    return any(desde <= calificacion_id <= hasta for desde, hasta in rangos)
+
+
+def _anteriores_de(log, calificacion_id):
+    """Valores que tenía la calificación antes de la corrección"""
+    return {
+        campo: valor
+        for campo, grupos in log.datos_anteriores.items()
+        for valor, rangos in grupos
+        if _en_rangos(calificacion_id, rangos)
+    }
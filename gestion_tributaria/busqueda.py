@@ -0,0 +1,43 @@
+"""
+Búsqueda de calificaciones del admin (solo PostgreSQL).
+
+- instrumento: UPPER(instrumento) LIKE '%texto%' (lo que genera icontains),
+  que resuelve el índice GIN de trigramas calificacion_instr_trgm_idx.
+- descripcion: consulta websearch en español sobre descripcion_busqueda,
+  un tsvector generado por PostgreSQL al escribir, con su índice GIN.
+- usuario: usuario_id IN (subconsulta de los usernames que contienen el
+  texto), sobre el índice de usuario_id y sin JOIN; entran todos los
+  usuarios que coinciden.
+
+Cada condición usa su índice y PostgreSQL las combina (BitmapOr) sin
+recorrer la tabla. Los resultados se anotan con `relevancia`: instrumento
+igual al texto, luego instrumento que empieza por el texto, luego el rango
+de la descripción.
+"""
+from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import Case, F, FloatField, Q, Value, When
+
+CONFIGURACION = 'spanish'
+
+
+def buscar(queryset, texto):
+    """Filtra `queryset` por `texto` y anota la relevancia de cada fila"""
+    texto = texto.strip()
+    consulta = SearchQuery(texto, config=CONFIGURACION, search_type='websearch')
+    condicion = (
+        Q(instrumento__icontains=texto)
+        | Q(descripcion_busqueda=consulta)
+        | Q(usuario_id__in=User.objects.filter(username__icontains=texto).values('pk'))
+    )
+    return queryset.filter(condicion).annotate(relevancia=relevancia(texto, consulta))
+
+
+def relevancia(texto, consulta):
+    coincidencia_instrumento = Case(
+        When(instrumento__iexact=texto, then=Value(2.0)),
+        When(instrumento__istartswith=texto, then=Value(1.0)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return coincidencia_instrumento + SearchRank(F('descripcion_busqueda'), consulta)
@@ -0,0 +1,242 @@
+"""
+Caché de lectura de calificaciones por evento (instrumento, fecha_pago,
+secuencia_evento), para procesos que consultan los mismos eventos una y
+otra vez (p. ej. liquidaciones en temporada de dividendos).
+
+Dos niveles, de lectura directa (read-through):
+  1. Un LRU en memoria del proceso, con TTL corto
+     (CALIFICACIONES_CACHE_TTL_LOCAL) y tamaño máximo.
+  2. El caché de Django (CALIFICACIONES_CACHE_TTL), bajo una versión
+     común que forma parte de la clave.
+
+Cualquier escritura de calificaciones (señales en signals.py, cargas
+masivas) cambia la versión y vacía el LRU del proceso que escribe; los LRU
+de otros procesos pueden devolver datos viejos hasta su TTL local.
+Aciertos y fallos se cuentan en memoria y se suman al caché de Django cada
+CONTADORES_CADA consultas o CONTADORES_SEGUNDOS segundos, para verlos con
+`manage.py estadisticas_cache`; eso requiere un caché compartido entre
+procesos (con LocMemCache cada proceso solo vería los suyos).
+
+Las claves del caché llevan un hash del evento: el instrumento puede traer
+espacios o caracteres que memcached no acepta en una clave.
+
+apor_evento() es la versión para vistas async (caché y ORM asíncronos).
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import CalificacionTributaria
+
+CLAVE_VERSION = 'calificaciones:evento:version'
+CLAVE_CONTADOR = 'calificaciones:evento:contador:{}'
+CONTADORES = ('aciertos_locales', 'aciertos_compartidos', 'fallos')
+CONTADORES_CADA = 100
+CONTADORES_SEGUNDOS = 10
+# Backends que no comparten sus datos entre procesos
+CACHES_POR_PROCESO = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+class LRUConTTL:
+    """Diccionario acotado: descarta lo menos usado y lo más antiguo que `ttl` segundos"""
+
+    def __init__(self, maximo, ttl):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            expira, valor = entrada
+            if expira < time.monotonic():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+
+_local = LRUConTTL(settings.CALIFICACIONES_CACHE_MAX_LOCAL, settings.CALIFICACIONES_CACHE_TTL_LOCAL)
+_contadores = dict.fromkeys(CONTADORES, 0)
+_contadores_lock = threading.Lock()
+_ultimo_volcado = time.monotonic()
+
+
+def cache_compartido():
+    """Si el caché de Django lo ven todos los procesos (requisito de estadisticas())"""
+    return settings.CACHES['default']['BACKEND'] not in CACHES_POR_PROCESO
+
+
+def _version():
+    return cache.get_or_set(CLAVE_VERSION, time.time_ns(), None)
+
+
+async def _aversion():
+    return await cache.aget_or_set(CLAVE_VERSION, time.time_ns(), None)
+
+
+def invalidar():
+    """Descarta las entradas de todos los niveles (se llama después de confirmar la escritura)"""
+    cache.set(CLAVE_VERSION, time.time_ns(), None)
+    _local.clear()
+
+
+def _evento(instrumento, fecha_pago, secuencia_evento):
+    texto = json.dumps([instrumento, fecha_pago.isoformat(), secuencia_evento])
+    return hashlib.md5(texto.encode('utf-8')).hexdigest()
+
+
+def _consulta(instrumento, fecha_pago, secuencia_evento):
+    return (
+        CalificacionTributaria.objects
+        .filter(instrumento=instrumento, fecha_pago=fecha_pago, secuencia_evento=secuencia_evento)
+        .defer('descripcion_busqueda')
+        .order_by('id')
+    )
+
+
+def por_evento(instrumento, fecha_pago, secuencia_evento):
+    """
+    Calificaciones de todos los corredores para el evento, ordenadas por id.
+    Quien llama filtra las que el usuario puede ver (ver perfiles.es_visible).
+    """
+    evento = _evento(instrumento, fecha_pago, secuencia_evento)
+    calificaciones = _local.get(evento)
+    if calificaciones is not None:
+        _contar('aciertos_locales')
+        return calificaciones
+
+    clave = f'calificaciones:evento:{_version()}:{evento}'
+    calificaciones = cache.get(clave)
+    if calificaciones is not None:
+        _contar('aciertos_compartidos')
+    else:
+        _contar('fallos')
+        calificaciones = list(_consulta(instrumento, fecha_pago, secuencia_evento))
+        cache.set(clave, calificaciones, settings.CALIFICACIONES_CACHE_TTL)
+    _local.set(evento, calificaciones)
+    return calificaciones
+
+
+async def apor_evento(instrumento, fecha_pago, secuencia_evento):
+    evento = _evento(instrumento, fecha_pago, secuencia_evento)
+    calificaciones = _local.get(evento)
+    if calificaciones is not None:
+        await _acontar('aciertos_locales')
+        return calificaciones
+
+    clave = f'calificaciones:evento:{await _aversion()}:{evento}'
+    calificaciones = await cache.aget(clave)
+    if calificaciones is not None:
+        await _acontar('aciertos_compartidos')
+    else:
+        await _acontar('fallos')
+        calificaciones = [
+            calificacion async for calificacion in _consulta(instrumento, fecha_pago, secuencia_evento)
+        ]
+        await cache.aset(clave, calificaciones, settings.CALIFICACIONES_CACHE_TTL)
+    _local.set(evento, calificaciones)
+    return calificaciones
+
+
+# ============================================
+# CONTADORES
+# ============================================
+def _contar(nombre):
+    pendientes = _contar_local(nombre)
+    if pendientes:
+        _sumar_compartidos(pendientes)
+
+
+async def _acontar(nombre):
+    pendientes = _contar_local(nombre)
+    if pendientes:
+        await sync_to_async(_sumar_compartidos)(pendientes)
+
+
+def _contar_local(nombre):
+    """
+    Cuenta en memoria; cada CONTADORES_CADA consultas o CONTADORES_SEGUNDOS
+    devuelve lo acumulado para sumarlo al caché
+    """
+    global _ultimo_volcado
+    with _contadores_lock:
+        _contadores[nombre] += 1
+        ahora = time.monotonic()
+        if sum(_contadores.values()) < CONTADORES_CADA and ahora - _ultimo_volcado < CONTADORES_SEGUNDOS:
+            return None
+        _ultimo_volcado = ahora
+        pendientes = dict(_contadores)
+        for contador in CONTADORES:
+            _contadores[contador] = 0
+    return pendientes
+
+
+def _sumar_compartidos(pendientes):
+    for nombre, cantidad in pendientes.items():
+        if not cantidad:
+            continue
+        clave = CLAVE_CONTADOR.format(nombre)
+        cache.add(clave, 0, None)
+        try:
+            cache.incr(clave, cantidad)
+        except ValueError:
+            # La clave expiró o fue desalojada entre add() e incr()
+            cache.set(clave, cantidad, None)
+
+
+def volcar_contadores():
+    """Suma al caché de Django lo contado en este proceso que aún no se sumó"""
+    global _ultimo_volcado
+    with _contadores_lock:
+        _ultimo_volcado = time.monotonic()
+        pendientes = dict(_contadores)
+        for contador in CONTADORES:
+            _contadores[contador] = 0
+    _sumar_compartidos(pendientes)
+
+
+def estadisticas():
+    """
+    Totales de todos los procesos (ya volcados) y el tamaño del LRU de este
+    proceso. Solo suman los demás procesos con un caché compartido.
+    """
+    totales = {nombre: cache.get(CLAVE_CONTADOR.format(nombre), 0) for nombre in CONTADORES}
+    consultas = sum(totales.values())
+    aciertos = totales['aciertos_locales'] + totales['aciertos_compartidos']
+    return {
+        **totales,
+        'consultas': consultas,
+        'tasa_aciertos': aciertos / consultas if consultas else None,
+        'entradas_locales': len(_local),
+    }
+
+
+def reiniciar_estadisticas():
+    cache.delete_many([CLAVE_CONTADOR.format(nombre) for nombre in CONTADORES])
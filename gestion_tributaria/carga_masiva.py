@@ -0,0 +1,326 @@
+"""
+Motor de carga masiva de archivos DJ1948.
+
+El archivo se recorre como un flujo y se procesa en lotes de tamaño fijo:
+cada lote se convierte, se valida y se inserta con bulk_create dentro de su
+propia transacción, junto con la actualización de los contadores de la
+CargaMasiva. Así la memoria usada es la de un lote, no la del archivo.
+
+En modo UPSERT las filas se identifican por la clave natural de la
+calificación: las nuevas se insertan, las que cambiaron se actualizan con
+INSERT ... ON CONFLICT DO UPDATE y las que traen el mismo hash de contenido
+no se escriben. Los lotes de un mismo usuario se escriben de a uno
+(bloqueo consultivo), así dos cargas simultáneas no se cruzan entre la
+lectura de las existentes y la escritura.
+
+Los factores no se validan en Python antes de escribir: sus límites y la
+suma 8-16 son restricciones CHECK de la tabla. Solo si la base rechaza un
+lote se validan sus factores para identificar las filas inválidas, que
+quedan como errores con los mensajes de siempre (ver _escribir).
+
+Los CSV en disco se leen con mmap y los factores se convierten a enteros
+escalados sin pasar por Decimal (lectura_mmap.py); los grandes se pueden
+convertir y validar en varios procesos (carga_paralela.py). La escritura
+sigue siendo por lotes en este proceso.
+"""
+from itertools import islice
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, TextField, Value
+from django.db.models.functions import Coalesce, Concat, Now
+
+from . import (
+    auditoria,
+    cache_calificaciones,
+    carga_paralela,
+    conversion,
+    ejercicios,
+    facetas,
+    formato_dj1948,
+    lectura_mmap,
+    validacion,
+)
+from .formato_dj1948 import ErrorFila
+from .models import CLAVE_NATURAL, COLUMNAS_CONTENIDO, CalificacionTributaria, CargaMasiva, restriccion_violada
+
+TAMANO_LOTE = 1000
+MAX_ERRORES_DETALLE = 1000
+# Primer argumento de pg_advisory_xact_lock(espacio, usuario) en las cargas (ver _bloquear_claves)
+ESPACIO_BLOQUEO = 1948
+
+CAMPOS_CLAVE = [f'{campo}_id' if campo == 'usuario' else campo for campo in CLAVE_NATURAL]
+CAMPOS_ACTUALIZADOS = COLUMNAS_CONTENIDO + ['carga_masiva', 'origen', 'hash_contenido', 'updated_at']
+
+
+class CargaInterrumpida(Exception):
+    """Otro worker tomó la carga (este se consideró caído): se descarta el lote"""
+
+
+def procesar_carga(carga, archivo, tamano_lote=TAMANO_LOTE, worker=None, procesos=1):
+    """
+    Carga las filas de `archivo` como calificaciones de `carga`.
+
+    Las filas inválidas no detienen la carga: se cuentan como fallidas y se
+    registran en `errores_detalle` (hasta MAX_ERRORES_DETALLE líneas).
+
+    Retoma desde `carga.registros_procesados`: como el contador se actualiza
+    en la misma transacción que cada lote, una carga interrumpida continúa
+    después del último lote confirmado. Si se indica `worker`, cada lote solo
+    se confirma mientras la carga siga asignada a ese worker.
+
+    Con `procesos` > 1 y un CSV grande en disco, la conversión y validación
+    se reparte entre procesos (carga_paralela); el resultado es el mismo.
+    """
+    errores_registrados = len((carga.errores_detalle or '').splitlines())
+
+    try:
+        if carga_paralela.aplicable(archivo, carga.nombre_archivo, procesos):
+            convertidas = carga_paralela.convertir_archivo(
+                archivo, carga.tipo_carga, procesos, tamano_lote, saltar=carga.registros_procesados,
+            )
+        elif lectura_mmap.aplicable(archivo, carga.nombre_archivo):
+            filas = lectura_mmap.leer_filas(archivo, carga.tipo_carga)
+            filas = islice(filas, carga.registros_procesados, None)
+            convertidas = conversion.convertir_en_lotes(
+                filas, carga.tipo_carga, tamano_lote, lectura_mmap.convertir_lote,
+            )
+        else:
+            filas = formato_dj1948.leer_filas(archivo, carga.nombre_archivo, carga.tipo_carga)
+            filas = islice(filas, carga.registros_procesados, None)
+            convertidas = conversion.convertir_en_lotes(filas, carga.tipo_carga, tamano_lote)
+
+        # Si la base ya rechazó filas de este archivo, los lotes siguientes
+        # validan los factores antes de escribir (evita reintentos por lote)
+        validar_factores = False
+        cerrados = ejercicios.cerrados()
+        for lote in conversion.en_lotes(convertidas, tamano_lote):
+            objetos, errores = _objetos(carga, lote, cerrados)
+
+            with transaction.atomic():
+                resultado, errores_escritura, rechazadas = _guardar_lote(carga, objetos, validar_factores)
+                validar_factores = validar_factores or rechazadas
+                errores = _ordenar_errores(errores + errores_escritura)
+                detalle = errores[:max(MAX_ERRORES_DETALLE - errores_registrados, 0)]
+                errores_registrados += len(detalle)
+                _actualizar_contadores(
+                    carga,
+                    detalle,
+                    worker=worker,
+                    registros_procesados=len(lote),
+                    registros_exitosos=sum(resultado.values()),
+                    registros_fallidos=len(errores),
+                    **resultado
+                )
+    except ErrorFila as exc:
+        _actualizar_contadores(carga, [f'Archivo: {exc}'], worker=worker)
+        raise
+
+    carga.refresh_from_db()
+    return carga
+
+
+def _objetos(carga, lote, cerrados=frozenset()):
+    """
+    Calificaciones de las filas convertidas del lote, y los errores de las
+    demás (incluidas las de ejercicios cerrados, que son de solo lectura)
+    """
+    objetos = []
+    errores = []
+    for numero, valores, hash_fila, error in lote:
+        if error is None and valores['ejercicio'] in cerrados:
+            error = ejercicios.mensaje_cerrado(valores['ejercicio'])
+        if error is not None:
+            errores.append((numero, error))
+            continue
+        objeto = CalificacionTributaria(
+            usuario_id=carga.usuario_id,
+            carga_masiva=carga,
+            origen='MASIVO',
+            hash_contenido=hash_fila,
+            **valores
+        )
+        objetos.append((numero, objeto))
+    return objetos, errores
+
+
+def _guardar_lote(carga, objetos, validar_factores=False):
+    """
+    Escribe el lote según el modo de la carga.
+
+    Devuelve los contadores (insertados / actualizados / sin cambios), los
+    errores de filas repetidas, con factores inválidos o, en modo INSERTAR,
+    ya existentes, y si hubo filas con factores inválidos. Con
+    validar_factores esas filas se descartan antes de escribir; si no, las
+    rechaza la base (ver _escribir). Los logs de cada fila escrita se
+    guardan con un solo bulk_create.
+    """
+    resultado = {
+        'registros_insertados': 0,
+        'registros_actualizados': 0,
+        'registros_sin_cambios': 0,
+    }
+    errores = []
+
+    # Una misma clave solo puede escribirse una vez por sentencia: gana la última fila
+    por_clave = {}
+    for numero, objeto in objetos:
+        clave = _clave(objeto)
+        if clave in por_clave:
+            errores.append((por_clave[clave][0], f'clave repetida en el archivo (se usa la fila {numero})'))
+        por_clave[clave] = (numero, objeto)
+
+    _bloquear_claves(carga.usuario_id)
+    existentes = _existentes(carga.usuario_id, [objeto for _, objeto in por_clave.values()])
+    insertar = []
+    actualizar = []
+    for clave, (numero, objeto) in por_clave.items():
+        if clave not in existentes:
+            insertar.append((numero, objeto))
+        elif carga.modo != 'UPSERT':
+            errores.append((numero, 'la calificación ya existe (use el modo UPSERT para actualizarla)'))
+        elif existentes[clave][1] == objeto.hash_contenido:
+            resultado['registros_sin_cambios'] += 1
+        else:
+            actualizar.append((numero, existentes[clave][0], objeto))
+
+    escribir = insertar + [(numero, objeto) for numero, _, objeto in actualizar]
+    rechazadas = _invalidas(escribir) if validar_factores else {}
+    # Antes de escribir: después ya tendrían los valores nuevos y el log quedaría vacío
+    anteriores = _instantaneas(pk for numero, pk, _ in actualizar if numero not in rechazadas)
+    rechazadas.update(_escribir(carga, [fila for fila in escribir if fila[0] not in rechazadas]))
+    if rechazadas:
+        errores.extend(rechazadas.items())
+        insertar = [(numero, objeto) for numero, objeto in insertar if numero not in rechazadas]
+        actualizar = [fila for fila in actualizar if fila[0] not in rechazadas]
+    resultado['registros_insertados'] = len(insertar)
+    resultado['registros_actualizados'] = len(actualizar)
+    if insertar or actualizar:
+        # bulk_create no envía post_save: invalidar los cachés al confirmar el lote
+        transaction.on_commit(facetas.invalidar)
+        transaction.on_commit(cache_calificaciones.invalidar)
+
+    with auditoria.BufferAuditoria() as buffer:
+        for _, objeto in insertar:
+            buffer.agregar(
+                carga.usuario_id, 'CREATE', objeto.pk,
+                nuevo=auditoria.instantanea(objeto), carga_masiva_id=carga.pk,
+            )
+        for _, pk, objeto in actualizar:
+            buffer.agregar(
+                carga.usuario_id, 'UPDATE', pk,
+                anterior=anteriores[pk], nuevo=auditoria.instantanea(objeto), carga_masiva_id=carga.pk,
+            )
+    return resultado, errores, bool(rechazadas)
+
+
+def _escribir(carga, filas):
+    """
+    Escribe las calificaciones de `filas` (numero, objeto) con un solo
+    bulk_create (UPSERT por la clave natural en ese modo).
+
+    Si la base rechaza la sentencia por una restricción CHECK de los
+    factores (cada intento va en su savepoint), recién entonces se validan
+    los factores del grupo en Python y se reintenta sin las filas inválidas.
+    Si aun así se rechaza, el grupo se divide en mitades hasta aislar las
+    filas que violan la restricción. Devuelve numero de fila -> mensaje de
+    error de las filas rechazadas; las demás quedan escritas.
+    """
+    if not filas:
+        return {}
+    try:
+        with transaction.atomic():
+            _bulk_create(carga, [objeto for _, objeto in filas])
+    except IntegrityError as exc:
+        restriccion = restriccion_violada(exc)
+        if restriccion is None:
+            raise
+        rechazadas = _invalidas(filas)
+        if rechazadas:
+            return {**rechazadas, **_escribir(carga, [fila for fila in filas if fila[0] not in rechazadas])}
+        if len(filas) == 1:
+            return {filas[0][0]: f'no cumple la restricción {restriccion}'}
+        mitad = len(filas) // 2
+        return {**_escribir(carga, filas[:mitad]), **_escribir(carga, filas[mitad:])}
+    return {}
+
+
+def _bulk_create(carga, objetos):
+    if carga.modo == 'UPSERT':
+        CalificacionTributaria.objects.bulk_create(
+            objetos,
+            update_conflicts=True,
+            unique_fields=CLAVE_NATURAL,
+            update_fields=CAMPOS_ACTUALIZADOS,
+        )
+    else:
+        CalificacionTributaria.objects.bulk_create(objetos)
+
+
+def _invalidas(filas):
+    """numero -> mensaje de las filas cuyos factores no pasan la validación en Python (mismos mensajes)"""
+    errores = validacion.validar_lote(validacion.lote_desde_instancias([objeto for _, objeto in filas]))
+    return {
+        numero: conversion.mensaje_validacion(validacion.a_validation_error(errores_fila))
+        for (numero, _), errores_fila in zip(filas, errores)
+        if errores_fila
+    }
+
+
+def _clave(objeto):
+    return tuple(getattr(objeto, campo) for campo in CAMPOS_CLAVE)
+
+
+def _bloquear_claves(usuario_id):
+    """
+    Bloqueo consultivo del usuario hasta el fin de la transacción del lote.
+    La clave natural incluye al usuario: así dos cargas suyas con las mismas
+    claves no leen las existentes a la vez, y cada fila se clasifica como
+    insertada, actualizada o sin cambios según lo que de verdad escribe.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [ESPACIO_BLOQUEO, usuario_id])
+
+
+def _existentes(usuario_id, objetos):
+    """Clave natural -> (pk, hash_contenido) de las calificaciones ya guardadas del lote"""
+    if not objetos:
+        return {}
+    candidatas = CalificacionTributaria.objects.filter(
+        usuario_id=usuario_id,
+        ejercicio__in={objeto.ejercicio for objeto in objetos},
+        instrumento__in={objeto.instrumento for objeto in objetos},
+    ).values_list(*CAMPOS_CLAVE, 'pk', 'hash_contenido')
+    claves = {_clave(objeto) for objeto in objetos}
+    return {
+        tuple(fila[:-2]): fila[-2:]
+        for fila in candidatas.iterator()
+        if tuple(fila[:-2]) in claves
+    }
+
+
+def _instantaneas(pks):
+    """Estado auditable antes de actualizar, para registrar solo lo que cambia"""
+    valores = CalificacionTributaria.objects.filter(pk__in=list(pks)).values('pk', *auditoria.CAMPOS_AUDITADOS)
+    return {fila['pk']: auditoria.instantanea_desde_valores(fila) for fila in valores}
+
+
+def _ordenar_errores(errores):
+    return [f'Fila {numero}: {mensaje}' for numero, mensaje in sorted(errores)]
+
+
+def _actualizar_contadores(carga, detalle, worker=None, **incrementos):
+    """Suma los contadores del lote en la base de datos (sin leer la fila antes)"""
+    cambios = {campo: F(campo) + valor for campo, valor in incrementos.items()}
+    cambios['latido'] = Now()
+    if detalle:
+        cambios['errores_detalle'] = Concat(
+            Coalesce(F('errores_detalle'), Value(''), output_field=TextField()),
+            Value(''.join(f'{linea}\n' for linea in detalle)),
+            output_field=TextField(),
+        )
+    cargas = CargaMasiva.objects.filter(pk=carga.pk)
+    if worker is not None:
+        cargas = cargas.filter(worker=worker)
+    if not cargas.update(**cambios):
+        raise CargaInterrumpida(f'La carga {carga.pk} ya no está asignada a {worker}')
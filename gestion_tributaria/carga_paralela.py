@@ -0,0 +1,201 @@
+"""
+Conversión en paralelo de CSV DJ1948 grandes.
+
+El archivo se divide en fragmentos por rangos de bytes que terminan en un
+fin de registro, tal como separa los registros lectura_mmap (ver
+limites_fragmentos). Cada fragmento se lee con lectura_mmap, se convierte y
+se valida en un proceso del ProcessPoolExecutor, que devuelve solo datos
+simples (valores, hash de contenido o mensaje de error).
+
+Los resultados se consumen en el orden de los fragmentos y la numeración
+de filas se recalcula con la cantidad de registros de los fragmentos
+anteriores, así que el resultado (contadores y errores_detalle) es el mismo
+que el de la lectura secuencial. La escritura no se reparte: la hace un solo
+proceso por lotes (carga_masiva._guardar_lote), que mantiene el UPSERT por
+clave natural, la deduplicación y la auditoría de cada lote.
+"""
+import mmap
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import django
+from django.conf import settings
+
+from . import conversion, formato_dj1948, lectura_mmap
+
+TAMANO_FRAGMENTO = 8 * 1024 * 1024
+# Fragmentos en curso por proceso: acota la memoria si la escritura va más lenta
+FRAGMENTOS_POR_PROCESO = 2
+EXTENSIONES_CSV = ('.csv', '.txt')
+
+
+def procesos_lectura():
+    """Procesos configurados para la conversión (0: uno por CPU)"""
+    return settings.CARGA_MASIVA_PROCESOS_LECTURA or os.cpu_count() or 1
+
+
+def aplicable(archivo, nombre_archivo, procesos):
+    """Solo los CSV en disco que superan CARGA_MASIVA_PARALELO_DESDE_MB se reparten"""
+    if procesos <= 1 or not isinstance(archivo, (str, Path)):
+        return False
+    if Path(nombre_archivo).suffix.lower() not in EXTENSIONES_CSV:
+        return False
+    return os.path.getsize(archivo) >= settings.CARGA_MASIVA_PARALELO_DESDE_MB * 1024 * 1024
+
+
+# ============================================
+# FRAGMENTOS
+# ============================================
+def limites_fragmentos(ruta, inicio, tamano_fragmento=TAMANO_FRAGMENTO, delimitador=';', encoding='utf-8'):
+    """
+    Posiciones (en bytes) donde empieza cada fragmento, más el fin del
+    archivo. `inicio` es la posición después de la cabecera.
+
+    Cada corte es el primer fin de registro después del tamaño pedido, con
+    el mismo criterio de lectura_mmap.leer_registros: una línea sin comillas
+    es un registro y una con comillas empieza un registro cuyo fin decide
+    csv (una comilla suelta dentro de un campo no abre un campo entre
+    comillas). Solo los registros con comillas se recorren en Python; entre
+    ellos basta buscar saltos de línea.
+    """
+    total = os.path.getsize(ruta)
+    limites = [inicio]
+    if total <= inicio:
+        return limites
+    with open(ruta, 'rb') as archivo, mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+        # `registro`: inicio de un registro ya conocido, antes de `objetivo`
+        registro = inicio
+        objetivo = inicio + tamano_fragmento
+        while objetivo < total:
+            salto = mapa.find(b'\n', objetivo)
+            corte = total if salto == -1 else salto + 1
+            comilla = mapa.find(b'"', registro, corte)
+            if comilla != -1:
+                salto = mapa.rfind(b'\n', registro, comilla)
+                registro = lectura_mmap.fin_de_registro(
+                    mapa, registro if salto == -1 else salto + 1, total, delimitador, encoding,
+                )
+                if registro < objetivo:
+                    continue
+                corte = registro
+            limites.append(corte)
+            registro = corte
+            objetivo = corte + tamano_fragmento
+    if limites[-1] < total:
+        limites.append(total)
+    return limites
+
+
+def contar_fragmento(ruta, inicio, fin, columnas, delimitador, tipo_carga, encoding):
+    """Registros (incluidos los vacíos) y filas con datos del fragmento, sin convertirlas"""
+    registros = filas = 0
+    with open(ruta, 'rb') as archivo, mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+        for indice, fila in lectura_mmap.leer_registros(mapa, inicio, fin, columnas, delimitador, tipo_carga, encoding):
+            registros = indice + 1
+            filas += fila is not None
+    return registros, filas
+
+
+def convertir_fragmento(ruta, inicio, fin, columnas, delimitador, tipo_carga, encoding, tamano_lote):
+    """
+    Convierte y valida los registros entre `inicio` y `fin` (lectura_mmap).
+
+    Devuelve la cantidad de registros leídos (incluidas las filas vacías,
+    que cuentan para la numeración) y las filas convertidas por
+    conversion.convertir_lote, numeradas desde 0 dentro del fragmento.
+    """
+    registros = 0
+    filas = []
+    convertidas = []
+    with open(ruta, 'rb') as archivo, mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+        for indice, fila in lectura_mmap.leer_registros(mapa, inicio, fin, columnas, delimitador, tipo_carga, encoding):
+            registros = indice + 1
+            if fila is None:
+                continue
+            filas.append((indice, fila))
+            if len(filas) >= tamano_lote:
+                convertidas.extend(_convertir(filas, tipo_carga, encoding))
+                filas = []
+    if filas:
+        convertidas.extend(_convertir(filas, tipo_carga, encoding))
+    return registros, convertidas
+
+
+def _convertir(filas, tipo_carga, encoding):
+    return conversion.validar_convertidas(lectura_mmap.convertir_lote(filas, tipo_carga, encoding))
+
+
+# ============================================
+# PROCESOS
+# ============================================
+def convertir_archivo(ruta, tipo_carga, procesos, tamano_lote, encoding='utf-8-sig', saltar=0):
+    """
+    Genera las filas convertidas (numero, valores, hash, error) del CSV en
+    el orden del archivo, igual que la lectura secuencial, omitiendo las
+    primeras `saltar` filas con datos (una carga que se retoma).
+
+    Si la cabecera no trae las columnas obligatorias se lanza ErrorFila al
+    iniciar la lectura.
+    """
+    with open(ruta, 'rb') as archivo:
+        cabecera = archivo.readline()
+    columnas, delimitador = formato_dj1948.cabecera_csv(cabecera.decode(encoding), tipo_carga)
+    encoding_datos = lectura_mmap.encoding_datos(encoding)
+
+    limites = limites_fragmentos(ruta, len(cabecera), TAMANO_FRAGMENTO, delimitador, encoding_datos)
+    fragmentos = deque(zip(limites, limites[1:]))
+    argumentos = (columnas, delimitador, tipo_carga, encoding_datos)
+    ejecutor = ProcessPoolExecutor(
+        max_workers=min(procesos, len(fragmentos)) or 1,
+        # 'spawn': los procesos no heredan la conexión a la base; parten sin Django
+        # inicializado y el inicializador no puede venir de un módulo con modelos
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    )
+    try:
+        numero, omitir = 2, 0
+        if saltar:
+            numero, omitir = _saltar_fragmentos(ejecutor, procesos, str(ruta), fragmentos, argumentos, saltar)
+        en_curso = deque()
+        while fragmentos or en_curso:
+            while fragmentos and len(en_curso) < procesos * FRAGMENTOS_POR_PROCESO:
+                inicio, fin = fragmentos.popleft()
+                en_curso.append(ejecutor.submit(
+                    convertir_fragmento, str(ruta), inicio, fin, *argumentos, tamano_lote,
+                ))
+            registros, convertidas = en_curso.popleft().result()
+            for local, valores, hash_fila, error in convertidas[omitir:]:
+                yield numero + local, valores, hash_fila, error
+            numero += registros
+            omitir = 0
+    finally:
+        ejecutor.shutdown(cancel_futures=True)
+
+
+def _saltar_fragmentos(ejecutor, procesos, ruta, fragmentos, argumentos, saltar):
+    """
+    Quita de `fragmentos` los que solo tienen filas ya cargadas, contándolas
+    en los procesos sin convertirlas. Devuelve el número de fila del primer
+    registro restante y cuántas filas con datos del primer fragmento
+    restante también estaban cargadas.
+    """
+    numero = 2
+    en_curso = deque()
+    while fragmentos or en_curso:
+        while fragmentos and len(en_curso) < procesos * FRAGMENTOS_POR_PROCESO:
+            limites = fragmentos.popleft()
+            en_curso.append((limites, ejecutor.submit(contar_fragmento, ruta, *limites, *argumentos)))
+        limites, futuro = en_curso.popleft()
+        registros, filas = futuro.result()
+        if filas > saltar:
+            # Desde aquí se convierte: los que ya se estaban contando vuelven a la cola
+            for _, siguiente in en_curso:
+                siguiente.cancel()
+            fragmentos.extendleft(reversed([limites, *(pendiente for pendiente, _ in en_curso)]))
+            return numero, saltar
+        saltar -= filas
+        numero += registros
+    return numero, 0
@@ -0,0 +1,80 @@
+"""
+Conversión y validación por lotes de las filas de una carga masiva.
+
+La usan la lectura secuencial (carga_masiva) y los procesos de la lectura
+en paralelo (carga_paralela): las funciones devuelven solo datos simples
+(valores, hash de contenido o mensaje de error), que se pueden enviar de
+un proceso a otro.
+"""
+from itertools import islice
+
+from . import formato_dj1948, validacion
+from .formato_dj1948 import CAMPOS_FACTOR, COLUMNAS_BASE, ErrorFila, factor_a_escalado
+from .models import hash_valores
+
+
+def en_lotes(filas, tamano_lote):
+    while True:
+        lote = list(islice(filas, tamano_lote))
+        if not lote:
+            return
+        yield lote
+
+
+def convertir_en_lotes(filas, tipo_carga, tamano_lote, convertir=None):
+    convertir = convertir or _convertir_filas
+    for lote in en_lotes(filas, tamano_lote):
+        yield from validar_convertidas(convertir(lote, tipo_carga))
+
+
+def _convertir_filas(lote, tipo_carga):
+    """Filas (numero, dict) del archivo -> (numero, valores, error)"""
+    convertidas = []
+    for numero, fila in lote:
+        try:
+            datos = formato_dj1948.convertir_fila(fila, tipo_carga)
+        except ErrorFila as exc:
+            convertidas.append((numero, None, str(exc)))
+            continue
+        valores = {campo: datos[campo] for campo in COLUMNAS_BASE}
+        valores['factores'] = [factor_a_escalado(datos[campo]) for campo in CAMPOS_FACTOR]
+        convertidas.append((numero, valores, None))
+    return convertidas
+
+
+def convertir_lote(lote, tipo_carga):
+    """Convierte y valida las filas (numero, dict) del lote (ver validar_convertidas)"""
+    return validar_convertidas(_convertir_filas(lote, tipo_carga))
+
+
+def validar_convertidas(convertidas):
+    """
+    Valida juntas, en forma columnar, las filas convertidas (numero,
+    valores, error) del lote. Los factores los revisa la base al escribir.
+
+    Devuelve, en el mismo orden, tuplas (numero, valores, hash, error): los
+    valores del modelo (con `factores` escalado) y su hash de contenido, o
+    el mensaje de error de la fila.
+    """
+    validas = [valores for _, valores, error in convertidas if error is None]
+    lote = validacion.lote_desde_valores(validas, factores=False)
+    errores = iter(validacion.validar_lote(lote, factores=False))
+    resultado = []
+    for numero, valores, error in convertidas:
+        if error is None:
+            errores_fila = next(errores)
+            if errores_fila:
+                valores, error = None, mensaje_validacion(validacion.a_validation_error(errores_fila))
+        resultado.append((numero, valores, None if error else hash_valores(valores), error))
+    return resultado
+
+
+def mensaje_validacion(exc):
+    """ValidationError -> una línea de errores_detalle ('campo: mensaje; ...')"""
+    if not hasattr(exc, 'error_dict'):
+        return '; '.join(exc.messages)
+    partes = []
+    for campo, errores in exc.message_dict.items():
+        prefijo = '' if campo == '__all__' else f'{campo}: '
+        partes.extend(f'{prefijo}{mensaje}' for mensaje in errores)
+    return '; '.join(partes)
@@ -0,0 +1,283 @@
+"""
+Correcciones masivas de calificaciones.
+
+Las correcciones de la bolsa suelen aplicarse a todos los eventos de un
+instrumento o a un ejercicio / mercado completo, con los mismos valores
+(p. ej. reexpresar factor_actualizacion o dejar un factor en cero).
+corregir() las aplica sobre el conjunto, sin instanciar ni guardar fila
+por fila:
+
+  1. Los ids del queryset se copian a una tabla temporal (correccion_ids).
+  2. Un solo UPDATE ... FROM correccion_ids cambia los campos y recalcula
+     hash_contenido en SQL (mismo texto que models.hash_valores).
+  3. Las restricciones CHECK de `factores` (models._restricciones_factores)
+     revisan la suma 8-16 de cada fila: si alguna la rompe no se cambia
+     nada y se informa la primera calificación que la rompería.
+  4. Se escribe un único LogOperacion CORRECCION (auditoria.registrar_correccion)
+     con los valores nuevos, los ids como rangos y los valores anteriores
+     agrupados por rangos de ids, de modo que estado_en() sigue pudiendo
+     reconstruir cada calificación.
+
+Si la selección incluye calificaciones de ejercicios cerrados (particiones
+de solo lectura, ver ejercicios.py) se rechaza completa.
+
+La vista materializada de resúmenes no se refresca aquí (igual que en las
+cargas masivas): se actualiza con `manage.py refrescar_resumenes`.
+"""
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+
+from . import auditoria, cache_calificaciones, ejercicios, facetas, validacion
+from .formato_dj1948 import CAMPOS_FACTOR, COLUMNAS_BASE, ESCALA_FACTOR, factor_a_escalado
+from .models import (
+    CLAVE_NATURAL,
+    DEFINICION_FACTOR,
+    CalificacionTributaria,
+    _texto_factor_hash,
+    _texto_hash,
+    restriccion_violada,
+)
+
+CAMPOS_CORREGIBLES = [campo for campo in COLUMNAS_BASE if campo not in CLAVE_NATURAL] + CAMPOS_FACTOR
+TABLA_IDS = 'correccion_ids'
+
+
+def _campo_modelo(campo):
+    if campo in CAMPOS_FACTOR:
+        return DEFINICION_FACTOR
+    return CalificacionTributaria._meta.get_field(campo)
+
+
+def limpiar_cambios(cambios):
+    """
+    Valida los valores (campo -> valor) con los campos del modelo.
+
+    Devuelve los valores convertidos (los factores como Decimal) o lanza
+    ValidationError con los errores por campo.
+    """
+    errores = {}
+    limpios = {}
+    for campo, valor in cambios.items():
+        if campo not in CAMPOS_CORREGIBLES:
+            errores[campo] = ['No es un campo corregible']
+            continue
+        try:
+            limpios[campo] = _campo_modelo(campo).clean(valor, None)
+        except ValidationError as exc:
+            errores[campo] = exc.messages
+    if errores:
+        raise ValidationError(errores)
+    if not limpios:
+        raise ValidationError('No se indicó ningún cambio')
+    return limpios
+
+
+def corregir(queryset, cambios, usuario_id, filtro='', ip_address=None):
+    """
+    Aplica `cambios` (campo -> valor) a todas las calificaciones de `queryset`.
+
+    Devuelve el LogOperacion de la corrección, o None si el queryset no
+    tenía filas. Lanza ValidationError si algún valor no es válido o si
+    alguna calificación quedaría con la suma de los factores 8-16 sobre 1
+    o es de un ejercicio cerrado; en ese caso no se modifica ninguna fila.
+    `filtro` describe la selección en el log.
+    """
+    valores = limpiar_cambios(cambios)
+    ejercicios.rechazar_cerrados(queryset)
+    with transaction.atomic(), connection.cursor() as cursor:
+        registros = _copiar_ids(cursor, queryset)
+        if not registros:
+            _borrar_ids(cursor)
+            return None
+        rangos = _rangos_ids(cursor)
+        anteriores = _valores_anteriores(cursor, valores)
+        try:
+            with transaction.atomic():
+                actualizados = _actualizar(cursor, valores)
+        except IntegrityError as exc:
+            restriccion = restriccion_violada(exc)
+            if restriccion is None:
+                raise
+            raise ValidationError(_mensaje_rechazo(cursor, valores, restriccion), code=restriccion) from exc
+        _borrar_ids(cursor)
+
+        log = auditoria.registrar_correccion(
+            usuario_id, valores, rangos, anteriores, registros, actualizados,
+            filtro=filtro, ip_address=ip_address,
+        )
+        # El UPDATE no envía post_save: invalidar los cachés al confirmar
+        transaction.on_commit(facetas.invalidar)
+        transaction.on_commit(cache_calificaciones.invalidar)
+    return log
+
+
+# ============================================
+# SQL
+# ============================================
+def _copiar_ids(cursor, queryset):
+    """Ids del queryset en la tabla temporal (se descarta al confirmar)"""
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    cursor.execute(f'DROP TABLE IF EXISTS {TABLA_IDS}')
+    cursor.execute(f'CREATE TEMPORARY TABLE {TABLA_IDS} (id bigint PRIMARY KEY) ON COMMIT DROP')
+    cursor.execute(f'INSERT INTO {TABLA_IDS} {sql}', params)
+    registros = cursor.rowcount
+    cursor.execute(f'ANALYZE {TABLA_IDS}')
+    return registros
+
+
+def _borrar_ids(cursor):
+    cursor.execute(f'DROP TABLE {TABLA_IDS}')
+
+
+def _rangos_ids(cursor):
+    """Ids corregidos como rangos [desde, hasta] de ids consecutivos"""
+    cursor.execute(f"""
+        SELECT json_agg(json_build_array(desde, hasta) ORDER BY desde) FROM (
+            SELECT min(id) AS desde, max(id) AS hasta
+            FROM (SELECT id, id - row_number() OVER (ORDER BY id) AS grupo FROM {TABLA_IDS}) AS ids
+            GROUP BY grupo
+        ) AS rangos
+    """)
+    return cursor.fetchone()[0]
+
+
+def _valores_anteriores(cursor, valores):
+    """
+    Campo -> [[valor anterior, rangos de ids], ...]: los valores con el
+    formato de auditoria.instantanea y los ids que tenían cada uno.
+    """
+    columnas = ', '.join(f"('{campo}', {_valor_auditado(campo)})" for campo in valores)
+    cursor.execute(f"""
+        SELECT campo, json_agg(json_build_array(valor, rangos) ORDER BY cantidad DESC) FROM (
+            SELECT campo, valor, sum(hasta - desde + 1) AS cantidad,
+                   json_agg(json_build_array(desde, hasta) ORDER BY desde) AS rangos
+            FROM (
+                SELECT campo, valor, min(id) AS desde, max(id) AS hasta
+                FROM (
+                    SELECT v.campo, v.valor, c.id,
+                           c.id - row_number() OVER (PARTITION BY v.campo, v.valor ORDER BY c.id) AS grupo
+                    FROM calificacion_tributaria c
+                    JOIN {TABLA_IDS} n ON n.id = c.id
+                    CROSS JOIN LATERAL (VALUES {columnas}) AS v (campo, valor)
+                ) AS filas
+                GROUP BY campo, valor, grupo
+            ) AS grupos
+            GROUP BY campo, valor
+        ) AS por_valor
+        GROUP BY campo
+    """)
+    return dict(cursor.fetchall())
+
+
+def _actualizar(cursor, valores):
+    """
+    Un UPDATE para todas las filas que cambian (las que ya tienen los
+    valores no se reescriben), con hash_contenido calculado en SQL.
+    Devuelve la cantidad de filas actualizadas.
+    """
+    columnas = []
+    params = []
+    for campo, valor in valores.items():
+        if campo in CAMPOS_FACTOR:
+            columnas.append(f'factores[{_posicion(campo)}]')
+            params.append(factor_a_escalado(valor))
+        else:
+            columnas.append(connection.ops.quote_name(campo))
+            params.append(valor)
+    asignaciones = [f'{columna} = %s' for columna in columnas]
+    marcadores = ', '.join(['%s'] * len(columnas))
+
+    textos = []
+    params_hash = []
+    for campo in COLUMNAS_BASE + CAMPOS_FACTOR:
+        if campo in valores:
+            textos.append('%s')
+            params_hash.append(_texto_nuevo(campo, valores[campo]))
+        else:
+            textos.append(_texto_hash_sql(campo))
+
+    cursor.execute(
+        f"""
+        UPDATE calificacion_tributaria c
+        SET {', '.join(asignaciones)},
+            hash_contenido = md5(concat_ws('|', {', '.join(textos)})),
+            updated_at = now()
+        FROM {TABLA_IDS} n
+        WHERE c.id = n.id
+          AND ROW({', '.join(f'c.{columna}' for columna in columnas)}) IS DISTINCT FROM ROW({marcadores})
+        """,
+        params + params_hash + params,
+    )
+    return cursor.rowcount
+
+
+def _mensaje_rechazo(cursor, valores, restriccion):
+    """
+    Mensaje para la restricción que rechazó el UPDATE (ya revertido): para
+    la suma 8-16, la primera calificación que la rompería con los valores nuevos.
+    """
+    if restriccion != 'calificacion_suma_factores':
+        return f'Alguna calificación no cumple la restricción {restriccion}'
+    sumandos = []
+    params = []
+    for campo in validacion.CAMPOS_SUMA:
+        if campo in valores:
+            sumandos.append('%s')
+            params.append(factor_a_escalado(valores[campo]))
+        else:
+            sumandos.append(f'c.factores[{_posicion(campo)}]')
+    suma = ' + '.join(sumandos)
+    cursor.execute(
+        f"""
+        SELECT c.id, {suma} FROM calificacion_tributaria c
+        JOIN {TABLA_IDS} n ON n.id = c.id
+        WHERE {suma} > %s
+        ORDER BY c.id LIMIT 1
+        """,
+        params + params + [ESCALA_FACTOR],
+    )
+    fila = cursor.fetchone()
+    if fila is None:
+        return f'Alguna calificación no cumple la restricción {restriccion}'
+    pk, suma_escalada = fila
+    mensaje = validacion.MENSAJE_SUMA.format(suma=validacion.desde_escalado(suma_escalada, 'factor_8'))
+    return f'Calificación {pk}: {mensaje}'
+
+
+def _posicion(campo):
+    """Índice de factor_N en el arreglo `factores` (PostgreSQL cuenta desde 1)"""
+    return CAMPOS_FACTOR.index(campo) + 1
+
+
+def _texto_nuevo(campo, valor):
+    if campo in CAMPOS_FACTOR:
+        return _texto_factor_hash(factor_a_escalado(valor))
+    return _texto_hash(valor)
+
+
+def _texto_hash_sql(campo):
+    """Expresión con el mismo texto que models._texto_hash para la columna actual"""
+    if campo in CAMPOS_FACTOR:
+        return f'trim_scale(c.factores[{_posicion(campo)}] * 0.00000001)::text'
+    tipo = _campo_modelo(campo).get_internal_type()
+    columna = f'c.{connection.ops.quote_name(campo)}'
+    if tipo == 'DecimalField':
+        return f'trim_scale({columna})::text'
+    if tipo == 'DateField':
+        return f"to_char({columna}, 'YYYY-MM-DD')"
+    if tipo == 'BooleanField':
+        return f"CASE WHEN {columna} THEN '1' ELSE '0' END"
+    return f'{columna}::text'
+
+
+def _valor_auditado(campo):
+    """Expresión jsonb con el mismo valor que auditoria.instantanea"""
+    if campo in CAMPOS_FACTOR:
+        return f'to_jsonb((c.factores[{_posicion(campo)}] * 0.00000001)::numeric(20, 8)::text)'
+    tipo = _campo_modelo(campo).get_internal_type()
+    columna = f'c.{connection.ops.quote_name(campo)}'
+    if tipo == 'DecimalField':
+        return f'to_jsonb({columna}::text)'
+    if tipo == 'DateField':
+        return f"to_jsonb(to_char({columna}, 'YYYY-MM-DD'))"
+    return f'to_jsonb({columna})'
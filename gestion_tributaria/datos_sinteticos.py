@@ -0,0 +1,290 @@
+"""
+Datos DJ1948 sintéticos para pruebas de volumen y benchmarks.
+
+generar_valores() produce calificaciones con la forma de las reales:
+  - cada evento (instrumento, fecha_pago, secuencia_evento) lo informan
+    varios corredores con los mismos valores;
+  - los factores 8-16 suman entre 0 y 1 (algunas filas exactamente 1),
+    repartidos en 1 a 4 factores; los 17-37 casi siempre son cero;
+  - mercados, tipo de sociedad, ISFUT y origen con proporciones fijas.
+Todo sale de random.Random(semilla): la misma semilla da los mismos datos.
+
+poblar() los escribe en la base por lotes (bulk_create) para los
+corredores sinteticoNNN, con una CargaMasiva por corredor y ejercicio y un
+historial de LogOperacion repartido en los últimos meses (generado con un
+INSERT ... SELECT en la base). escribir_csv() los deja en un CSV FACTORES
+que se carga con cargar_dj1948 (y lo usa el benchmark de carga masiva).
+"""
+import random
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import auditoria, cache_calificaciones, ejercicios as ejercicios_cerrados, facetas
+from .exportacion import _bloques_csv
+from .formato_dj1948 import CAMPOS_FACTOR, COLUMNAS_BASE, ESCALA_FACTOR
+from .models import CalificacionTributaria, CargaMasiva, LogOperacion, Perfil, hash_valores
+from .validacion import CAMPOS_SUMA
+
+PREFIJO_CORREDOR = 'sintetico'
+CORREDORES_POR_EVENTO = 3
+TAMANO_LOTE = 5000
+SECUENCIA_INICIAL = 10001
+MESES_HISTORIAL = 24
+
+EMISORES = [
+    'CHILE', 'BSANTANDER', 'BCI', 'ITAUCL', 'SQM-B', 'SQM-A', 'FALABELLA', 'CENCOSUD', 'COPEC', 'CMPC',
+    'ENELAM', 'ENELCHILE', 'COLBUN', 'CCU', 'ANDINA-B', 'LTM', 'PARAUCO', 'MALLPLAZA', 'AGUAS-A', 'VAPORES',
+]
+# Instrumentos: los emisores más series de renta fija y fondos
+INSTRUMENTOS = EMISORES + [f'{emisor[:4]}-S{serie:03d}' for emisor in EMISORES for serie in range(1, 100)]
+MERCADOS = (('ACN', 60), ('CFI', 25), ('FM', 15))
+ORIGENES = (('MASIVO', 80), ('MANUAL', 15), ('SISTEMA', 5))
+DESCRIPCIONES = ['DIVIDENDO DEFINITIVO', 'DIVIDENDO PROVISORIO', 'DIVIDENDO EVENTUAL', 'DEVOLUCION DE CAPITAL', '']
+INDICES_SUMA = [CAMPOS_FACTOR.index(campo) for campo in CAMPOS_SUMA]
+INDICES_RESTO = [indice for indice in range(len(CAMPOS_FACTOR)) if indice not in INDICES_SUMA]
+
+
+def _elegir(aleatorio, opciones):
+    valores, pesos = zip(*opciones)
+    return aleatorio.choices(valores, pesos)[0]
+
+
+def factores(aleatorio):
+    """30 factores escalados: los 8-16 suman como máximo ESCALA_FACTOR"""
+    escalados = [0] * len(CAMPOS_FACTOR)
+    total = ESCALA_FACTOR if aleatorio.random() < 0.05 else aleatorio.randint(0, ESCALA_FACTOR)
+    posiciones = aleatorio.sample(INDICES_SUMA, aleatorio.randint(1, 4))
+    cortes = sorted(aleatorio.randint(0, total) for _ in range(len(posiciones) - 1))
+    for posicion, desde, hasta in zip(posiciones, [0] + cortes, cortes + [total]):
+        escalados[posicion] = hasta - desde
+    for posicion in aleatorio.sample(INDICES_RESTO, aleatorio.choice((0, 0, 0, 1, 2))):
+        escalados[posicion] = aleatorio.randint(0, ESCALA_FACTOR)
+    return escalados
+
+
+def valores_evento(aleatorio, ejercicio, secuencia):
+    """Valores (COLUMNAS_BASE + factores) de un evento"""
+    descripcion = aleatorio.choice(DESCRIPCIONES)
+    return {
+        'ejercicio': ejercicio,
+        'mercado': _elegir(aleatorio, MERCADOS),
+        'instrumento': aleatorio.choice(INSTRUMENTOS),
+        'fecha_pago': date(ejercicio, aleatorio.randint(1, 12), aleatorio.randint(1, 28)),
+        'secuencia_evento': secuencia,
+        'numero_dividendo': aleatorio.randint(1, 400),
+        'descripcion': f'{descripcion} {ejercicio}' if descripcion else '',
+        'tipo_sociedad': 'A' if aleatorio.random() < 0.8 else 'C',
+        'acogido_isfut': aleatorio.random() < 0.1,
+        'valor_historico': Decimal(aleatorio.randint(100, 100_000_000)).scaleb(-2),
+        'factor_actualizacion': Decimal(aleatorio.randint(100_000_000, 120_000_000)).scaleb(-8),
+        'factores': factores(aleatorio),
+    }
+
+
+def generar_valores(cantidad, ejercicios, semilla=0, corredores=1,
+                    corredores_por_evento=CORREDORES_POR_EVENTO, secuencia_inicial=SECUENCIA_INICIAL):
+    """
+    Genera `cantidad` tuplas (índice de corredor, valores). Cada evento lo
+    informan min(corredores_por_evento, corredores) corredores distintos,
+    así que la clave natural no se repite.
+    """
+    aleatorio = random.Random(semilla)
+    por_evento = max(min(corredores_por_evento, corredores), 1)
+    ejercicios = list(ejercicios)
+    generadas = 0
+    evento = 0
+    while generadas < cantidad:
+        valores = valores_evento(aleatorio, aleatorio.choice(ejercicios), secuencia_inicial + evento)
+        primero = aleatorio.randrange(corredores)
+        for desplazamiento in range(min(por_evento, cantidad - generadas)):
+            yield (primero + desplazamiento) % corredores, valores
+            generadas += 1
+        evento += 1
+
+
+def escribir_csv(ruta, cantidad, ejercicios, semilla=0, secuencia_inicial=SECUENCIA_INICIAL):
+    """CSV FACTORES con `cantidad` calificaciones de un solo corredor (mismo formato que la exportación)"""
+    filas = (
+        (*(valores[campo] for campo in COLUMNAS_BASE), valores['factores'])
+        for _, valores in generar_valores(
+            cantidad, ejercicios, semilla, corredores_por_evento=1, secuencia_inicial=secuencia_inicial,
+        )
+    )
+    with open(ruta, 'wb') as destino:
+        for bloque in _bloques_csv(filas):
+            destino.write(bloque)
+
+
+def ejercicios_abiertos(ejercicios):
+    """Los ejercicios cerrados no admiten calificaciones nuevas"""
+    cerrados = ejercicios_cerrados.cerrados()
+    return [ejercicio for ejercicio in ejercicios if ejercicio not in cerrados]
+
+
+def siguiente_secuencia():
+    """Primera secuencia_evento libre (para no repetir claves al generar otra vez)"""
+    maxima = CalificacionTributaria.objects.aggregate(maxima=Max('secuencia_evento'))['maxima']
+    return max((maxima or 0) + 1, SECUENCIA_INICIAL)
+
+
+# ============================================
+# BASE DE DATOS
+# ============================================
+def _rut(numero):
+    """RUT con dígito verificador (módulo 11)"""
+    suma = sum(int(digito) * (2 + i % 6) for i, digito in enumerate(reversed(str(numero))))
+    verificador = 11 - suma % 11
+    digito = {10: 'K', 11: '0'}.get(verificador, str(verificador))
+    return f'{numero}-{digito}'
+
+
+def crear_corredores(cantidad):
+    """Usuarios sinteticoNNN con Perfil CORREDOR (los que ya existen se reutilizan)"""
+    nombres = [f'{PREFIJO_CORREDOR}{numero:04d}' for numero in range(1, cantidad + 1)]
+    existentes = set(User.objects.filter(username__in=nombres).values_list('username', flat=True))
+    nuevos = []
+    for nombre in nombres:
+        if nombre not in existentes:
+            usuario = User(username=nombre, first_name='Corredor', last_name=nombre[len(PREFIJO_CORREDOR):])
+            usuario.set_unusable_password()
+            nuevos.append(usuario)
+    User.objects.bulk_create(nuevos)
+    usuarios = list(User.objects.filter(username__in=nombres).order_by('username'))
+    Perfil.objects.bulk_create(
+        [
+            Perfil(
+                usuario=usuario,
+                rol='CORREDOR',
+                nombre_completo=f'Corredora Sintetica {usuario.username[len(PREFIJO_CORREDOR):]} S.A.',
+                rut=_rut(76_000_000 + usuario.pk),
+            )
+            for usuario in usuarios
+        ],
+        ignore_conflicts=True,
+    )
+    return usuarios
+
+
+def poblar(calificaciones, corredores, ejercicios, logs=0, semilla=0, tamano_lote=TAMANO_LOTE, progreso=None):
+    """
+    Inserta `calificaciones` calificaciones sintéticas y unos `logs` logs de
+    actualización. `progreso(insertadas)` se llama después de cada lote.
+    Devuelve los contadores de lo creado.
+    """
+    ejercicios = ejercicios_abiertos(ejercicios)
+    if not ejercicios:
+        raise ValueError('Todos los ejercicios pedidos están cerrados')
+    usuarios = crear_corredores(corredores)
+    cargas = {}
+    for usuario in usuarios:
+        for ejercicio in ejercicios:
+            cargas[usuario.pk, ejercicio] = CargaMasiva(
+                usuario=usuario, tipo_carga='FACTORES', modo='UPSERT', estado='COMPLETADA',
+                nombre_archivo=f'dj1948_{ejercicio}_{usuario.username}.csv',
+            )
+    CargaMasiva.objects.bulk_create(cargas.values())
+
+    aleatorio = random.Random(semilla)
+    filas = generar_valores(
+        calificaciones, ejercicios, semilla, len(usuarios), secuencia_inicial=siguiente_secuencia(),
+    )
+    insertadas = 0
+    lote = []
+    for indice, valores in filas:
+        usuario = usuarios[indice]
+        origen = _elegir(aleatorio, ORIGENES)
+        lote.append(CalificacionTributaria(
+            usuario=usuario,
+            carga_masiva=cargas[usuario.pk, valores['ejercicio']] if origen == 'MASIVO' else None,
+            origen=origen,
+            es_local=origen != 'SISTEMA',
+            hash_contenido=hash_valores(valores),
+            **valores
+        ))
+        if len(lote) >= tamano_lote:
+            insertadas += _insertar(lote)
+            lote = []
+            if progreso:
+                progreso(insertadas)
+    if lote:
+        insertadas += _insertar(lote)
+        if progreso:
+            progreso(insertadas)
+
+    _cerrar_cargas(cargas.values())
+    creados_logs = _generar_logs(usuarios, logs, semilla) if logs else 0
+    return {
+        'corredores': len(usuarios),
+        'cargas': len(cargas),
+        'calificaciones': insertadas,
+        'logs': creados_logs + len(cargas),
+    }
+
+
+def _insertar(lote):
+    with transaction.atomic():
+        CalificacionTributaria.objects.bulk_create(lote)
+        # bulk_create no envía post_save: invalidar los cachés al confirmar el lote
+        transaction.on_commit(facetas.invalidar)
+        transaction.on_commit(cache_calificaciones.invalidar)
+    return len(lote)
+
+
+def _cerrar_cargas(cargas):
+    """Contadores de cada carga según sus calificaciones, y su log CARGA"""
+    pks = [carga.pk for carga in cargas]
+    cantidad = Subquery(
+        CalificacionTributaria.objects
+        .filter(carga_masiva=OuterRef('pk'))
+        .order_by()
+        .values('carga_masiva')
+        .annotate(cantidad=Count('pk'))
+        .values('cantidad')
+    )
+    actualizadas = CargaMasiva.objects.filter(pk__in=pks)
+    actualizadas.update(registros_procesados=Coalesce(cantidad, 0))
+    actualizadas.update(
+        registros_exitosos=F('registros_procesados'), registros_insertados=F('registros_procesados'),
+    )
+    for carga in actualizadas:
+        auditoria.registrar_carga(carga)
+
+
+def _generar_logs(usuarios, cantidad, semilla):
+    """
+    Cerca de `cantidad` logs UPDATE de factor_actualizacion sobre
+    calificaciones de `usuarios` al azar, con fechas repartidas en los
+    últimos MESES_HISTORIAL meses (caen en sus particiones mensuales).
+    """
+    ids = [usuario.pk for usuario in usuarios]
+    total = CalificacionTributaria.objects.filter(usuario_id__in=ids).count()
+    if not total:
+        return 0
+    repeticiones = -(-cantidad // total)
+    probabilidad = min(cantidad / (total * repeticiones) * 1.05, 1)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT setseed(%s)', [(semilla % 1000) / 1000])
+        cursor.execute(
+            f"""
+            INSERT INTO {LogOperacion._meta.db_table} (
+                usuario_id, calificacion_id, calificacion_ref, operacion, datos_anteriores,
+                datos_nuevos, es_checkpoint, ip_address, fecha_hora
+            )
+            SELECT c.usuario_id, c.id, c.id, 'UPDATE',
+                   jsonb_build_object('factor_actualizacion', '1.00000000'),
+                   jsonb_build_object('factor_actualizacion', c.factor_actualizacion::text),
+                   false, ('10.0.' || (random() * 255)::int || '.' || (random() * 255)::int)::inet,
+                   now() - random() * interval '{MESES_HISTORIAL} months'
+              FROM calificacion_tributaria c
+             CROSS JOIN generate_series(1, %s) AS repeticion
+             WHERE c.usuario_id = ANY(%s) AND random() < %s
+             LIMIT %s
+            """,
+            [repeticiones, ids, probabilidad, cantidad],
+        )
+        return cursor.rowcount
@@ -0,0 +1,153 @@
+"""
+Ejercicios cerrados: particiones de solo lectura de calificacion_tributaria.
+
+En PostgreSQL la tabla está particionada por LIST (ejercicio). Los
+ejercicios abiertos están en la partición DEFAULT
+(calificacion_tributaria_abierta); al cerrar un ejercicio sus filas pasan a
+calificacion_tributaria_eAAAA, que se agrega como partición FOR VALUES IN
+(AAAA) con triggers que rechazan INSERT, UPDATE, DELETE y TRUNCATE.
+
+Las calificaciones cerradas se siguen leyendo con el mismo modelo, admin y
+API. Una consulta con el ejercicio de un año abierto solo lee la partición
+DEFAULT (el planificador descarta las cerradas), y la de un año cerrado
+solo su partición. Reabrir separa la partición (DETACH), devuelve sus filas
+a DEFAULT y la elimina.
+
+EjercicioCerrado registra cada cierre; admin, cargas y correcciones lo
+consultan para rechazar los cambios con un mensaje (los triggers son el
+resguardo para cualquier otra escritura).
+"""
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import MENSAJE_EJERCICIO_CERRADO, CalificacionTributaria, EjercicioCerrado
+
+TABLA = CalificacionTributaria._meta.db_table
+PARTICION_ABIERTA = f'{TABLA}_abierta'
+# Función de los triggers de solo lectura (creada en la migración 0013)
+FUNCION_SOLO_LECTURA = 'calificacion_ejercicio_cerrado'
+
+
+def disponible():
+    return connection.vendor == 'postgresql'
+
+
+def nombre_particion(ejercicio):
+    return f'{TABLA}_e{int(ejercicio)}'
+
+
+def cerrados():
+    """Ejercicios cerrados (conjunto)"""
+    return frozenset(EjercicioCerrado.objects.values_list('ejercicio', flat=True))
+
+
+def esta_cerrado(ejercicio):
+    return EjercicioCerrado.objects.filter(ejercicio=ejercicio).exists()
+
+
+def mensaje_cerrado(ejercicio):
+    return MENSAJE_EJERCICIO_CERRADO.format(ejercicio=ejercicio)
+
+
+def rechazar_cerrados(queryset):
+    """ValidationError si `queryset` incluye calificaciones de ejercicios cerrados"""
+    ejercicios = cerrados()
+    if not ejercicios:
+        return
+    en_seleccion = sorted(
+        queryset.filter(ejercicio__in=ejercicios).order_by().values_list('ejercicio', flat=True).distinct()
+    )
+    if en_seleccion:
+        raise ValidationError(
+            [mensaje_cerrado(ejercicio) for ejercicio in en_seleccion], code='ejercicio_cerrado'
+        )
+
+
+def rechazar_eliminacion(usuarios=(), cargas=()):
+    """
+    ValidationError si eliminar `usuarios` o `cargas` (masivas) escribe en
+    ejercicios cerrados: las calificaciones de un usuario se eliminan en
+    cascada (con sus cargas) y las de una carga quedan sin carga_masiva,
+    y los triggers de la partición rechazan las dos cosas.
+    """
+    usuarios = [usuario.pk for usuario in usuarios]
+    cargas = [carga.pk for carga in cargas]
+    if not usuarios and not cargas:
+        return
+    filtro = Q(usuario__in=usuarios) | Q(carga_masiva__usuario__in=usuarios) | Q(carga_masiva__in=cargas)
+    rechazar_cerrados(CalificacionTributaria.objects.filter(filtro))
+
+
+def _columnas():
+    """Columnas que se copian entre particiones (las generadas se recalculan)"""
+    return ', '.join(
+        connection.ops.quote_name(field.column)
+        for field in CalificacionTributaria._meta.concrete_fields
+        if not field.generated
+    )
+
+
+# ============================================
+# CIERRE Y REAPERTURA
+# ============================================
+def cerrar(ejercicio, usuario_id=None):
+    """
+    Mueve las calificaciones de `ejercicio` a su partición de solo lectura.
+
+    Todo ocurre en una transacción que bloquea la partición DEFAULT (las
+    consultas de los ejercicios abiertos esperan hasta que termine): se
+    copian las filas a la tabla nueva, se eliminan de DEFAULT y se agrega
+    la tabla como partición; PostgreSQL crea sus índices ya con los datos.
+    Devuelve el EjercicioCerrado.
+    """
+    ejercicio = int(ejercicio)
+    nombre = nombre_particion(ejercicio)
+    columnas = _columnas()
+    with transaction.atomic(), connection.cursor() as cursor:
+        if EjercicioCerrado.objects.select_for_update().filter(ejercicio=ejercicio).exists():
+            raise ValidationError(f'El ejercicio {ejercicio} ya está cerrado')
+        cursor.execute(f'LOCK TABLE {PARTICION_ABIERTA} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(
+            f'CREATE TABLE {nombre} '
+            f'(LIKE {TABLA} INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING CONSTRAINTS)'
+        )
+        # Con esta restricción ATTACH no necesita recorrer la tabla nueva
+        cursor.execute(f'ALTER TABLE {nombre} ADD CONSTRAINT {nombre}_ejercicio CHECK (ejercicio = {ejercicio})')
+        cursor.execute(
+            f'INSERT INTO {nombre} ({columnas}) SELECT {columnas} FROM {PARTICION_ABIERTA} WHERE ejercicio = %s',
+            [ejercicio],
+        )
+        registros = cursor.rowcount
+        cursor.execute(f'DELETE FROM {PARTICION_ABIERTA} WHERE ejercicio = %s', [ejercicio])
+        cursor.execute(f'ALTER TABLE {TABLA} ATTACH PARTITION {nombre} FOR VALUES IN ({ejercicio})')
+        cursor.execute(
+            f'CREATE TRIGGER {nombre}_solo_lectura BEFORE INSERT OR UPDATE OR DELETE ON {nombre} '
+            f'FOR EACH ROW EXECUTE FUNCTION {FUNCION_SOLO_LECTURA}()'
+        )
+        cursor.execute(
+            f'CREATE TRIGGER {nombre}_sin_truncate BEFORE TRUNCATE ON {nombre} '
+            f'FOR EACH STATEMENT EXECUTE FUNCTION {FUNCION_SOLO_LECTURA}()'
+        )
+        cursor.execute(f'ANALYZE {nombre}')
+        return EjercicioCerrado.objects.create(ejercicio=ejercicio, usuario_id=usuario_id, registros=registros)
+
+
+def reabrir(ejercicio):
+    """
+    Devuelve las calificaciones de `ejercicio` a la partición DEFAULT y
+    elimina su partición. Devuelve la cantidad de calificaciones movidas.
+    """
+    ejercicio = int(ejercicio)
+    nombre = nombre_particion(ejercicio)
+    columnas = _columnas()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cierre = EjercicioCerrado.objects.select_for_update().filter(ejercicio=ejercicio).first()
+        if cierre is None:
+            raise ValidationError(f'El ejercicio {ejercicio} no está cerrado')
+        cursor.execute(f'ALTER TABLE {TABLA} DETACH PARTITION {nombre}')
+        cursor.execute(f'INSERT INTO {TABLA} ({columnas}) SELECT {columnas} FROM {nombre}')
+        registros = cursor.rowcount
+        cursor.execute(f'DROP TABLE {nombre}')
+        cierre.delete()
+    return registros
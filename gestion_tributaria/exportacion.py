@@ -0,0 +1,215 @@
+"""
+Exportación de calificaciones en el formato DJ1948 (CSV o XLSX).
+
+Las filas se leen con .values_list().iterator(chunk_size), que en
+PostgreSQL usa un cursor del lado del servidor, y se escriben a medida que
+llegan: la memoria usada no depende de la cantidad de calificaciones.
+Ambos formatos se generan como un flujo de bloques de bytes (el CSV
+opcionalmente comprimido con gzip) que sirve tanto para un
+StreamingHttpResponse como para un archivo. El XLSX es un zip que se
+escribe de una pasada, sin archivos temporales: la hoja se arma a mano
+con celdas inlineStr, como la escribiría openpyxl en modo write_only.
+"""
+import csv
+import io
+import re
+import zipfile
+import zlib
+from datetime import date
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from .formato_dj1948 import (
+    COLUMNAS_BASE,
+    COLUMNAS_EXPORTACION,
+    texto_factor,
+    valor_texto,
+)
+
+TAMANO_CHUNK = 2000
+TAMANO_BLOQUE = 64 * 1024
+NIVEL_GZIP = 6
+# Filas de datos que caben en una hoja XLSX (1.048.576 menos la cabecera)
+MAX_FILAS_XLSX = 1048575
+
+# Orden del índice único de la clave natural: no requiere ordenar en la base
+ORDEN_EXPORTACION = ['usuario', 'ejercicio', 'mercado', 'instrumento', 'secuencia_evento']
+
+
+class ErrorExportacion(Exception):
+    """La exportación no se puede generar en el formato pedido"""
+
+
+def filas(queryset, chunk_size=TAMANO_CHUNK):
+    """
+    Tuplas (valores de COLUMNAS_BASE, factores escalados) de cada
+    calificación, sin instanciar modelos.
+    """
+    return (
+        queryset
+        .order_by(*ORDEN_EXPORTACION)
+        .values_list(*COLUMNAS_BASE, 'factores')
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+# ============================================
+# CSV
+# ============================================
+def generar_csv(queryset, comprimir=False, chunk_size=TAMANO_CHUNK):
+    """Bloques de bytes del CSV (UTF-8 con BOM, separador ';'), en gzip si `comprimir`"""
+    bloques = _bloques_csv(filas(queryset, chunk_size))
+    if comprimir:
+        return _gzip(bloques)
+    return bloques
+
+
+def _bloques_csv(filas_exportadas):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=';', lineterminator='\r\n')
+    buffer.write('\ufeff')
+    escritor.writerow(COLUMNAS_EXPORTACION)
+    for *base, factores in filas_exportadas:
+        escritor.writerow([*map(valor_texto, base), *map(texto_factor, factores)])
+        if buffer.tell() >= TAMANO_BLOQUE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _gzip(bloques):
+    compresor = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for bloque in bloques:
+        comprimido = compresor.compress(bloque)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+
+# ============================================
+# XLSX
+# ============================================
+TIPO_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# Día 0 de las fechas de Excel (con el 29/02/1900 que no existió)
+ORIGEN_FECHAS_XLSX = date(1899, 12, 30)
+# Caracteres de control que XML 1.0 no admite
+CARACTERES_INVALIDOS_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XML = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_PKG_REL = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_OFFICE = 'application/vnd.openxmlformats-officedocument.spreadsheetml'
+PARTES_XLSX = {
+    '[Content_Types].xml': (
+        f'{_XML}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        f'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        f'<Default Extension="xml" ContentType="application/xml"/>'
+        f'<Override PartName="/xl/workbook.xml" ContentType="{_OFFICE}.sheet.main+xml"/>'
+        f'<Override PartName="/xl/worksheets/sheet1.xml" ContentType="{_OFFICE}.worksheet+xml"/>'
+        f'<Override PartName="/xl/styles.xml" ContentType="{_OFFICE}.styles+xml"/>'
+        f'</Types>'
+    ),
+    '_rels/.rels': (
+        f'{_XML}<Relationships xmlns="{_PKG_REL}">'
+        f'<Relationship Id="rId1" Type="{_REL}/officeDocument" Target="xl/workbook.xml"/>'
+        f'</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        f'{_XML}<workbook xmlns="{_MAIN}" xmlns:r="{_REL}">'
+        f'<sheets><sheet name="DJ1948" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        f'{_XML}<Relationships xmlns="{_PKG_REL}">'
+        f'<Relationship Id="rId1" Type="{_REL}/worksheet" Target="worksheets/sheet1.xml"/>'
+        f'<Relationship Id="rId2" Type="{_REL}/styles" Target="styles.xml"/>'
+        f'</Relationships>'
+    ),
+    # Estilo 1: fecha AAAA-MM-DD (el mismo formato que usa openpyxl)
+    'xl/styles.xml': (
+        f'{_XML}<styleSheet xmlns="{_MAIN}">'
+        f'<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd"/></numFmts>'
+        f'<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        f'<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        f'<fill><patternFill patternType="gray125"/></fill></fills>'
+        f'<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        f'<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        f'<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        f'<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+        f'<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        f'</styleSheet>'
+    ),
+}
+
+
+def generar_xlsx(queryset, chunk_size=TAMANO_CHUNK):
+    """
+    Bloques de bytes del XLSX (una hoja DJ1948). El límite de filas de una
+    hoja se verifica antes de empezar, para no cortar un archivo a medias.
+    """
+    if queryset.order_by()[MAX_FILAS_XLSX:MAX_FILAS_XLSX + 1].exists():
+        raise ErrorExportacion(
+            f'La exportación supera las {MAX_FILAS_XLSX} filas de una hoja XLSX; use CSV'
+        )
+    return _bloques_xlsx(filas(queryset, chunk_size))
+
+
+class _Salida:
+    """Destino del zip sin seek: zipfile escribe entonces descriptores de datos"""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def write(self, datos):
+        return self.buffer.write(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return datos
+
+
+def _bloques_xlsx(filas_exportadas):
+    salida = _Salida()
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_DEFLATED) as libro:
+        for nombre, contenido in PARTES_XLSX.items():
+            libro.writestr(nombre, contenido)
+        with libro.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as hoja:
+            texto = io.StringIO()
+            texto.write(f'{_XML}<worksheet xmlns="{_MAIN}"><sheetData>')
+            texto.write(_fila_xlsx(COLUMNAS_EXPORTACION))
+            for *base, factores in filas_exportadas:
+                texto.write(_fila_xlsx(base, factores))
+                if texto.tell() >= TAMANO_BLOQUE:
+                    hoja.write(texto.getvalue().encode('utf-8'))
+                    texto.seek(0)
+                    texto.truncate()
+                    yield salida.vaciar()
+            texto.write('</sheetData></worksheet>')
+            hoja.write(texto.getvalue().encode('utf-8'))
+    yield salida.vaciar()
+
+
+def _fila_xlsx(valores, factores=()):
+    celdas = ''.join(map(_celda_xlsx, valores))
+    # Los factores van como número con 8 decimales, sin pasar por Decimal
+    celdas += ''.join(f'<c><v>{texto_factor(escalado)}</v></c>' for escalado in factores)
+    return f'<row>{celdas}</row>'
+
+
+def _celda_xlsx(valor):
+    if valor is None:
+        return '<c/>'
+    if isinstance(valor, bool):
+        return f'<c t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, Decimal)):
+        return f'<c><v>{valor_texto(valor)}</v></c>'
+    if isinstance(valor, date):
+        return f'<c s="1"><v>{(valor - ORIGEN_FECHAS_XLSX).days}</v></c>'
+    texto = escape(CARACTERES_INVALIDOS_XML.sub('', str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
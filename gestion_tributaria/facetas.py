@@ -0,0 +1,48 @@
+"""
+Valores de los filtros del admin (facetas) guardados en caché.
+
+Los filtros por valores de la tabla (p. ej. `ejercicio`) hacen un SELECT
+DISTINCT sobre toda calificacion_tributaria en cada página. Aquí el
+resultado se guarda en el caché de Django bajo una versión común: cualquier
+escritura de calificaciones (señales en signals.py y las cargas masivas)
+cambia la versión y así invalida todas las facetas de una vez.
+"""
+import time
+
+from django.conf import settings
+from django.contrib import admin
+from django.core.cache import cache
+
+from . import perfiles
+from .models import CalificacionTributaria
+
+CLAVE_VERSION = 'facetas:calificacion:version'
+
+
+def _version():
+    return cache.get_or_set(CLAVE_VERSION, time.time_ns(), None)
+
+
+def invalidar():
+    """Descarta todas las facetas guardadas (se llama después de confirmar la escritura)"""
+    cache.set(CLAVE_VERSION, time.time_ns(), None)
+
+
+def valores(campo, usuario_id=None):
+    """Valores distintos de `campo`, ordenados; los visibles para `usuario_id` si se indica"""
+    clave = f'facetas:calificacion:{_version()}:{campo}:{usuario_id or "todos"}'
+    resultado = cache.get(clave)
+    if resultado is None:
+        queryset = CalificacionTributaria.objects.visibles_para(usuario_id, ver_todas=usuario_id is None)
+        resultado = list(queryset.order_by(campo).values_list(campo, flat=True).distinct())
+        cache.set(clave, resultado, settings.FACETAS_TTL)
+    return resultado
+
+
+class ValoresCacheadosFilter(admin.AllValuesFieldListFilter):
+    """AllValuesFieldListFilter de CalificacionTributaria con los valores desde el caché"""
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        usuario_id = None if perfiles.es_administrador(request) else request.user.pk
+        self.lookup_choices = valores(field_path, usuario_id)
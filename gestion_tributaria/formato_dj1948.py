@@ -0,0 +1,339 @@
+"""
+Formato de archivos DJ1948 para cargas masivas (FACTORES / MONTOS).
+
+Las filas se leen como un flujo (generador) para que la memoria usada no
+dependa del tamaño del archivo.
+"""
+import csv
+import io
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+
+
+# ============================================
+# COLUMNAS DEL ARCHIVO
+# ============================================
+NUMEROS_FACTOR = range(8, 38)
+CAMPOS_FACTOR = [f'factor_{n}' for n in NUMEROS_FACTOR]
+COLUMNAS_MONTO = [f'monto_{n}' for n in NUMEROS_FACTOR]
+
+COLUMNAS_BASE = [
+    'ejercicio',
+    'mercado',
+    'instrumento',
+    'fecha_pago',
+    'secuencia_evento',
+    'numero_dividendo',
+    'descripcion',
+    'tipo_sociedad',
+    'acogido_isfut',
+    'valor_historico',
+    'factor_actualizacion',
+]
+
+COLUMNAS_OBLIGATORIAS = [
+    'ejercicio',
+    'mercado',
+    'instrumento',
+    'fecha_pago',
+    'secuencia_evento',
+    'tipo_sociedad',
+]
+
+COLUMNAS = {
+    'FACTORES': COLUMNAS_BASE + CAMPOS_FACTOR,
+    'MONTOS': COLUMNAS_BASE + COLUMNAS_MONTO,
+}
+
+# Las exportaciones usan el formato FACTORES: se pueden volver a cargar tal cual
+COLUMNAS_EXPORTACION = COLUMNAS['FACTORES']
+
+MERCADOS = {'ACN', 'CFI', 'FM'}
+TIPOS_SOCIEDAD = {'A', 'C'}
+VALORES_VERDADEROS = {'1', 'S', 'SI', 'SÍ', 'TRUE', 'X', 'Y', 'YES'}
+VALORES_FALSOS = {'', '0', 'N', 'NO', 'FALSE'}
+
+CERO_FACTOR = Decimal('0.00000000')
+CUANTO_FACTOR = Decimal('0.00000001')
+DECIMALES_FACTOR = 8
+ESCALA_FACTOR = 10 ** DECIMALES_FACTOR
+CUANTO_MONTO = Decimal('0.01')
+DECIMALES_MONTO = 2
+ERROR_VALOR_HISTORICO = 'valor_historico debe ser distinto de cero para calcular factores'
+
+
+class ErrorFila(Exception):
+    """Fila del archivo que no se puede convertir a una calificación"""
+
+
+# ============================================
+# LECTURA EN FLUJO
+# ============================================
+def leer_filas(archivo, nombre_archivo, tipo_carga, encoding='utf-8-sig'):
+    """
+    Genera tuplas (numero_fila, dict) desde un CSV o XLSX.
+
+    `archivo` puede ser una ruta o un archivo binario abierto. El número de
+    fila es el de la planilla (la cabecera es la fila 1). Si la cabecera no
+    trae las columnas obligatorias se lanza ErrorFila al iniciar la lectura.
+    """
+    extension = Path(nombre_archivo).suffix.lower()
+    if extension in ('.xlsx', '.xlsm'):
+        return _leer_xlsx(archivo, tipo_carga)
+    return _leer_csv(archivo, tipo_carga, encoding)
+
+
+def _leer_csv(archivo, tipo_carga, encoding):
+    if isinstance(archivo, (str, Path)):
+        with open(archivo, 'rb') as binario:
+            yield from _leer_csv(binario, tipo_carga, encoding)
+        return
+
+    texto = io.TextIOWrapper(archivo, encoding=encoding, newline='')
+    try:
+        columnas, delimitador = cabecera_csv(texto.readline(), tipo_carga)
+        for numero, valores in enumerate(csv.reader(texto, delimiter=delimitador), start=2):
+            if not any(valores):
+                continue
+            yield numero, dict(zip(columnas, valores))
+    finally:
+        # No cerrar el archivo del llamador junto con el wrapper
+        texto.detach()
+
+
+def cabecera_csv(linea, tipo_carga):
+    """Columnas (normalizadas) y delimitador (';' o ',') de la línea de cabecera de un CSV"""
+    delimitador = ';' if linea.count(';') > linea.count(',') else ','
+    columnas = _normalizar_cabecera(next(csv.reader([linea], delimiter=delimitador), []))
+    verificar_columnas(columnas, tipo_carga)
+    return columnas, delimitador
+
+
+def _leer_xlsx(archivo, tipo_carga):
+    try:
+        from openpyxl import load_workbook
+    except ImportError as exc:
+        raise ErrorFila('Se requiere openpyxl para leer archivos XLSX') from exc
+
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        columnas = _normalizar_cabecera(next(filas, ()))
+        verificar_columnas(columnas, tipo_carga)
+        for numero, valores in enumerate(filas, start=2):
+            if not any(v not in (None, '') for v in valores):
+                continue
+            yield numero, dict(zip(columnas, valores))
+    finally:
+        libro.close()
+
+
+def _normalizar_cabecera(columnas):
+    return [str(c or '').strip().lower() for c in columnas]
+
+
+def verificar_columnas(columnas, tipo_carga):
+    """Lanza ErrorFila si faltan columnas obligatorias para el tipo de carga"""
+    obligatorias = list(COLUMNAS_OBLIGATORIAS)
+    if tipo_carga == 'MONTOS':
+        obligatorias.append('valor_historico')
+    faltantes = [c for c in obligatorias if c not in columnas]
+    if faltantes:
+        raise ErrorFila(f'Faltan columnas obligatorias: {", ".join(faltantes)}')
+
+
+# ============================================
+# ESCRITURA
+# ============================================
+def valor_texto(valor):
+    """Valor de una calificación tal como se escribe en un CSV DJ1948"""
+    if valor is None:
+        return ''
+    if isinstance(valor, bool):
+        return '1' if valor else '0'
+    if isinstance(valor, Decimal):
+        return format(valor, 'f')
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return str(valor)
+
+
+def texto_factor(escalado):
+    """Factor guardado como entero escalado -> texto con 8 decimales, sin pasar por Decimal"""
+    signo = '-' if escalado < 0 else ''
+    enteros, decimales = divmod(abs(escalado), ESCALA_FACTOR)
+    return f'{signo}{enteros}.{decimales:0{DECIMALES_FACTOR}d}'
+
+
+# ============================================
+# FACTORES ESCALADOS
+# ============================================
+def factor_a_escalado(valor):
+    """
+    Decimal (o número) -> entero escalado por ESCALA_FACTOR. Un valor con
+    más de DECIMALES_FACTOR decimales no se redondea: es un error.
+    """
+    # Un float pasa por su texto (0.1 y no 0.1000000000000000055...)
+    numero = Decimal(str(valor)) if isinstance(valor, float) else Decimal(valor)
+    if not numero.is_finite():
+        raise ValidationError('"%(value)s" no es un número', code='invalid', params={'value': valor})
+    escalado = numero.scaleb(DECIMALES_FACTOR)
+    entero = escalado.to_integral_value()
+    if escalado != entero:
+        raise ValidationError(
+            '"%(value)s" tiene más de %(max)s decimales',
+            code='max_decimal_places', params={'value': valor, 'max': DECIMALES_FACTOR},
+        )
+    return int(entero)
+
+
+def factor_desde_escalado(escalado):
+    """Entero escalado -> Decimal con 8 decimales"""
+    return Decimal(escalado).scaleb(-DECIMALES_FACTOR)
+
+
+# ============================================
+# CONVERSIÓN DE FILAS
+# ============================================
+def convertir_fila(fila, tipo_carga):
+    """Convierte una fila del archivo en los valores de CalificacionTributaria"""
+    datos = convertir_base(fila)
+    if tipo_carga == 'MONTOS':
+        datos.update(_factores_desde_montos(fila, datos['valor_historico']))
+    else:
+        for campo in CAMPOS_FACTOR:
+            datos[campo] = _decimal(fila, campo, CUANTO_FACTOR, CERO_FACTOR)
+    return datos
+
+
+def convertir_base(fila):
+    """Valores de COLUMNAS_BASE de una fila del archivo"""
+    return {
+        'ejercicio': _entero(fila, 'ejercicio'),
+        'mercado': _opcion(fila, 'mercado', MERCADOS),
+        'instrumento': _texto(fila, 'instrumento', max_length=50, obligatorio=True),
+        'fecha_pago': _fecha(fila, 'fecha_pago'),
+        'secuencia_evento': _entero(fila, 'secuencia_evento'),
+        'numero_dividendo': _entero(fila, 'numero_dividendo', defecto=0),
+        'descripcion': _texto(fila, 'descripcion'),
+        'tipo_sociedad': _opcion(fila, 'tipo_sociedad', TIPOS_SOCIEDAD),
+        'acogido_isfut': _booleano(fila, 'acogido_isfut'),
+        'valor_historico': _decimal(fila, 'valor_historico', CUANTO_MONTO, Decimal('0.00')),
+        'factor_actualizacion': _decimal(fila, 'factor_actualizacion', CUANTO_FACTOR, CERO_FACTOR),
+    }
+
+
+def _factores_desde_montos(fila, valor_historico):
+    """Factor N = monto N / valor histórico, redondeado a 8 decimales"""
+    if not valor_historico:
+        raise ErrorFila(ERROR_VALOR_HISTORICO)
+    factores = {}
+    for numero, columna in zip(NUMEROS_FACTOR, COLUMNAS_MONTO):
+        monto = _decimal(fila, columna, CUANTO_MONTO, Decimal('0.00'))
+        factores[f'factor_{numero}'] = (monto / valor_historico).quantize(CUANTO_FACTOR)
+    return factores
+
+
+def _valor(fila, campo):
+    valor = fila.get(campo)
+    if valor is None:
+        return ''
+    if isinstance(valor, str):
+        return valor.strip()
+    return valor
+
+
+def _entero(fila, campo, defecto=None):
+    valor = _valor(fila, campo)
+    if valor == '':
+        if defecto is None:
+            raise ErrorFila(f'{campo}: valor obligatorio')
+        return defecto
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        try:
+            numero = Decimal(str(valor))
+        except InvalidOperation:
+            raise ErrorFila(f'{campo}: "{valor}" no es un entero') from None
+        if numero != numero.to_integral_value():
+            raise ErrorFila(f'{campo}: "{valor}" no es un entero')
+        return int(numero)
+
+
+def _decimal(fila, campo, cuanto, defecto):
+    valor = _valor(fila, campo)
+    if valor == '':
+        return defecto
+    texto = str(valor)
+    if ',' in texto and '.' not in texto:
+        texto = texto.replace(',', '.')
+    try:
+        numero = Decimal(texto)
+    except InvalidOperation:
+        raise ErrorFila(f'{campo}: "{valor}" no es un número') from None
+    if not numero.is_finite():
+        raise ErrorFila(f'{campo}: "{valor}" no es un número')
+    try:
+        redondeado = numero.quantize(cuanto)
+    except InvalidOperation:
+        raise ErrorFila(f'{campo}: "{valor}" está fuera de rango') from None
+    if numero != redondeado:
+        raise ErrorFila(f'{campo}: "{valor}" tiene más decimales de los permitidos')
+    return redondeado
+
+
+def _texto(fila, campo, max_length=None, obligatorio=False):
+    valor = _valor(fila, campo)
+    texto = str(valor)
+    if obligatorio and not texto:
+        raise ErrorFila(f'{campo}: valor obligatorio')
+    if max_length and len(texto) > max_length:
+        raise ErrorFila(f'{campo}: supera los {max_length} caracteres')
+    return texto
+
+
+def _opcion(fila, campo, opciones):
+    valor = str(_valor(fila, campo)).upper()
+    if valor not in opciones:
+        raise ErrorFila(f'{campo}: "{valor}" no es una opción válida')
+    return valor
+
+
+def _booleano(fila, campo):
+    valor = _valor(fila, campo)
+    if isinstance(valor, bool):
+        return valor
+    texto = str(valor).upper()
+    if texto in VALORES_VERDADEROS:
+        return True
+    if texto in VALORES_FALSOS:
+        return False
+    raise ErrorFila(f'{campo}: "{valor}" no es un valor booleano')
+
+
+def _fecha(fila, campo):
+    valor = _valor(fila, campo)
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    fecha = _fecha_desde_texto(str(valor))
+    if fecha is None:
+        raise ErrorFila(f'{campo}: "{valor}" no es una fecha válida')
+    return fecha
+
+
+@lru_cache(maxsize=4096)
+def _fecha_desde_texto(texto):
+    # Las filas de un archivo repiten pocas fechas de pago: strptime una vez por texto
+    for formato in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y'):
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    return None
@@ -0,0 +1,323 @@
+"""
+Instrumentación SQL por petición (opcional, SQL_INSTRUMENTACION=True).
+
+InstrumentacionSQLMiddleware instala un execute_wrapper en las conexiones
+mientras se atiende cada petición (vistas sync y async) y registra:
+  - cantidad de consultas y tiempo total en SQL,
+  - las SQL_LENTAS sentencias más lentas,
+  - sentencias repetidas: el mismo SQL con distintos parámetros muchas veces
+    en una petición es el patrón N+1 (p. ej. un get_usuario por fila del
+    listado); las duplicadas exactas (mismo SQL y parámetros) se cuentan aparte.
+
+Cada petición se escribe como una línea JSON en el logger
+gestion_tributaria.instrumentacion (INFO) y como WARNING si la vista supera
+su presupuesto de consultas, milisegundos SQL o repeticiones (SQL_PRESUPUESTO_*
+y, por vista, SQL_PRESUPUESTOS). Además se acumula un histograma por vista
+en memoria del proceso (histograma()). `manage.py informe_sql` resume un
+archivo de estas líneas.
+
+Las consultas que hace una respuesta en streaming después de devolverse
+(exportaciones) no se cuentan.
+"""
+import hashlib
+import heapq
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+EVENTO = 'sql_peticion'
+# Largo máximo del SQL en los registros
+LARGO_SQL = 300
+# Límites superiores de cada balde del histograma (el último balde es "más")
+LIMITES_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+LIMITES_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+SIN_VISTA = '-'
+
+
+class MedicionSQL:
+    """Consultas de una petición; se instala como execute_wrapper"""
+
+    def __init__(self, lentas=5):
+        self.consultas = 0
+        self.segundos = 0.0
+        self.por_sql = Counter()
+        self.duplicadas = 0
+        self._vistas = set()
+        self._lentas = []
+        self._maximo_lentas = lentas
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self._registrar(sql, params, many, time.perf_counter() - inicio)
+
+    def _registrar(self, sql, params, many, duracion):
+        self.consultas += 1
+        self.segundos += duracion
+        self.por_sql[sql] += 1
+        if not many:
+            huella = hashlib.md5(f'{sql}\x00{params!r}'.encode(errors='replace')).digest()
+            if huella in self._vistas:
+                self.duplicadas += 1
+            else:
+                self._vistas.add(huella)
+        elemento = (duracion, self.consultas, sql)
+        if len(self._lentas) < self._maximo_lentas:
+            heapq.heappush(self._lentas, elemento)
+        elif elemento > self._lentas[0]:
+            heapq.heapreplace(self._lentas, elemento)
+
+    def activa(self):
+        """Context manager: mide las consultas de todas las conexiones"""
+        pila = ExitStack()
+        for alias in connections:
+            pila.enter_context(connections[alias].execute_wrapper(self))
+        return pila
+
+    @property
+    def ms(self):
+        return self.segundos * 1000
+
+    def lentas(self):
+        return [
+            {'sql': _recortar(sql), 'ms': round(duracion * 1000, 2)}
+            for duracion, _, sql in sorted(self._lentas, reverse=True)
+        ]
+
+    def repetidas(self, minimo):
+        """Sentencias ejecutadas `minimo` veces o más, de la más repetida a la menos"""
+        return [
+            {'sql': _recortar(sql), 'veces': veces}
+            for sql, veces in self.por_sql.most_common()
+            if veces >= minimo
+        ]
+
+    @property
+    def max_repeticiones(self):
+        return max(self.por_sql.values(), default=0)
+
+
+def _recortar(sql):
+    sql = ' '.join(sql.split())
+    return sql if len(sql) <= LARGO_SQL else sql[:LARGO_SQL] + '...'
+
+
+# ============================================
+# PRESUPUESTOS
+# ============================================
+def presupuesto(vista):
+    """Límites de la vista: los globales con lo que defina SQL_PRESUPUESTOS[vista]"""
+    return {
+        'consultas': settings.SQL_PRESUPUESTO_CONSULTAS,
+        'ms': settings.SQL_PRESUPUESTO_MS,
+        'repeticiones': settings.SQL_PRESUPUESTO_REPETICIONES,
+        **settings.SQL_PRESUPUESTOS.get(vista, {}),
+    }
+
+
+def excedidos(medicion, limites):
+    """Nombres de los límites que la medición supera (un límite 0 no se revisa)"""
+    valores = {'consultas': medicion.consultas, 'ms': medicion.ms, 'repeticiones': medicion.max_repeticiones}
+    return [nombre for nombre, limite in limites.items() if limite and valores[nombre] > limite]
+
+
+# ============================================
+# HISTOGRAMA DEL PROCESO
+# ============================================
+_histograma = {}
+_histograma_lock = threading.Lock()
+
+
+def _sumar_histograma(vista, medicion, excedida):
+    with _histograma_lock:
+        datos = _histograma.get(vista)
+        if datos is None:
+            datos = _histograma[vista] = {
+                'peticiones': 0,
+                'excedidas': 0,
+                'consultas': [0] * (len(LIMITES_CONSULTAS) + 1),
+                'ms': [0] * (len(LIMITES_MS) + 1),
+            }
+        datos['peticiones'] += 1
+        datos['excedidas'] += excedida
+        datos['consultas'][bisect_left(LIMITES_CONSULTAS, medicion.consultas)] += 1
+        datos['ms'][bisect_left(LIMITES_MS, medicion.ms)] += 1
+
+
+def histograma():
+    """
+    Vista -> peticiones, excedidas y cantidad de peticiones por balde de
+    consultas y de milisegundos SQL ({'<=10': n, ..., '>500': n}), de este proceso.
+    """
+    with _histograma_lock:
+        copia = {vista: {**datos, 'consultas': list(datos['consultas']), 'ms': list(datos['ms'])}
+                 for vista, datos in _histograma.items()}
+    return {
+        vista: {
+            'peticiones': datos['peticiones'],
+            'excedidas': datos['excedidas'],
+            'consultas': _baldes(LIMITES_CONSULTAS, datos['consultas']),
+            'ms': _baldes(LIMITES_MS, datos['ms']),
+        }
+        for vista, datos in copia.items()
+    }
+
+
+def _baldes(limites, cantidades):
+    nombres = [f'<={limite}' for limite in limites] + [f'>{limites[-1]}']
+    return dict(zip(nombres, cantidades))
+
+
+def reiniciar_histograma():
+    with _histograma_lock:
+        _histograma.clear()
+
+
+# ============================================
+# REGISTRO
+# ============================================
+def registrar(request, response, medicion, segundos_respuesta):
+    """Escribe la línea JSON de la petición y la suma al histograma"""
+    coincidencia = getattr(request, 'resolver_match', None)
+    vista = coincidencia.view_name if coincidencia else SIN_VISTA
+    limites = presupuesto(vista)
+    excede = excedidos(medicion, limites)
+    _sumar_histograma(vista, medicion, bool(excede))
+
+    nivel = logging.WARNING if excede else logging.INFO
+    if not logger.isEnabledFor(nivel):
+        return
+    registro = {
+        'evento': EVENTO,
+        'fecha': timezone.now().isoformat(),
+        'vista': vista,
+        'metodo': request.method,
+        'ruta': request.path,
+        'estado': response.status_code,
+        'consultas': medicion.consultas,
+        'ms_sql': round(medicion.ms, 2),
+        'ms_respuesta': round(segundos_respuesta * 1000, 2),
+        'duplicadas': medicion.duplicadas,
+        'max_repeticiones': medicion.max_repeticiones,
+        'excede': excede,
+    }
+    if excede or settings.SQL_INSTRUMENTACION_DETALLE:
+        registro['presupuesto'] = limites
+        registro['lentas'] = medicion.lentas()
+        registro['repetidas'] = medicion.repetidas(settings.SQL_REPETIDAS_MINIMO)
+    logger.log(nivel, json.dumps(registro, ensure_ascii=False))
+
+
+class InstrumentacionSQLMiddleware:
+    """Mide las consultas SQL de cada petición (ver el docstring del módulo)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SQL_INSTRUMENTACION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        medicion = MedicionSQL(settings.SQL_LENTAS)
+        inicio = time.perf_counter()
+        with medicion.activa():
+            response = self.get_response(request)
+        registrar(request, response, medicion, time.perf_counter() - inicio)
+        return response
+
+    async def __acall__(self, request):
+        medicion = MedicionSQL(settings.SQL_LENTAS)
+        inicio = time.perf_counter()
+        # Las conexiones son por hilo: el wrapper se instala en el hilo donde
+        # el ORM async ejecuta las consultas de esta petición (sync_to_async)
+        pila = await sync_to_async(medicion.activa)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(pila.close)()
+        registrar(request, response, medicion, time.perf_counter() - inicio)
+        return response
+
+
+# ============================================
+# INFORME (manage.py informe_sql)
+# ============================================
+def leer_registros(lineas):
+    """Registros de peticiones de un log; el JSON puede venir después de un prefijo (fecha, nivel)"""
+    for linea in lineas:
+        inicio = linea.find('{')
+        if inicio == -1:
+            continue
+        try:
+            registro = json.loads(linea[inicio:])
+        except ValueError:
+            continue
+        if isinstance(registro, dict) and registro.get('evento') == EVENTO:
+            yield registro
+
+
+def resumir(registros, vista=None):
+    """
+    Vista -> peticiones, excedidas, consultas y ms_sql (p50, p95, máx.),
+    ms_respuesta p95, duplicadas y las sentencias repetidas con su máximo
+    de repeticiones en una petición. Ordenado por tiempo SQL total.
+    """
+    por_vista = {}
+    for registro in registros:
+        if vista and registro['vista'] != vista:
+            continue
+        datos = por_vista.setdefault(registro['vista'], {
+            'consultas': [], 'ms_sql': [], 'ms_respuesta': [], 'excedidas': 0, 'duplicadas': 0, 'repetidas': Counter(),
+        })
+        datos['consultas'].append(registro['consultas'])
+        datos['ms_sql'].append(registro['ms_sql'])
+        datos['ms_respuesta'].append(registro['ms_respuesta'])
+        datos['excedidas'] += bool(registro['excede'])
+        datos['duplicadas'] += registro['duplicadas']
+        for repetida in registro.get('repetidas', []):
+            if repetida['veces'] > datos['repetidas'][repetida['sql']]:
+                datos['repetidas'][repetida['sql']] = repetida['veces']
+
+    resumen = {}
+    for nombre, datos in sorted(por_vista.items(), key=lambda item: -sum(item[1]['ms_sql'])):
+        resumen[nombre] = {
+            'peticiones': len(datos['consultas']),
+            'excedidas': datos['excedidas'],
+            'consultas': _percentiles(datos['consultas']),
+            'ms_sql': _percentiles(datos['ms_sql']),
+            'ms_sql_total': round(sum(datos['ms_sql']), 2),
+            'ms_respuesta_p95': _percentil(sorted(datos['ms_respuesta']), 95),
+            'duplicadas': datos['duplicadas'],
+            'repetidas': [{'sql': sql, 'veces': veces} for sql, veces in datos['repetidas'].most_common(5)],
+        }
+    return resumen
+
+
+def _percentiles(valores):
+    ordenados = sorted(valores)
+    return {'p50': _percentil(ordenados, 50), 'p95': _percentil(ordenados, 95), 'max': ordenados[-1]}
+
+
+def _percentil(ordenados, percentil):
+    """Percentil por rango más cercano"""
+    posicion = max(-(-len(ordenados) * percentil // 100) - 1, 0)
+    return ordenados[posicion]
@@ -0,0 +1,266 @@
+"""
+Lectura de CSV DJ1948 (FACTORES / MONTOS) sobre un mmap del archivo.
+
+Es el camino de las cargas masivas para archivos CSV en disco: los
+registros se separan buscando saltos de línea y delimitadores directamente
+en el buffer mapeado, y los factores (o montos) pasan de bytes a enteros
+escalados con aritmética entera, sin crear Decimal ni textos intermedios.
+Solo las columnas base se decodifican y usan los conversores de
+formato_dj1948.
+
+Los registros con comillas se separan con csv y los números con otra forma
+(exponentes, más decimales de los permitidos, texto inválido) se convierten
+con Decimal como en convertir_fila: valores, numeración y mensajes de error
+son los mismos que con formato_dj1948.leer_filas.
+
+La memoria no depende del tamaño del archivo: las filas se consumen por
+lotes y las páginas del mmap ya recorridas se liberan (MADV_DONTNEED) cada
+TAMANO_LIBERAR bytes.
+"""
+import csv
+import mmap
+import os
+import re
+from decimal import Decimal
+from pathlib import Path
+
+from . import formato_dj1948
+from .formato_dj1948 import (
+    CAMPOS_FACTOR,
+    CERO_FACTOR,
+    COLUMNAS_BASE,
+    COLUMNAS_MONTO,
+    CUANTO_FACTOR,
+    CUANTO_MONTO,
+    DECIMALES_FACTOR,
+    DECIMALES_MONTO,
+    ERROR_VALOR_HISTORICO,
+    ErrorFila,
+    factor_a_escalado,
+)
+
+EXTENSIONES_XLSX = ('.xlsx', '.xlsm')
+# Cada cuántos bytes leídos se liberan las páginas del mmap: memoria constante
+TAMANO_LIBERAR = 16 * 1024 * 1024
+# Dígitos enteros que se convierten sin Decimal (con 8 decimales quedan en la precisión de Decimal)
+MAX_DIGITOS_ENTEROS = 20
+
+
+def _numero_simple(decimales):
+    return re.compile(rf'\d{{1,{MAX_DIGITOS_ENTEROS}}}(?:\.\d{{0,{decimales}}})?|\.\d{{1,{decimales}}}'.encode())
+
+
+# Número simple de una celda: dígitos[.dígitos] (ver escalados_simples)
+NUMEROS_SIMPLES = {decimales: _numero_simple(decimales) for decimales in (DECIMALES_FACTOR, DECIMALES_MONTO)}
+
+
+def aplicable(archivo, nombre_archivo):
+    """Solo los CSV que están en disco (ruta) se leen con mmap"""
+    return (
+        isinstance(archivo, (str, Path))
+        and Path(nombre_archivo).suffix.lower() not in EXTENSIONES_XLSX
+    )
+
+
+def encoding_datos(encoding):
+    """La marca BOM solo puede estar al inicio del archivo"""
+    return 'utf-8' if encoding.lower() == 'utf-8-sig' else encoding
+
+
+# ============================================
+# REGISTROS
+# ============================================
+def leer_filas(ruta, tipo_carga, encoding='utf-8-sig'):
+    """
+    Genera tuplas (numero_fila, fila) como formato_dj1948.leer_filas, con
+    las filas en la forma que recibe convertir_lote.
+    """
+    with open(ruta, 'rb') as archivo:
+        if not os.fstat(archivo.fileno()).st_size:
+            formato_dj1948.cabecera_csv('', tipo_carga)
+            return
+        with mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            fin_cabecera = mapa.find(b'\n') + 1 or len(mapa)
+            columnas, delimitador = formato_dj1948.cabecera_csv(mapa[:fin_cabecera].decode(encoding), tipo_carga)
+            registros = leer_registros(
+                mapa, fin_cabecera, len(mapa), columnas, delimitador, tipo_carga, encoding_datos(encoding)
+            )
+            for indice, fila in registros:
+                if fila is not None:
+                    yield indice + 2, fila
+
+
+def leer_registros(mapa, inicio, fin, columnas, delimitador, tipo_carga, encoding):
+    """
+    Tuplas (indice, fila) de los registros entre `inicio` y `fin`, con el
+    índice contado desde 0. Los registros vacíos vienen con fila None: no
+    se cargan pero cuentan para la numeración.
+
+    Cada fila es (textos de COLUMNAS_BASE, bytes de los factores o montos).
+    """
+    columnas_factor = COLUMNAS_MONTO if tipo_carga == 'MONTOS' else CAMPOS_FACTOR
+    posiciones = {columna: i for i, columna in enumerate(columnas)}
+    indices_base = [posiciones.get(columna) for columna in COLUMNAS_BASE]
+    indices_factor = [posiciones.get(columna) for columna in columnas_factor]
+    separador = delimitador.encode(encoding)
+
+    indice = 0
+    posicion = inicio
+    liberado = inicio - inicio % mmap.PAGESIZE
+    while posicion < fin:
+        if posicion - liberado >= TAMANO_LIBERAR:
+            liberado = _liberar(mapa, liberado, posicion)
+        siguiente = _fin_de_linea(mapa, posicion, fin)
+        linea = mapa[posicion:siguiente]
+        if b'"' in linea:
+            # Con comillas decide csv dónde termina el registro (un campo puede seguir en otras líneas)
+            final = [siguiente]
+            valores = next(csv.reader(_lineas(mapa, posicion, fin, encoding, final), delimiter=delimitador), [])
+            campos = [valor.encode(encoding) for valor in valores]
+            siguiente = final[0]
+        else:
+            campos = linea.rstrip(b'\r\n').split(separador)
+        posicion = siguiente
+
+        if any(campos):
+            cantidad = len(campos)
+            base = [
+                campos[i].decode(encoding) if i is not None and i < cantidad else ''
+                for i in indices_base
+            ]
+            factores = [campos[i] if i is not None and i < cantidad else b'' for i in indices_factor]
+            yield indice, (base, factores)
+        else:
+            yield indice, None
+        indice += 1
+
+
+def fin_de_registro(mapa, posicion, fin, delimitador, encoding):
+    """Dónde termina el registro que empieza en `posicion`, decidido por csv como en leer_registros"""
+    final = [posicion]
+    next(csv.reader(_lineas(mapa, posicion, fin, encoding, final), delimiter=delimitador), None)
+    return final[0]
+
+
+def _lineas(mapa, posicion, fin, encoding, final):
+    """Líneas desde `posicion` a medida que csv las pide; `final` guarda dónde termina la última"""
+    while posicion < fin:
+        siguiente = _fin_de_linea(mapa, posicion, fin)
+        final[0] = siguiente
+        yield mapa[posicion:siguiente].decode(encoding)
+        posicion = siguiente
+
+
+def _liberar(mapa, desde, hasta):
+    """Descarta del proceso las páginas ya leídas (siguen en el caché del sistema)"""
+    hasta -= hasta % mmap.PAGESIZE
+    if hasattr(mmap, 'MADV_DONTNEED'):
+        mapa.madvise(mmap.MADV_DONTNEED, desde, hasta - desde)
+    return hasta
+
+
+def _fin_de_linea(mapa, posicion, fin):
+    salto = mapa.find(b'\n', posicion, fin)
+    return fin if salto == -1 else salto + 1
+
+
+# ============================================
+# CONVERSIÓN
+# ============================================
+def convertir_lote(lote, tipo_carga, encoding='utf-8'):
+    """
+    Filas (numero, fila) de leer_filas -> (numero, valores, error), con los
+    valores del modelo y `factores` ya escalado (ver conversion.validar_convertidas).
+    """
+    convertidas = []
+    for numero, (base, factores) in lote:
+        try:
+            valores = formato_dj1948.convertir_base(dict(zip(COLUMNAS_BASE, base)))
+            if tipo_carga == 'MONTOS':
+                valores['factores'] = _factores_desde_montos(factores, valores['valor_historico'], encoding)
+            else:
+                escalados = escalados_simples(factores, DECIMALES_FACTOR)
+                valores['factores'] = [
+                    _factor(texto, campo, encoding) if escalado is None else escalado
+                    for texto, campo, escalado in zip(factores, CAMPOS_FACTOR, escalados)
+                ]
+        except ErrorFila as exc:
+            convertidas.append((numero, None, str(exc)))
+            continue
+        convertidas.append((numero, valores, None))
+    return convertidas
+
+
+def _factor(texto, campo, encoding):
+    escalado = escalado_desde_bytes(texto, DECIMALES_FACTOR)
+    if escalado is None:
+        fila = {campo: texto.decode(encoding)}
+        escalado = factor_a_escalado(formato_dj1948._decimal(fila, campo, CUANTO_FACTOR, CERO_FACTOR))
+    return escalado
+
+
+def _factores_desde_montos(montos, valor_historico, encoding):
+    """Factor N = monto N / valor histórico, redondeado a 8 decimales (igual que convertir_fila)"""
+    if not valor_historico:
+        raise ErrorFila(ERROR_VALOR_HISTORICO)
+    # monto / valor_historico con ambos escalados por 100: el mismo cociente exacto
+    divisor = valor_historico.scaleb(DECIMALES_MONTO)
+    factores = []
+    for texto, columna, monto in zip(montos, COLUMNAS_MONTO, escalados_simples(montos, DECIMALES_MONTO)):
+        if monto is None:
+            monto = escalado_desde_bytes(texto, DECIMALES_MONTO)
+        if monto is None:
+            fila = {columna: texto.decode(encoding)}
+            monto = formato_dj1948._decimal(fila, columna, CUANTO_MONTO, Decimal('0.00')).scaleb(DECIMALES_MONTO)
+        if not monto:
+            factores.append(0)
+            continue
+        factores.append(factor_a_escalado((Decimal(monto) / divisor).quantize(CUANTO_FACTOR)))
+    return factores
+
+
+def escalados_simples(textos, decimales):
+    """
+    Enteros escalados de los números de la fila con la forma simple
+    dígitos[.dígitos] (o vacíos), como los que genera la exportación. Cada
+    celda se verifica por separado; las que tienen otra forma quedan en
+    None y se convierten una por una.
+    """
+    numero_simple = NUMEROS_SIMPLES[decimales].fullmatch
+    escala = 10 ** decimales
+    escalados = []
+    for texto in textos:
+        if not texto:
+            escalados.append(0)
+        elif numero_simple(texto) is None:
+            escalados.append(None)
+        else:
+            enteros, _, fraccion = texto.partition(b'.')
+            escalados.append(
+                int(enteros or b'0') * escala
+                + (int(fraccion) * 10 ** (decimales - len(fraccion)) if fraccion else 0)
+            )
+    return escalados
+
+
+def escalado_desde_bytes(texto, decimales):
+    """
+    Número en bytes con la forma [signo]enteros[. o ,]decimales -> entero
+    escalado por 10**decimales. Vacío es 0. Devuelve None si el texto tiene
+    otra forma o más decimales: esos casos se convierten con Decimal.
+    """
+    texto = texto.strip()
+    if not texto:
+        return 0
+    negativo = texto[:1] == b'-'
+    if negativo or texto[:1] == b'+':
+        texto = texto[1:]
+    separador = b'.' if b'.' in texto else b','
+    enteros, _, fraccion = texto.partition(separador)
+    if len(fraccion) > decimales or len(enteros) > MAX_DIGITOS_ENTEROS or not (enteros or fraccion):
+        return None
+    if (enteros and not enteros.isdigit()) or (fraccion and not fraccion.isdigit()):
+        return None
+    escalado = int(enteros or b'0') * 10 ** decimales + int(fraccion.ljust(decimales, b'0'))
+    return -escalado if negativo else escalado
+
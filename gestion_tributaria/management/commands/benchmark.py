@@ -0,0 +1,258 @@
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+from itertools import islice
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from gestion_tributaria import carga_masiva, conversion, datos_sinteticos, ejercicios, exportacion, lectura_mmap
+from gestion_tributaria.instrumentacion import MedicionSQL
+from gestion_tributaria.models import CalificacionTributaria, CargaMasiva, LogOperacion
+
+BENCHMARKS = (
+    'carga_masiva', 'validacion', 'admin_listado', 'admin_busqueda', 'admin_filtro',
+    'admin_logs', 'api_filtro', 'exportacion',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide carga masiva, validación, listados y búsqueda del admin, filtros de la API y exportación '
+        'contra la base configurada; el resultado en JSON sirve para comparar corridas'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', help='Superusuario para el admin y la API (por defecto el primero)')
+        parser.add_argument('--ejercicio', type=int, help='Ejercicio de filtros, carga y exportación (por defecto el último)')
+        parser.add_argument('--mercado', default='ACN', help='Mercado de los filtros')
+        parser.add_argument('--busqueda', default='CHILE', help='Texto de la búsqueda del admin')
+        parser.add_argument('--repeticiones', type=int, default=5, help='Repeticiones medidas de cada benchmark')
+        parser.add_argument('--calentamiento', type=int, default=1, help='Repeticiones previas que no se miden')
+        parser.add_argument('--filas-carga', type=int, default=20000, help='Filas del CSV de carga y validación')
+        parser.add_argument('--solo', help=f'Benchmarks separados por coma ({", ".join(BENCHMARKS)})')
+        parser.add_argument('--salida', metavar='ARCHIVO', help='Guardar el resultado en JSON')
+        parser.add_argument('--comparar', metavar='ARCHIVO', help='Resultado JSON anterior con el que comparar')
+        parser.add_argument(
+            '--tolerancia', type=float, default=0.2,
+            help='Con --comparar, falla si una mediana sube más que esta fracción (0.2 = 20%%)',
+        )
+        parser.add_argument('--json', action='store_true', help='Salida en JSON')
+
+    def handle(self, *args, **options):
+        nombres = options['solo'].split(',') if options['solo'] else list(BENCHMARKS)
+        desconocidos = sorted(set(nombres) - set(BENCHMARKS))
+        if desconocidos:
+            raise CommandError(f'Benchmarks desconocidos: {", ".join(desconocidos)}')
+        anterior = self._leer(options['comparar']) if options['comparar'] else None
+
+        self.usuario = self._usuario(options['usuario'])
+        self.ejercicio = options['ejercicio'] or CalificacionTributaria.objects.aggregate(
+            ultimo=Max('ejercicio'),
+        )['ultimo'] or timezone.now().year
+        self.options = options
+        self.cliente = Client()
+        self.cliente.force_login(self.usuario)
+
+        resultados = {}
+        with tempfile.TemporaryDirectory() as directorio, override_settings(ALLOWED_HOSTS=['testserver']):
+            self.csv = os.path.join(directorio, f'benchmark_{self.ejercicio}.csv')
+            if {'carga_masiva', 'validacion'} & set(nombres):
+                if ejercicios.esta_cerrado(self.ejercicio):
+                    raise CommandError(f'El ejercicio {self.ejercicio} está cerrado: indicar otro con --ejercicio')
+                datos_sinteticos.escribir_csv(
+                    self.csv, options['filas_carga'], [self.ejercicio],
+                    secuencia_inicial=datos_sinteticos.siguiente_secuencia(),
+                )
+            for nombre in nombres:
+                if options['verbosity'] > 1:
+                    self.stderr.write(f'{nombre}...')
+                resultados[nombre] = self._medir(getattr(self, f'_{nombre}'))
+
+        resultado = {'entorno': self._entorno(), 'benchmarks': resultados}
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+        comparacion = self._comparar(anterior, resultados) if anterior else None
+        if comparacion is not None:
+            resultado['comparacion'] = comparacion
+
+        if options['json']:
+            self.stdout.write(json.dumps(resultado, indent=2, ensure_ascii=False))
+        else:
+            self._imprimir(resultados, comparacion)
+
+        regresiones = [nombre for nombre, datos in (comparacion or {}).items() if datos['regresion']]
+        if regresiones:
+            raise CommandError(f'Regresiones sobre la tolerancia: {", ".join(regresiones)}')
+
+    # ============================================
+    # MEDICIÓN
+    # ============================================
+    def _medir(self, benchmark):
+        """Ejecuta `benchmark` (devuelve las filas procesadas) y resume sus tiempos"""
+        for _ in range(self.options['calentamiento']):
+            benchmark()
+        tiempos, consultas = [], []
+        filas = 0
+        for _ in range(self.options['repeticiones']):
+            medicion = MedicionSQL()
+            inicio = time.perf_counter()
+            with medicion.activa():
+                filas = benchmark()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            consultas.append(medicion.consultas)
+        mediana = statistics.median(tiempos)
+        return {
+            'repeticiones': len(tiempos),
+            'min_ms': round(min(tiempos), 2),
+            'mediana_ms': round(mediana, 2),
+            'max_ms': round(max(tiempos), 2),
+            'consultas': statistics.median_low(consultas),
+            'filas': filas,
+            'filas_s': round(filas / mediana * 1000) if filas and mediana else None,
+        }
+
+    def _carga_masiva(self):
+        # Cada repetición se deshace: la tabla no crece entre corridas
+        with transaction.atomic():
+            carga = CargaMasiva.objects.create(
+                usuario=self.usuario, tipo_carga='FACTORES', nombre_archivo=os.path.basename(self.csv),
+            )
+            carga = carga_masiva.procesar_carga(carga, self.csv)
+            if carga.registros_fallidos:
+                raise CommandError(f'La carga de prueba tuvo {carga.registros_fallidos} filas con error')
+            transaction.set_rollback(True)
+        return carga.registros_exitosos
+
+    def _validacion(self):
+        filas = lectura_mmap.leer_filas(self.csv, 'FACTORES')
+        validas = 0
+        while lote := list(islice(filas, carga_masiva.TAMANO_LOTE)):
+            convertidas = conversion.validar_convertidas(lectura_mmap.convertir_lote(lote, 'FACTORES'))
+            validas += sum(error is None for *_, error in convertidas)
+        return validas
+
+    def _admin_listado(self):
+        return self._pedir(reverse('admin:gestion_tributaria_calificaciontributaria_changelist'))
+
+    def _admin_busqueda(self):
+        return self._pedir(
+            reverse('admin:gestion_tributaria_calificaciontributaria_changelist'), {'q': self.options['busqueda']},
+        )
+
+    def _admin_filtro(self):
+        return self._pedir(
+            reverse('admin:gestion_tributaria_calificaciontributaria_changelist'),
+            {'ejercicio': self.ejercicio, 'mercado__exact': self.options['mercado']},
+        )
+
+    def _admin_logs(self):
+        return self._pedir(reverse('admin:gestion_tributaria_logoperacion_changelist'))
+
+    def _api_filtro(self):
+        respuesta = self.cliente.get(
+            reverse('gestion_tributaria:calificaciones'),
+            {'ejercicio': self.ejercicio, 'mercado': self.options['mercado'], 'limite': 1000},
+        )
+        if respuesta.status_code != 200:
+            raise CommandError(f'La API respondió {respuesta.status_code}')
+        return len(respuesta.json()['resultados'])
+
+    def _exportacion(self):
+        lineas = 0
+        for bloque in exportacion.generar_csv(CalificacionTributaria.objects.filter(ejercicio=self.ejercicio)):
+            lineas += bloque.count(b'\n')
+        return lineas - 1
+
+    def _pedir(self, url, parametros=None):
+        respuesta = self.cliente.get(url, parametros)
+        if respuesta.status_code != 200:
+            raise CommandError(f'{url} respondió {respuesta.status_code}')
+        # Filas del listado: la primera columna de cada fila es un <th class="field-...">
+        return respuesta.content.count(b'<th class="field-')
+
+    # ============================================
+    # RESULTADO
+    # ============================================
+    def _usuario(self, nombre):
+        if nombre:
+            usuario = User.objects.filter(username=nombre, is_superuser=True).first()
+            if usuario is None:
+                raise CommandError(f'No existe el superusuario {nombre}')
+            return usuario
+        usuario = User.objects.filter(is_superuser=True, is_active=True).order_by('pk').first()
+        if usuario is None:
+            raise CommandError('No hay superusuarios: indicar --usuario')
+        return usuario
+
+    def _entorno(self):
+        return {
+            'fecha': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'base': connection.vendor,
+            'version_base': getattr(connection, 'pg_version', None),
+            'cpus': os.cpu_count(),
+            'ejercicio': self.ejercicio,
+            'parametros': {
+                clave: self.options[clave]
+                for clave in ('repeticiones', 'calentamiento', 'filas_carga', 'mercado', 'busqueda')
+            },
+            'filas': {
+                'calificaciones': CalificacionTributaria.objects.count(),
+                'calificaciones_ejercicio': CalificacionTributaria.objects.filter(ejercicio=self.ejercicio).count(),
+                'cargas': CargaMasiva.objects.count(),
+                'logs': LogOperacion.objects.count(),
+                'corredores': CalificacionTributaria.objects.order_by().values('usuario').distinct().count(),
+            },
+        }
+
+    def _leer(self, ruta):
+        try:
+            with open(ruta, encoding='utf-8') as archivo:
+                return json.load(archivo)['benchmarks']
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f'No se pudo leer {ruta}: {exc}')
+
+    def _comparar(self, anterior, resultados):
+        """Benchmark -> medianas, variación y si supera la tolerancia"""
+        comparacion = {}
+        for nombre, datos in resultados.items():
+            if nombre not in anterior or not anterior[nombre]['mediana_ms']:
+                continue
+            variacion = datos['mediana_ms'] / anterior[nombre]['mediana_ms'] - 1
+            comparacion[nombre] = {
+                'mediana_ms_anterior': anterior[nombre]['mediana_ms'],
+                'mediana_ms': datos['mediana_ms'],
+                'variacion': round(variacion, 4),
+                'regresion': variacion > self.options['tolerancia'],
+            }
+        return comparacion
+
+    def _imprimir(self, resultados, comparacion):
+        self.stdout.write(
+            f'{"benchmark":<16} {"mín. ms":>10} {"mediana ms":>11} {"máx. ms":>10} '
+            f'{"consultas":>10} {"filas":>8} {"filas/s":>10}{"  vs. anterior" if comparacion else ""}'
+        )
+        for nombre, datos in resultados.items():
+            linea = (
+                f'{nombre:<16} {datos["min_ms"]:>10.1f} {datos["mediana_ms"]:>11.1f} {datos["max_ms"]:>10.1f} '
+                f'{datos["consultas"]:>10} {datos["filas"]:>8} {datos["filas_s"] or "-":>10}'
+            )
+            estilo = str
+            if comparacion and nombre in comparacion:
+                linea += f'  {comparacion[nombre]["variacion"]:+.1%}'
+                if comparacion[nombre]['regresion']:
+                    estilo = self.style.WARNING
+            self.stdout.write(estilo(linea))
@@ -0,0 +1,76 @@
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from gestion_tributaria.models import CargaMasiva
+from gestion_tributaria.trabajos import ejecutar_carga
+
+
+class Command(BaseCommand):
+    help = 'Carga un archivo DJ1948 (CSV o XLSX) como calificaciones tributarias'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ruta', help='Ruta del archivo CSV o XLSX')
+        parser.add_argument('--usuario', required=True, help='Username del corredor dueño de la carga')
+        parser.add_argument(
+            '--tipo',
+            choices=[valor for valor, _ in CargaMasiva.TIPO_CHOICES],
+            default='FACTORES',
+        )
+        parser.add_argument(
+            '--modo',
+            choices=[valor for valor, _ in CargaMasiva.MODO_CHOICES],
+            default='INSERTAR',
+            help='UPSERT actualiza las calificaciones existentes en vez de rechazarlas',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            help='Filas por transacción (por defecto CARGA_MASIVA_TAMANO_LOTE); también para las cargas encoladas',
+        )
+        parser.add_argument(
+            '--encolar',
+            action='store_true',
+            help='Dejar la carga PENDIENTE para el worker (procesar_cargas) en vez de procesarla aquí',
+        )
+
+    def handle(self, *args, **options):
+        ruta = Path(options['ruta'])
+        if not ruta.is_file():
+            raise CommandError(f'No existe el archivo {ruta}')
+        try:
+            usuario = User.objects.get(username=options['usuario'])
+        except User.DoesNotExist:
+            raise CommandError(f'No existe el usuario {options["usuario"]}')
+        if options['lote'] is not None and options['lote'] < 1:
+            raise CommandError('--lote debe ser mayor que 0')
+
+        carga = CargaMasiva(
+            usuario=usuario,
+            tipo_carga=options['tipo'],
+            modo=options['modo'],
+            nombre_archivo=ruta.name,
+            tamano_lote=options['lote'],
+        )
+        if options['encolar']:
+            with open(ruta, 'rb') as archivo:
+                carga.archivo.save(ruta.name, File(archivo), save=False)
+            carga.save()
+            self.stdout.write(self.style.SUCCESS(f'Carga {carga.pk} encolada'))
+            return
+
+        carga.estado = 'PROCESANDO'
+        carga.fecha_inicio = timezone.now()
+        carga.save()
+        carga = ejecutar_carga(carga, archivo=ruta)
+
+        estilo = self.style.SUCCESS if carga.estado == 'COMPLETADA' else self.style.ERROR
+        self.stdout.write(estilo(
+            f'Carga {carga.pk} {carga.get_estado_display()}: {carga.registros_procesados} procesados, '
+            f'{carga.registros_exitosos} exitosos ({carga.registros_insertados} insertados, '
+            f'{carga.registros_actualizados} actualizados, {carga.registros_sin_cambios} sin cambios), '
+            f'{carga.registros_fallidos} fallidos'
+        ))
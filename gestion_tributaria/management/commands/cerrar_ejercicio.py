@@ -0,0 +1,41 @@
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_tributaria import ejercicios
+
+
+class Command(BaseCommand):
+    help = 'Mueve las calificaciones de un ejercicio a una partición de solo lectura (o la reabre)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ejercicio', type=int, help='Año comercial')
+        parser.add_argument('--reabrir', action='store_true', help='Devolver el ejercicio a la partición abierta')
+        parser.add_argument('--usuario', help='Usuario que cierra el ejercicio (queda en EjercicioCerrado)')
+
+    def handle(self, *args, **options):
+        if not ejercicios.disponible():
+            raise CommandError('Las particiones por ejercicio requieren PostgreSQL')
+
+        ejercicio = options['ejercicio']
+        try:
+            if options['reabrir']:
+                registros = ejercicios.reabrir(ejercicio)
+                self.stdout.write(self.style.SUCCESS(
+                    f'Ejercicio {ejercicio} reabierto: {registros} calificaciones en {ejercicios.PARTICION_ABIERTA}'
+                ))
+                return
+
+            usuario_id = None
+            if options['usuario']:
+                usuario_id = User.objects.filter(username=options['usuario']).values_list('pk', flat=True).first()
+                if usuario_id is None:
+                    raise CommandError(f"No existe el usuario '{options['usuario']}'")
+            cierre = ejercicios.cerrar(ejercicio, usuario_id)
+        except ValidationError as exc:
+            raise CommandError(' '.join(exc.messages))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Ejercicio {ejercicio} cerrado: {cierre.registros} calificaciones en '
+            f'{ejercicios.nombre_particion(ejercicio)} (solo lectura)'
+        ))
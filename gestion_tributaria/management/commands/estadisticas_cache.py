@@ -0,0 +1,24 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_tributaria import cache_calificaciones
+
+
+class Command(BaseCommand):
+    help = 'Muestra aciertos y fallos del caché de calificaciones por evento (todos los procesos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reiniciar', action='store_true', help='Poner los contadores en cero después de mostrarlos')
+
+    def handle(self, *args, **options):
+        if not cache_calificaciones.cache_compartido():
+            raise CommandError(
+                f"Con {settings.CACHES['default']['BACKEND']} cada proceso tiene sus contadores y este "
+                'comando solo vería los suyos (ceros): configurar un caché compartido (CACHE_BACKEND)'
+            )
+        self.stdout.write(json.dumps(cache_calificaciones.estadisticas(), indent=2))
+        if options['reiniciar']:
+            cache_calificaciones.reiniciar_estadisticas()
+            self.stdout.write(self.style.SUCCESS('Contadores reiniciados'))
@@ -0,0 +1,51 @@
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_tributaria import exportacion
+from gestion_tributaria.models import CalificacionTributaria
+
+
+class Command(BaseCommand):
+    help = 'Exporta las calificaciones de un ejercicio en formato DJ1948 (CSV, CSV.GZ o XLSX)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ruta', help='Archivo de salida; el formato sale de la extensión (.csv, .csv.gz, .xlsx)')
+        parser.add_argument('--ejercicio', type=int, required=True)
+        parser.add_argument('--usuario', help='Username del corredor (por defecto, todos)')
+        parser.add_argument(
+            '--mercado',
+            choices=[valor for valor, _ in CalificacionTributaria.MERCADO_CHOICES],
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=exportacion.TAMANO_CHUNK,
+            help='Filas leídas por cada viaje al cursor de la base de datos',
+        )
+
+    def handle(self, *args, **options):
+        ruta = Path(options['ruta'])
+        queryset = CalificacionTributaria.objects.filter(ejercicio=options['ejercicio'])
+        if options['usuario']:
+            try:
+                queryset = queryset.filter(usuario=User.objects.get(username=options['usuario']))
+            except User.DoesNotExist:
+                raise CommandError(f'No existe el usuario {options["usuario"]}')
+        if options['mercado']:
+            queryset = queryset.filter(mercado=options['mercado'])
+
+        sufijos = [sufijo.lower() for sufijo in ruta.suffixes]
+        if sufijos[-1:] == ['.xlsx']:
+            try:
+                bloques = exportacion.generar_xlsx(queryset, options['chunk_size'])
+            except exportacion.ErrorExportacion as exc:
+                raise CommandError(str(exc))
+        else:
+            bloques = exportacion.generar_csv(queryset, sufijos[-1:] == ['.gz'], options['chunk_size'])
+        with open(ruta, 'wb') as archivo:
+            for bloque in bloques:
+                archivo.write(bloque)
+
+        self.stdout.write(self.style.SUCCESS(f'Exportación escrita en {ruta}'))
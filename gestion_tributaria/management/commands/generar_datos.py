@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_tributaria import datos_sinteticos
+
+
+def _ejercicios(texto):
+    """'2015-2024' o '2022,2023,2024'"""
+    if '-' in texto:
+        desde, hasta = texto.split('-', 1)
+        return list(range(int(desde), int(hasta) + 1))
+    return [int(ejercicio) for ejercicio in texto.split(',')]
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera calificaciones DJ1948 sintéticas (corredores sinteticoNNNN, cargas y logs) '
+        'en la base, o un CSV FACTORES para cargar_dj1948'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calificaciones', type=int, default=100000, help='Calificaciones a generar')
+        parser.add_argument('--corredores', type=int, default=50, help='Corredores sintéticos')
+        parser.add_argument('--logs', type=int, default=0, help='Logs UPDATE adicionales (aprox.)')
+        parser.add_argument('--ejercicios', default='2015-2024', help="Años: '2015-2024' o '2023,2024'")
+        parser.add_argument('--semilla', type=int, default=0, help='Misma semilla, mismos datos')
+        parser.add_argument('--lote', type=int, default=datos_sinteticos.TAMANO_LOTE, help='Filas por INSERT')
+        parser.add_argument('--csv', metavar='RUTA', help='Escribir un CSV FACTORES en vez de la base')
+
+    def handle(self, *args, **options):
+        try:
+            ejercicios = _ejercicios(options['ejercicios'])
+        except ValueError:
+            raise CommandError(f"Ejercicios inválidos: {options['ejercicios']}")
+        inicio = time.perf_counter()
+
+        if options['csv']:
+            datos_sinteticos.escribir_csv(
+                options['csv'], options['calificaciones'], ejercicios, options['semilla'],
+                datos_sinteticos.siguiente_secuencia(),
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"{options['calificaciones']} calificaciones en {options['csv']} "
+                f'({time.perf_counter() - inicio:.1f} s)'
+            ))
+            return
+
+        def progreso(insertadas):
+            segundos = time.perf_counter() - inicio
+            self.stdout.write(f'  {insertadas} calificaciones ({insertadas / segundos:.0f} filas/s)')
+
+        try:
+            creados = datos_sinteticos.poblar(
+                options['calificaciones'], options['corredores'], ejercicios, options['logs'],
+                options['semilla'], options['lote'], progreso if options['verbosity'] > 1 else None,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"{creados['calificaciones']} calificaciones, {creados['cargas']} cargas y {creados['logs']} logs "
+            f"de {creados['corredores']} corredores ({time.perf_counter() - inicio:.1f} s)"
+        ))
@@ -0,0 +1,45 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_tributaria import instrumentacion
+
+
+class Command(BaseCommand):
+    help = 'Resume por vista las consultas SQL registradas por la instrumentación (líneas JSON)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Archivo con las líneas de la instrumentación ('-' = entrada estándar)")
+        parser.add_argument('--vista', help='Solo esta vista (nombre de la URL)')
+        parser.add_argument('--json', action='store_true', help='Resultado en JSON')
+
+    def handle(self, *args, **options):
+        try:
+            archivo = sys.stdin if options['archivo'] == '-' else open(options['archivo'], encoding='utf-8')
+        except OSError as exc:
+            raise CommandError(f'No se pudo abrir {options["archivo"]}: {exc}')
+        with archivo:
+            resumen = instrumentacion.resumir(instrumentacion.leer_registros(archivo), options['vista'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(resumen, indent=2, ensure_ascii=False))
+            return
+        if not resumen:
+            self.stdout.write('Sin peticiones registradas')
+            return
+
+        self.stdout.write(
+            f'{"vista":<60} {"pet.":>6} {"exced.":>6} {"cons. p50/p95/máx":>18} '
+            f'{"ms SQL p50/p95/máx":>22} {"dupl.":>6}'
+        )
+        for vista, datos in resumen.items():
+            consultas = '/'.join(str(datos['consultas'][clave]) for clave in ('p50', 'p95', 'max'))
+            ms = '/'.join(f'{datos["ms_sql"][clave]:.0f}' for clave in ('p50', 'p95', 'max'))
+            estilo = self.style.WARNING if datos['excedidas'] else str
+            self.stdout.write(estilo(
+                f'{vista:<60} {datos["peticiones"]:>6} {datos["excedidas"]:>6} {consultas:>18} '
+                f'{ms:>22} {datos["duplicadas"]:>6}'
+            ))
+            for repetida in datos['repetidas']:
+                self.stdout.write(f'    {repetida["veces"]:>4}x {repetida["sql"]}')
@@ -0,0 +1,89 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la latencia por petición de la API contra la base configurada, '
+        'con cada valor de CONN_MAX_AGE indicado (o con el pool, si está activo)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peticiones', type=int, default=200, help='Peticiones medidas por configuración')
+        parser.add_argument('--calentamiento', type=int, default=10, help='Peticiones previas que no se miden')
+        parser.add_argument(
+            '--conn-max-age',
+            default='0,60',
+            help='Valores de CONN_MAX_AGE a comparar, separados por coma (se ignora con DB_POOL)',
+        )
+        parser.add_argument('--usuario', required=True, help='Usuario con el que se hacen las peticiones')
+        parser.add_argument('--url', help='Ruta a pedir (por defecto /api/calificaciones/?limite=1)')
+        parser.add_argument('--json', action='store_true', help='Salida en JSON')
+
+    def handle(self, *args, **options):
+        try:
+            usuario = User.objects.get(username=options['usuario'])
+        except User.DoesNotExist:
+            raise CommandError(f'No existe el usuario {options["usuario"]}')
+        url = options['url'] or f'{reverse("gestion_tributaria:calificaciones")}?limite=1'
+        cliente = Client()
+        cliente.force_login(usuario)
+
+        if connection.settings_dict['OPTIONS'].get('pool'):
+            configuraciones = [('pool', None)]
+        else:
+            configuraciones = [
+                (f'CONN_MAX_AGE={valor}', int(valor)) for valor in options['conn_max_age'].split(',')
+            ]
+
+        resultados = []
+        for nombre, conn_max_age in configuraciones:
+            if conn_max_age is not None:
+                connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+            connection.close()
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                for _ in range(options['calentamiento']):
+                    self._pedir(cliente, url)
+                tiempos = [self._pedir(cliente, url) for _ in range(options['peticiones'])]
+            resultados.append(self._resumen(nombre, tiempos))
+
+        if options['json']:
+            self.stdout.write(json.dumps(resultados, indent=2))
+            return
+        for resultado in resultados:
+            self.stdout.write(
+                f'{resultado["configuracion"]:>18}: media {resultado["media_ms"]:.2f} ms, '
+                f'p50 {resultado["p50_ms"]:.2f} ms, p95 {resultado["p95_ms"]:.2f} ms '
+                f'({resultado["peticiones"]} peticiones)'
+            )
+
+    def _pedir(self, cliente, url):
+        # Client desconecta close_old_connections de las señales de inicio y
+        # fin de petición; aquí se llama como lo hace el handler WSGI/ASGI,
+        # que es donde se cierra o conserva la conexión según CONN_MAX_AGE
+        inicio = time.perf_counter()
+        close_old_connections()
+        respuesta = cliente.get(url)
+        close_old_connections()
+        duracion = time.perf_counter() - inicio
+        if respuesta.status_code != 200:
+            raise CommandError(f'{url} respondió {respuesta.status_code}')
+        return duracion * 1000
+
+    def _resumen(self, nombre, tiempos):
+        percentiles = statistics.quantiles(tiempos, n=100)
+        return {
+            'configuracion': nombre,
+            'peticiones': len(tiempos),
+            'media_ms': statistics.fmean(tiempos),
+            'p50_ms': percentiles[49],
+            'p95_ms': percentiles[94],
+        }
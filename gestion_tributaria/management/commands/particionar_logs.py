@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_tributaria import particiones
+
+
+class Command(BaseCommand):
+    help = 'Crea las particiones mensuales futuras de log_operacion y archiva las vencidas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--meses-futuros',
+            type=int,
+            default=settings.LOG_OPERACION_MESES_FUTUROS,
+            help='Meses siguientes al actual que deben tener partición',
+        )
+        parser.add_argument(
+            '--retener-meses',
+            type=int,
+            default=settings.LOG_OPERACION_RETENCION_MESES,
+            help='Meses completos que se conservan en la base de datos (0 = no archivar)',
+        )
+        parser.add_argument(
+            '--directorio',
+            default=settings.LOG_OPERACION_ARCHIVO_DIR,
+            help='Directorio donde se guardan las particiones archivadas (.csv.gz)',
+        )
+        parser.add_argument('--simular', action='store_true', help='Mostrar lo que se haría sin modificar nada')
+
+    def handle(self, *args, **options):
+        if not particiones.disponible():
+            raise CommandError('El particionamiento de log_operacion requiere PostgreSQL')
+
+        prefijo = '[simulación] ' if options['simular'] else ''
+        for nombre in particiones.crear_particiones(options['meses_futuros'], options['simular']):
+            self.stdout.write(f'{prefijo}Partición creada: {nombre}')
+
+        if options['retener_meses'] > 0:
+            archivos = particiones.archivar_particiones(
+                options['retener_meses'], options['directorio'], options['simular'],
+            )
+            for ruta in archivos:
+                self.stdout.write(f'{prefijo}Partición archivada en {ruta}')
+
+        self.stdout.write(self.style.SUCCESS(f'{prefijo}Particiones de log_operacion al día'))
@@ -0,0 +1,52 @@
+import multiprocessing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _proceso_worker(intervalo, una_vez):
+    # Con el método 'spawn' el proceso hijo parte sin Django inicializado
+    import django
+    django.setup()
+    from gestion_tributaria.trabajos import ejecutar_worker
+    ejecutar_worker(intervalo, una_vez)
+
+
+class Command(BaseCommand):
+    help = 'Procesa en segundo plano las cargas masivas pendientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--procesos',
+            type=int,
+            default=settings.CARGA_MASIVA_PROCESOS,
+            help='Cantidad de procesos worker (cada uno toma una carga a la vez)',
+        )
+        parser.add_argument('--intervalo', type=float, default=5, help='Segundos entre consultas a la cola vacía')
+        parser.add_argument('--una-vez', action='store_true', help='Terminar cuando no queden cargas pendientes')
+
+    def handle(self, *args, **options):
+        procesos = max(options['procesos'], 1)
+        argumentos = (options['intervalo'], options['una_vez'])
+        if procesos == 1:
+            _proceso_worker(*argumentos)
+            return
+
+        # Cada proceso abre su propia conexión: no heredar la del padre
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=_proceso_worker, args=argumentos)
+            for _ in range(procesos)
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'{procesos} workers de cargas iniciados')
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.join()
@@ -0,0 +1,252 @@
+import asyncio
+import io
+import json
+import statistics
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from gestion_tributaria.models import CalificacionTributaria
+
+HOST = 'testserver'
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de carga de la API de lectura: rendimiento y latencia del camino WSGI '
+        '(un hilo por petición concurrente) frente al ASGI (un solo event loop)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', required=True, help='Usuario con el que se hacen las peticiones')
+        parser.add_argument('--peticiones', type=int, default=1000, help='Peticiones por modo')
+        parser.add_argument('--concurrencia', type=int, default=50, help='Peticiones en curso a la vez')
+        parser.add_argument('--modos', default='wsgi,asgi', help='Modos a comparar, separados por coma')
+        parser.add_argument(
+            '--ruta',
+            action='append',
+            dest='rutas',
+            help='Ruta a pedir (se puede repetir); por defecto detalle, evento y cargas de la API',
+        )
+        parser.add_argument(
+            '--servidor',
+            help='URL base de un servidor ya levantado (p. ej. http://127.0.0.1:8000); '
+                 'sin esto los handlers WSGI y ASGI de Django se llaman dentro de este proceso',
+        )
+        parser.add_argument('--json', action='store_true', help='Salida en JSON')
+
+    def handle(self, *args, **options):
+        try:
+            usuario = User.objects.get(username=options['usuario'])
+        except User.DoesNotExist:
+            raise CommandError(f'No existe el usuario {options["usuario"]}')
+        rutas = options['rutas'] or self._rutas_por_defecto(usuario)
+        total, concurrencia = options['peticiones'], max(options['concurrencia'], 1)
+
+        sesion = _crear_sesion(usuario)
+        cookie = f'{settings.SESSION_COOKIE_NAME}={sesion.session_key}'
+        resultados = []
+        try:
+            if options['servidor']:
+                modos = {'servidor': lambda: _con_hilos(_pedir_servidor(options['servidor'], cookie), rutas, total, concurrencia)}
+            else:
+                modos = {
+                    'wsgi': lambda: _con_hilos(_pedir_wsgi(get_wsgi_application(), cookie), rutas, total, concurrencia),
+                    'asgi': lambda: _asgi(cookie, rutas, total, concurrencia),
+                }
+                modos = {nombre: modos[nombre] for nombre in options['modos'].split(',') if nombre in modos}
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, HOST]):
+                for nombre, ejecutar in modos.items():
+                    inicio = time.perf_counter()
+                    mediciones = ejecutar()
+                    resultados.append(_resumen(nombre, mediciones, time.perf_counter() - inicio, concurrencia))
+        finally:
+            sesion.delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps({'rutas': rutas, 'resultados': resultados}, indent=2))
+            return
+        for resultado in resultados:
+            self.stdout.write(
+                f'{resultado["modo"]:>8}: {resultado["peticiones_por_segundo"]:.0f} pet/s, '
+                f'p50 {resultado["p50_ms"]:.1f} ms, p95 {resultado["p95_ms"]:.1f} ms, '
+                f'errores {resultado["errores"]} ({resultado["peticiones"]} peticiones, '
+                f'concurrencia {resultado["concurrencia"]})'
+            )
+
+    def _rutas_por_defecto(self, usuario):
+        calificacion = CalificacionTributaria.objects.visibles_para(usuario.pk, usuario.is_superuser).first()
+        if calificacion is None:
+            raise CommandError('El usuario no tiene calificaciones visibles; indique --ruta')
+        evento = urlencode({
+            'instrumento': calificacion.instrumento,
+            'fecha_pago': calificacion.fecha_pago.isoformat(),
+            'secuencia_evento': calificacion.secuencia_evento,
+        })
+        return [
+            reverse('gestion_tributaria:calificacion', args=[calificacion.pk]),
+            f'{reverse("gestion_tributaria:calificaciones_evento")}?{evento}',
+            reverse('gestion_tributaria:cargas'),
+        ]
+
+
+def _crear_sesion(usuario):
+    """Sesión iniciada como `usuario`, igual a la que deja el login"""
+    sesion = SessionStore()
+    sesion[SESSION_KEY] = str(usuario.pk)
+    sesion[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    sesion[HASH_SESSION_KEY] = usuario.get_session_auth_hash()
+    sesion.create()
+    return sesion
+
+
+def _resumen(modo, mediciones, segundos, concurrencia):
+    tiempos = [duracion for _, duracion in mediciones]
+    percentiles = statistics.quantiles(tiempos, n=100)
+    return {
+        'modo': modo,
+        'peticiones': len(mediciones),
+        'concurrencia': concurrencia,
+        'errores': sum(1 for estado, _ in mediciones if estado != 200),
+        'segundos': segundos,
+        'peticiones_por_segundo': len(mediciones) / segundos,
+        'p50_ms': percentiles[49],
+        'p95_ms': percentiles[94],
+        'max_ms': max(tiempos),
+    }
+
+
+# ============================================
+# WSGI Y SERVIDOR EXTERNO: UN HILO POR PETICIÓN EN CURSO
+# ============================================
+def _con_hilos(pedir, rutas, total, concurrencia):
+    with ThreadPoolExecutor(max_workers=concurrencia) as ejecutor:
+        return list(ejecutor.map(lambda numero: pedir(rutas[numero % len(rutas)]), range(total)))
+
+
+def _pedir_wsgi(aplicacion, cookie):
+    def pedir(ruta):
+        camino, _, consulta = ruta.partition('?')
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'SCRIPT_NAME': '',
+            'PATH_INFO': camino,
+            'QUERY_STRING': consulta,
+            'SERVER_NAME': HOST,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'HTTP_HOST': HOST,
+            'HTTP_COOKIE': cookie,
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        estado = []
+        inicio = time.perf_counter()
+        cuerpo = aplicacion(environ, lambda status, headers, exc_info=None: estado.append(int(status[:3])))
+        try:
+            for _ in cuerpo:
+                pass
+        finally:
+            cuerpo.close()
+        return estado[0], (time.perf_counter() - inicio) * 1000
+    return pedir
+
+
+def _pedir_servidor(base, cookie):
+    def pedir(ruta):
+        peticion = urllib.request.Request(base.rstrip('/') + ruta, headers={'Cookie': cookie})
+        inicio = time.perf_counter()
+        try:
+            with urllib.request.urlopen(peticion) as respuesta:
+                respuesta.read()
+                estado = respuesta.status
+        except urllib.error.HTTPError as exc:
+            estado = exc.code
+        return estado, (time.perf_counter() - inicio) * 1000
+    return pedir
+
+
+# ============================================
+# ASGI: TODAS LAS PETICIONES EN UN EVENT LOOP
+# ============================================
+def _asgi(cookie, rutas, total, concurrencia):
+    """
+    Bajo ASGI cada petición usa su propio hilo para el ORM, así que las
+    conexiones persistentes no se reutilizan y se acumulan: se mide como se
+    despliega (CONN_MAX_AGE=0, o con el pool de DB_POOL).
+    """
+    configuracion = connections.settings[DEFAULT_DB_ALIAS]
+    conn_max_age = configuracion['CONN_MAX_AGE']
+    configuracion['CONN_MAX_AGE'] = 0
+    try:
+        return asyncio.run(_con_event_loop(get_asgi_application(), cookie, rutas, total, concurrencia))
+    finally:
+        configuracion['CONN_MAX_AGE'] = conn_max_age
+
+
+async def _con_event_loop(aplicacion, cookie, rutas, total, concurrencia):
+    pendientes = iter(range(total))
+    mediciones = []
+
+    async def trabajador():
+        for numero in pendientes:
+            mediciones.append(await _pedir_asgi(aplicacion, cookie, rutas[numero % len(rutas)]))
+
+    await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+    return mediciones
+
+
+async def _pedir_asgi(aplicacion, cookie, ruta):
+    camino, _, consulta = ruta.partition('?')
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': camino,
+        'raw_path': camino.encode(),
+        'query_string': consulta.encode(),
+        'root_path': '',
+        'headers': [(b'host', HOST.encode()), (b'cookie', cookie.encode())],
+        'client': ('127.0.0.1', 0),
+        'server': (HOST, 80),
+    }
+    cuerpo_enviado = False
+
+    async def receive():
+        nonlocal cuerpo_enviado
+        if not cuerpo_enviado:
+            cuerpo_enviado = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # El cliente no se desconecta: Django cancela esta espera al responder
+        await asyncio.Event().wait()
+
+    estado = []
+
+    async def send(mensaje):
+        if mensaje['type'] == 'http.response.start':
+            estado.append(mensaje['status'])
+
+    inicio = time.perf_counter()
+    await aplicacion(scope, receive, send)
+    return estado[0], (time.perf_counter() - inicio) * 1000
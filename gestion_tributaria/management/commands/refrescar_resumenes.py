@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from gestion_tributaria import resumenes
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la vista materializada resumen_calificacion del tablero de resúmenes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--bloqueante',
+            action='store_true',
+            help='Refresco normal (bloquea las lecturas de la vista; más rápido que el concurrente)',
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        resumenes.refrescar(concurrente=not options['bloqueante'])
+        self.stdout.write(self.style.SUCCESS(
+            f'resumen_calificacion actualizado en {time.monotonic() - inicio:.1f} s'
+        ))
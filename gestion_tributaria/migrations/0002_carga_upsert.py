@@ -0,0 +1,108 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:39
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import migrations, models
+from django.db.models import Count
+
+from gestion_tributaria.formato_dj1948 import CAMPOS_FACTOR, COLUMNAS_BASE, factor_a_escalado
+from gestion_tributaria.models import hash_valores
+
+CLAVE_NATURAL = ['usuario', 'ejercicio', 'mercado', 'instrumento', 'secuencia_evento']
+TAMANO_LOTE = 2000
+MAX_REPETIDAS_MENSAJE = 20
+
+
+def calcular_hashes(apps, schema_editor):
+    """
+    hash_contenido de las calificaciones existentes: sin él la primera
+    recarga idéntica las contaría como actualizadas (los factores todavía
+    son columnas factor_N).
+    """
+    CalificacionTributaria = apps.get_model('gestion_tributaria', 'CalificacionTributaria')
+    calificaciones = CalificacionTributaria.objects.only('pk', *COLUMNAS_BASE, *CAMPOS_FACTOR).order_by('pk')
+    pendientes = []
+    for calificacion in calificaciones.iterator(chunk_size=TAMANO_LOTE):
+        valores = {campo: getattr(calificacion, campo) for campo in COLUMNAS_BASE}
+        valores['factores'] = [factor_a_escalado(getattr(calificacion, campo)) for campo in CAMPOS_FACTOR]
+        calificacion.hash_contenido = hash_valores(valores)
+        pendientes.append(calificacion)
+        if len(pendientes) == TAMANO_LOTE:
+            CalificacionTributaria.objects.bulk_update(pendientes, ['hash_contenido'])
+            pendientes = []
+    CalificacionTributaria.objects.bulk_update(pendientes, ['hash_contenido'])
+
+
+def fusionar_repetidas(apps, schema_editor):
+    """
+    Antes de la restricción única: de las calificaciones repetidas por
+    clave natural con el mismo contenido queda la primera, y los logs de
+    las demás pasan a ella. Si una clave tiene contenidos distintos no hay
+    cuál elegir: la migración se detiene y enumera las calificaciones.
+    """
+    CalificacionTributaria = apps.get_model('gestion_tributaria', 'CalificacionTributaria')
+    LogOperacion = apps.get_model('gestion_tributaria', 'LogOperacion')
+    repetidas = list(
+        CalificacionTributaria.objects.values(*CLAVE_NATURAL)
+        .annotate(
+            cantidad=Count('pk'),
+            contenidos=Count('hash_contenido', distinct=True),
+            ids=ArrayAgg('pk', ordering='pk'),
+        )
+        .filter(cantidad__gt=1)
+        .order_by()
+    )
+    distintas = [grupo['ids'] for grupo in repetidas if grupo['contenidos'] > 1]
+    if distintas:
+        raise RuntimeError(
+            f'{len(distintas)} claves ({", ".join(CLAVE_NATURAL)}) tienen calificaciones con datos distintos. '
+            'Elimine o corrija las sobrantes y vuelva a migrar. Ids: '
+            + '; '.join(map(str, distintas[:MAX_REPETIDAS_MENSAJE]))
+        )
+    for grupo in repetidas:
+        conservada, *sobrantes = grupo['ids']
+        LogOperacion.objects.filter(calificacion_id__in=sobrantes).update(calificacion_id=conservada)
+        CalificacionTributaria.objects.filter(pk__in=sobrantes).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_tributaria', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calificaciontributaria',
+            name='hash_contenido',
+            field=models.CharField(blank=True, editable=False, help_text='MD5 de los datos de la calificación, para detectar recargas sin cambios', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='modo',
+            field=models.CharField(choices=[('INSERTAR', 'Solo insertar'), ('UPSERT', 'Insertar o actualizar')], default='INSERTAR', help_text='UPSERT actualiza las calificaciones existentes con la misma clave', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='registros_actualizados',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='registros_insertados',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='registros_sin_cambios',
+            field=models.IntegerField(default=0),
+        ),
+        # Al revertir se elimina la columna; las repetidas fusionadas no vuelven
+        migrations.RunPython(calcular_hashes, migrations.RunPython.noop),
+        migrations.RunPython(fusionar_repetidas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='calificaciontributaria',
+            constraint=models.UniqueConstraint(fields=('usuario', 'ejercicio', 'mercado', 'instrumento', 'secuencia_evento'), name='calificacion_clave_natural'),
+        ),
+    ]
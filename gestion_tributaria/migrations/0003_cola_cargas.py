@@ -0,0 +1,60 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_tributaria', '0002_carga_upsert'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='archivo',
+            field=models.FileField(blank=True, help_text='Archivo a procesar por el worker de cargas (procesar_cargas)', null=True, upload_to='cargas/%Y/%m/'),
+        ),
+        # Las cargas existentes ya se procesaron: quedan COMPLETADA, las nuevas parten PENDIENTE
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='estado',
+            field=models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('PROCESANDO', 'Procesando'), ('COMPLETADA', 'Completada'), ('FALLIDA', 'Fallida')], default='COMPLETADA', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='cargamasiva',
+            name='estado',
+            field=models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('PROCESANDO', 'Procesando'), ('COMPLETADA', 'Completada'), ('FALLIDA', 'Fallida')], default='PENDIENTE', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='fecha_fin',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='fecha_inicio',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='intentos',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='latido',
+            field=models.DateTimeField(blank=True, help_text='Último lote confirmado por el worker', null=True),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='worker',
+            field=models.CharField(blank=True, help_text='Proceso que tiene tomada la carga', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='cargamasiva',
+            index=models.Index(fields=['estado', 'fecha_carga'], name='carga_masiv_estado_0e591f_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copiar_calificacion_ref(apps, schema_editor):
+    LogOperacion = apps.get_model('gestion_tributaria', 'LogOperacion')
+    LogOperacion.objects.filter(calificacion__isnull=False).update(
+        calificacion_ref=models.F('calificacion_id')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_tributaria', '0003_cola_cargas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logoperacion',
+            name='calificacion_ref',
+            field=models.BigIntegerField(blank=True, help_text='Id de la calificación (se conserva aunque la calificación se elimine)', null=True),
+        ),
+        migrations.AddField(
+            model_name='logoperacion',
+            name='es_checkpoint',
+            field=models.BooleanField(default=False, help_text='datos_nuevos contiene el estado completo de la calificación'),
+        ),
+        migrations.AlterField(
+            model_name='logoperacion',
+            name='datos_anteriores',
+            field=models.JSONField(blank=True, help_text='Campos modificados: valores anteriores', null=True),
+        ),
+        migrations.AlterField(
+            model_name='logoperacion',
+            name='datos_nuevos',
+            field=models.JSONField(blank=True, help_text='Campos modificados: valores nuevos', null=True),
+        ),
+        migrations.RunPython(copiar_calificacion_ref, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='logoperacion',
+            index=models.Index(fields=['calificacion_ref', 'fecha_hora'], name='log_operaci_calific_82e843_idx'),
+        ),
+    ]
@@ -0,0 +1,116 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+MESES_FUTUROS = 3
+
+
+def particionar_log_operacion(apps, schema_editor):
+    """
+    Convierte log_operacion en una tabla particionada por mes (RANGE fecha_hora).
+
+    PostgreSQL exige que la clave primaria incluya la columna de partición,
+    así que la PK pasa a ser (id, fecha_hora); id sigue saliendo de una
+    secuencia. Se crean particiones para los meses con datos y los
+    MESES_FUTUROS siguientes, más una partición DEFAULT de resguardo.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    LogOperacion = apps.get_model('gestion_tributaria', 'LogOperacion')
+    ejecutar = schema_editor.execute
+
+    ejecutar('CREATE SEQUENCE log_operacion_nueva_id_seq AS bigint')
+    ejecutar(
+        'CREATE TABLE log_operacion_nueva (LIKE log_operacion INCLUDING DEFAULTS) '
+        'PARTITION BY RANGE (fecha_hora)'
+    )
+    ejecutar("ALTER TABLE log_operacion_nueva ALTER COLUMN id SET DEFAULT nextval('log_operacion_nueva_id_seq')")
+    ejecutar('ALTER TABLE log_operacion_nueva ADD PRIMARY KEY (id, fecha_hora)')
+    ejecutar('CREATE TABLE log_operacion_default PARTITION OF log_operacion_nueva DEFAULT')
+    ejecutar(f"""
+        DO $$
+        DECLARE
+            mes date;
+            hasta date := (date_trunc('month', now() AT TIME ZONE 'UTC') + interval '{MESES_FUTUROS + 1} months')::date;
+        BEGIN
+            SELECT date_trunc('month', COALESCE(min(fecha_hora), now()) AT TIME ZONE 'UTC')::date
+              INTO mes FROM log_operacion;
+            WHILE mes < hasta LOOP
+                EXECUTE 'CREATE TABLE ' || quote_ident('log_operacion_p' || to_char(mes, 'YYYYMM'))
+                    || ' PARTITION OF log_operacion_nueva FOR VALUES FROM ('
+                    || quote_literal(to_char(mes, 'YYYY-MM-DD') || ' 00:00:00+00') || ') TO ('
+                    || quote_literal(to_char(mes + interval '1 month', 'YYYY-MM-DD') || ' 00:00:00+00') || ')';
+                mes := (mes + interval '1 month')::date;
+            END LOOP;
+        END $$
+    """)
+
+    ejecutar('INSERT INTO log_operacion_nueva SELECT * FROM log_operacion')
+    ejecutar(
+        "SELECT setval('log_operacion_nueva_id_seq', COALESCE(max(id), 0) + 1, false) "
+        'FROM log_operacion_nueva'
+    )
+    ejecutar('DROP TABLE log_operacion')
+    ejecutar('ALTER TABLE log_operacion_nueva RENAME TO log_operacion')
+    ejecutar('ALTER TABLE log_operacion RENAME CONSTRAINT log_operacion_nueva_pkey TO log_operacion_pkey')
+    ejecutar('ALTER SEQUENCE log_operacion_nueva_id_seq RENAME TO log_operacion_id_seq')
+    ejecutar('ALTER SEQUENCE log_operacion_id_seq OWNED BY log_operacion.id')
+
+    # Claves foráneas e índices con los mismos nombres que generaría Django
+    for field in LogOperacion._meta.local_fields:
+        if field.remote_field and field.db_constraint:
+            ejecutar(schema_editor._create_fk_sql(LogOperacion, field, '_fk_%(to_table)s_%(to_column)s'))
+        if field.db_index and not field.unique and not field.primary_key:
+            ejecutar(schema_editor._create_index_sql(LogOperacion, fields=[field]))
+    for index in LogOperacion._meta.indexes:
+        schema_editor.add_index(LogOperacion, index)
+
+
+def desparticionar_log_operacion(apps, schema_editor):
+    """
+    Vuelve a una tabla log_operacion sin particiones con PK (id).
+
+    Las filas de todas las particiones (incluida la DEFAULT) se copian a la
+    tabla nueva; la secuencia de id se conserva. Las particiones ya
+    archivadas con `particionar_logs` no vuelven.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    LogOperacion = apps.get_model('gestion_tributaria', 'LogOperacion')
+    ejecutar = schema_editor.execute
+
+    ejecutar('CREATE TABLE log_operacion_plana (LIKE log_operacion INCLUDING DEFAULTS)')
+    ejecutar('INSERT INTO log_operacion_plana SELECT * FROM log_operacion')
+    # La secuencia pertenece a log_operacion.id: sin esto se iría con el DROP
+    ejecutar('ALTER SEQUENCE log_operacion_id_seq OWNED BY NONE')
+    ejecutar('DROP TABLE log_operacion')
+    ejecutar('ALTER TABLE log_operacion_plana RENAME TO log_operacion')
+    ejecutar('ALTER TABLE log_operacion ADD CONSTRAINT log_operacion_pkey PRIMARY KEY (id)')
+    ejecutar('ALTER SEQUENCE log_operacion_id_seq OWNED BY log_operacion.id')
+
+    for field in LogOperacion._meta.local_fields:
+        if field.remote_field and field.db_constraint:
+            ejecutar(schema_editor._create_fk_sql(LogOperacion, field, '_fk_%(to_table)s_%(to_column)s'))
+        if field.db_index and not field.unique and not field.primary_key:
+            ejecutar(schema_editor._create_index_sql(LogOperacion, fields=[field]))
+    for index in LogOperacion._meta.indexes:
+        schema_editor.add_index(LogOperacion, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_tributaria', '0004_log_checkpoints'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(particionar_log_operacion, desparticionar_log_operacion),
+        migrations.AddIndex(
+            model_name='logoperacion',
+            index=models.Index(fields=['fecha_hora'], name='log_operaci_fecha_h_be2a51_idx'),
+        ),
+    ]
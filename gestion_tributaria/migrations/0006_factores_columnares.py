@@ -0,0 +1,151 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:55
+
+import django.contrib.postgres.fields
+import gestion_tributaria.models
+from django.db import migrations, models
+
+NUMEROS_FACTOR = range(8, 38)
+
+# factor_N (numeric) -> factores[N - 7] (bigint escalado por 10^8; los arreglos SQL parten en 1)
+COPIAR_A_ARREGLO = 'UPDATE calificacion_tributaria SET factores = ARRAY[{}]::bigint[]'.format(
+    ', '.join(f'round(factor_{n} * 100000000)' for n in NUMEROS_FACTOR)
+)
+COPIAR_DESDE_ARREGLO = 'UPDATE calificacion_tributaria SET {}'.format(
+    ', '.join(f'factor_{n} = factores[{n - 7}] / 100000000.0' for n in NUMEROS_FACTOR)
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_tributaria', '0005_particionar_log_operacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calificaciontributaria',
+            name='factores',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), default=gestion_tributaria.models.factores_en_cero, help_text='Factores 8 al 37 como enteros escalados por 10^8 (factor_8 es la posición 0)', size=30),
+        ),
+        migrations.RunSQL(COPIAR_A_ARREGLO, COPIAR_DESDE_ARREGLO),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_8',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_9',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_10',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_11',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_12',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_13',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_14',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_15',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_16',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_17',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_18',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_19',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_20',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_21',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_22',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_23',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_24',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_25',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_26',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_27',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_28',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_29',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_30',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_31',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_32',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_33',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_34',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_35',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_36',
+        ),
+        migrations.RemoveField(
+            model_name='calificaciontributaria',
+            name='factor_37',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_tributaria', '0006_factores_columnares'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='calificaciontributaria',
+            index=models.Index(fields=['-ejercicio', '-fecha_pago', '-id'], name='calificacion_orden_idx'),
+        ),
+    ]
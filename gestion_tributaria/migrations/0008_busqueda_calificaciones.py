@@ -0,0 +1,67 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:01
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+INDICE_TRIGRAMAS = django.contrib.postgres.indexes.GinIndex(
+    django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('instrumento'), name='gin_trgm_ops'),
+    name='calificacion_instr_trgm_idx',
+)
+
+
+def crear_indice_trigramas(apps, schema_editor):
+    """
+    Instala pg_trgm y crea el índice de trigramas sobre UPPER(instrumento).
+
+    Si el servidor no trae la extensión (PostgreSQL sin contrib) se omite el
+    índice: la búsqueda funciona igual, pero recorre la tabla.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.add_index(apps.get_model('gestion_tributaria', 'CalificacionTributaria'), INDICE_TRIGRAMAS)
+
+
+def eliminar_indice_trigramas(apps, schema_editor):
+    """
+    El estado de las migraciones siempre registra el índice, pero en la base
+    solo existe si había pg_trgm: se elimina únicamente si está.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {schema_editor.quote_name(INDICE_TRIGRAMAS.name)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_tributaria', '0007_indice_orden_calificacion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calificaciontributaria',
+            name='descripcion_busqueda',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.SearchVector('descripcion', config='spanish'), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(crear_indice_trigramas, eliminar_indice_trigramas),
+            ],
+            state_operations=[
+                migrations.AddIndex(model_name='calificaciontributaria', index=INDICE_TRIGRAMAS),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='calificaciontributaria',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['descripcion_busqueda'], name='calificacion_desc_busq_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_tributaria', '0008_busqueda_calificaciones'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='calificaciontributaria',
+            index=models.Index(condition=models.Q(('es_local', False)), fields=['ejercicio', 'mercado'], name='calificacion_compartidas_idx'),
+        ),
+    ]
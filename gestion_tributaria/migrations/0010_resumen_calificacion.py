@@ -0,0 +1,55 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:04
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Una suma por posición de `factores` (30 factores, del 8 al 37)
+SUMAS_FACTORES = ', '.join(f'sum(factores[{posicion}])' for posicion in range(1, 31))
+
+CREAR_VISTA = f"""
+CREATE MATERIALIZED VIEW resumen_calificacion AS
+SELECT ejercicio, mercado, origen, usuario_id,
+       count(*) AS cantidad,
+       sum(valor_historico) AS suma_valor_historico,
+       ARRAY[{SUMAS_FACTORES}]::numeric[] AS sumas_factores,
+       now() AS actualizado
+  FROM calificacion_tributaria
+ GROUP BY ejercicio, mercado, origen, usuario_id;
+
+-- REFRESH ... CONCURRENTLY requiere un índice único sin condición
+CREATE UNIQUE INDEX resumen_calificacion_grupo
+    ON resumen_calificacion (ejercicio, mercado, origen, usuario_id);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_tributaria', '0009_calificaciones_compartidas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREAR_VISTA, 'DROP MATERIALIZED VIEW resumen_calificacion'),
+        migrations.CreateModel(
+            name='ResumenCalificacion',
+            fields=[
+                ('pk', models.CompositePrimaryKey('ejercicio', 'mercado', 'origen', 'usuario', blank=True, editable=False, primary_key=True, serialize=False)),
+                ('ejercicio', models.IntegerField()),
+                ('mercado', models.CharField(choices=[('ACN', 'Acciones'), ('CFI', 'Renta Fija'), ('FM', 'Fondos Mutuos')], max_length=3)),
+                ('origen', models.CharField(choices=[('MANUAL', 'Ingreso Manual'), ('MASIVO', 'Carga Masiva'), ('SISTEMA', 'Sistema Bolsa')], max_length=10)),
+                ('usuario', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('cantidad', models.BigIntegerField()),
+                ('suma_valor_historico', models.DecimalField(decimal_places=2, max_digits=30)),
+                ('sumas_factores', django.contrib.postgres.fields.ArrayField(base_field=models.DecimalField(decimal_places=0, max_digits=30), size=None)),
+                ('actualizado', models.DateTimeField(help_text='Momento del último refresco de la vista')),
+            ],
+            options={
+                'verbose_name': 'Resumen de Calificaciones',
+                'db_table': 'resumen_calificacion',
+                'managed': False,
+            },
+        ),
+    ]
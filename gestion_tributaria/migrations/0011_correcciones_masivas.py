@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_tributaria', '0010_resumen_calificacion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='logoperacion',
+            name='operacion',
+            field=models.CharField(choices=[('CREATE', 'Creación'), ('UPDATE', 'Actualización'), ('DELETE', 'Eliminación'), ('CARGA', 'Carga Masiva'), ('CORRECCION', 'Corrección Masiva')], max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='logoperacion',
+            index=models.Index(condition=models.Q(('operacion', 'CORRECCION')), fields=['fecha_hora'], name='log_correccion_fecha_idx'),
+        ),
+    ]
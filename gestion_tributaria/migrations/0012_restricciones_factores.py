@@ -0,0 +1,79 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:40
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.expressions import CombinedExpression
+from django.db.models.lookups import LessThanOrEqual
+
+RESTRICCIONES = [
+    models.CheckConstraint(condition=models.Q(('factores__len', 30)), name='calificacion_factores_cantidad'),
+    models.CheckConstraint(condition=models.Q(('factores__0__gte', 0), ('factores__0__lte', 100000000)), name='calificacion_factor_8_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__1__gte', 0), ('factores__1__lte', 100000000)), name='calificacion_factor_9_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__2__gte', 0), ('factores__2__lte', 100000000)), name='calificacion_factor_10_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__3__gte', 0), ('factores__3__lte', 100000000)), name='calificacion_factor_11_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__4__gte', 0), ('factores__4__lte', 100000000)), name='calificacion_factor_12_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__5__gte', 0), ('factores__5__lte', 100000000)), name='calificacion_factor_13_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__6__gte', 0), ('factores__6__lte', 100000000)), name='calificacion_factor_14_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__7__gte', 0), ('factores__7__lte', 100000000)), name='calificacion_factor_15_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__8__gte', 0), ('factores__8__lte', 100000000)), name='calificacion_factor_16_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__9__gte', 0), ('factores__9__lte', 100000000)), name='calificacion_factor_17_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__10__gte', 0), ('factores__10__lte', 100000000)), name='calificacion_factor_18_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__11__gte', 0), ('factores__11__lte', 100000000)), name='calificacion_factor_19_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__12__gte', 0), ('factores__12__lte', 100000000)), name='calificacion_factor_20_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__13__gte', 0), ('factores__13__lte', 100000000)), name='calificacion_factor_21_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__14__gte', 0), ('factores__14__lte', 100000000)), name='calificacion_factor_22_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__15__gte', 0), ('factores__15__lte', 100000000)), name='calificacion_factor_23_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__16__gte', 0), ('factores__16__lte', 100000000)), name='calificacion_factor_24_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__17__gte', 0), ('factores__17__lte', 100000000)), name='calificacion_factor_25_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__18__gte', 0), ('factores__18__lte', 100000000)), name='calificacion_factor_26_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__19__gte', 0), ('factores__19__lte', 100000000)), name='calificacion_factor_27_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__20__gte', 0), ('factores__20__lte', 100000000)), name='calificacion_factor_28_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__21__gte', 0), ('factores__21__lte', 100000000)), name='calificacion_factor_29_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__22__gte', 0), ('factores__22__lte', 100000000)), name='calificacion_factor_30_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__23__gte', 0), ('factores__23__lte', 100000000)), name='calificacion_factor_31_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__24__gte', 0), ('factores__24__lte', 100000000)), name='calificacion_factor_32_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__25__gte', 0), ('factores__25__lte', 100000000)), name='calificacion_factor_33_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__26__gte', 0), ('factores__26__lte', 100000000)), name='calificacion_factor_34_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__27__gte', 0), ('factores__27__lte', 100000000)), name='calificacion_factor_35_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__28__gte', 0), ('factores__28__lte', 100000000)), name='calificacion_factor_36_rango'),
+    models.CheckConstraint(condition=models.Q(('factores__29__gte', 0), ('factores__29__lte', 100000000)), name='calificacion_factor_37_rango'),
+    models.CheckConstraint(condition=LessThanOrEqual(CombinedExpression(CombinedExpression(CombinedExpression(CombinedExpression(CombinedExpression(CombinedExpression(CombinedExpression(CombinedExpression(models.F('factores__0'), '+', models.F('factores__1')), '+', models.F('factores__2')), '+', models.F('factores__3')), '+', models.F('factores__4')), '+', models.F('factores__5')), '+', models.F('factores__6')), '+', models.F('factores__7')), '+', models.F('factores__8')), 100000000), name='calificacion_suma_factores'),
+]
+
+
+def agregar_restricciones(apps, schema_editor):
+    """
+    Todas las restricciones en un solo ALTER TABLE: PostgreSQL revisa las
+    filas existentes en una sola pasada por la tabla, no una por restricción.
+    """
+    CalificacionTributaria = apps.get_model('gestion_tributaria', 'CalificacionTributaria')
+    clausulas = ', '.join(
+        f'ADD {restriccion.constraint_sql(CalificacionTributaria, schema_editor)}' for restriccion in RESTRICCIONES
+    )
+    schema_editor.execute(f'ALTER TABLE {schema_editor.quote_name(CalificacionTributaria._meta.db_table)} {clausulas}')
+
+
+def quitar_restricciones(apps, schema_editor):
+    CalificacionTributaria = apps.get_model('gestion_tributaria', 'CalificacionTributaria')
+    clausulas = ', '.join(
+        f'DROP CONSTRAINT {schema_editor.quote_name(restriccion.name)}' for restriccion in RESTRICCIONES
+    )
+    schema_editor.execute(f'ALTER TABLE {schema_editor.quote_name(CalificacionTributaria._meta.db_table)} {clausulas}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_tributaria', '0011_correcciones_masivas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(agregar_restricciones, quitar_restricciones)],
+            state_operations=[
+                migrations.AddConstraint(model_name='calificaciontributaria', constraint=restriccion)
+                for restriccion in RESTRICCIONES
+            ],
+        ),
+    ]
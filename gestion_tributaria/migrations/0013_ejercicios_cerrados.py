@@ -0,0 +1,186 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:56
+
+import django.db.models.deletion
+from django.conf import settings
+from importlib import import_module
+
+from django.db import migrations, models
+
+# La vista depende de la tabla: se elimina y se vuelve a crear igual
+CREAR_VISTA = import_module('gestion_tributaria.migrations.0010_resumen_calificacion').CREAR_VISTA
+
+FUNCION_SOLO_LECTURA = """
+CREATE FUNCTION calificacion_ejercicio_cerrado() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    RAISE EXCEPTION 'Ejercicio cerrado: % es de solo lectura', TG_TABLE_NAME
+        USING ERRCODE = 'read_only_sql_transaction';
+END
+$$
+"""
+
+
+def particionar_calificaciones(apps, schema_editor):
+    """
+    Convierte calificacion_tributaria en una tabla particionada por LIST (ejercicio).
+
+    Todas las filas quedan en la partición DEFAULT calificacion_tributaria_abierta;
+    `manage.py cerrar_ejercicio` agrega después una partición de solo lectura
+    por ejercicio cerrado (ver ejercicios.py). Como en log_operacion, la PK
+    pasa a ser (id, ejercicio) e id sigue saliendo de una secuencia; por eso
+    log_operacion.calificacion ya no tiene clave foránea en la base. Los
+    índices se crean después de copiar las filas.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    CalificacionTributaria = apps.get_model('gestion_tributaria', 'CalificacionTributaria')
+    ejecutar = schema_editor.execute
+    columnas = ', '.join(
+        schema_editor.quote_name(field.column)
+        for field in CalificacionTributaria._meta.concrete_fields
+        if not field.generated
+    )
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'calificacion_tributaria'")
+        indices_existentes = {fila[0] for fila in cursor.fetchall()}
+
+    ejecutar('DROP MATERIALIZED VIEW resumen_calificacion')
+    ejecutar('CREATE SEQUENCE calificacion_tributaria_nueva_id_seq AS bigint')
+    ejecutar(
+        'CREATE TABLE calificacion_tributaria_nueva (LIKE calificacion_tributaria '
+        'INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING CONSTRAINTS) PARTITION BY LIST (ejercicio)'
+    )
+    ejecutar(
+        'ALTER TABLE calificacion_tributaria_nueva '
+        "ALTER COLUMN id SET DEFAULT nextval('calificacion_tributaria_nueva_id_seq')"
+    )
+    ejecutar('CREATE TABLE calificacion_tributaria_abierta PARTITION OF calificacion_tributaria_nueva DEFAULT')
+    ejecutar(
+        f'INSERT INTO calificacion_tributaria_nueva ({columnas}) '
+        f'SELECT {columnas} FROM calificacion_tributaria'
+    )
+    ejecutar(
+        "SELECT setval('calificacion_tributaria_nueva_id_seq', COALESCE(max(id), 0) + 1, false) "
+        'FROM calificacion_tributaria_nueva'
+    )
+    ejecutar('DROP TABLE calificacion_tributaria')
+    ejecutar('ALTER TABLE calificacion_tributaria_nueva RENAME TO calificacion_tributaria')
+    ejecutar('ALTER SEQUENCE calificacion_tributaria_nueva_id_seq RENAME TO calificacion_tributaria_id_seq')
+    ejecutar('ALTER SEQUENCE calificacion_tributaria_id_seq OWNED BY calificacion_tributaria.id')
+    ejecutar(
+        'ALTER TABLE calificacion_tributaria '
+        'ADD CONSTRAINT calificacion_tributaria_pkey PRIMARY KEY (id, ejercicio)'
+    )
+
+    # Restricciones únicas, claves foráneas e índices con los mismos nombres
+    # (las CHECK ya vinieron con LIKE ... INCLUDING CONSTRAINTS)
+    for constraint in CalificacionTributaria._meta.constraints:
+        if isinstance(constraint, models.UniqueConstraint):
+            schema_editor.add_constraint(CalificacionTributaria, constraint)
+    for field in CalificacionTributaria._meta.local_fields:
+        if field.remote_field and field.db_constraint:
+            ejecutar(schema_editor._create_fk_sql(CalificacionTributaria, field, '_fk_%(to_table)s_%(to_column)s'))
+        if field.db_index and not field.unique and not field.primary_key:
+            ejecutar(schema_editor._create_index_sql(CalificacionTributaria, fields=[field]))
+    for index in CalificacionTributaria._meta.indexes:
+        # El de trigramas solo existe si el servidor tiene pg_trgm (ver 0008)
+        if index.name in indices_existentes:
+            schema_editor.add_index(CalificacionTributaria, index)
+
+    ejecutar(FUNCION_SOLO_LECTURA, params=None)
+    ejecutar(CREAR_VISTA)
+
+
+def desparticionar_calificaciones(apps, schema_editor):
+    """
+    Vuelve a una tabla calificacion_tributaria sin particiones con PK (id).
+
+    Se copian las filas de todas las particiones, también las de los
+    ejercicios cerrados (los triggers solo rechazan escrituras); las
+    particiones y los triggers se van con el DROP, y la tabla
+    ejercicio_cerrado la elimina el CreateModel. La secuencia de id se
+    conserva.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    CalificacionTributaria = apps.get_model('gestion_tributaria', 'CalificacionTributaria')
+    ejecutar = schema_editor.execute
+    columnas = ', '.join(
+        schema_editor.quote_name(field.column)
+        for field in CalificacionTributaria._meta.concrete_fields
+        if not field.generated
+    )
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'calificacion_tributaria'")
+        indices_existentes = {fila[0] for fila in cursor.fetchall()}
+
+    ejecutar('DROP MATERIALIZED VIEW resumen_calificacion')
+    ejecutar(
+        'CREATE TABLE calificacion_tributaria_plana (LIKE calificacion_tributaria '
+        'INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING CONSTRAINTS)'
+    )
+    ejecutar(
+        f'INSERT INTO calificacion_tributaria_plana ({columnas}) '
+        f'SELECT {columnas} FROM calificacion_tributaria'
+    )
+    # La secuencia pertenece a calificacion_tributaria.id: sin esto se iría con el DROP
+    ejecutar('ALTER SEQUENCE calificacion_tributaria_id_seq OWNED BY NONE')
+    ejecutar('DROP TABLE calificacion_tributaria')
+    ejecutar('ALTER TABLE calificacion_tributaria_plana RENAME TO calificacion_tributaria')
+    ejecutar('ALTER TABLE calificacion_tributaria ADD CONSTRAINT calificacion_tributaria_pkey PRIMARY KEY (id)')
+    ejecutar('ALTER SEQUENCE calificacion_tributaria_id_seq OWNED BY calificacion_tributaria.id')
+    # Sin clave foránea pudieron quedar logs de calificaciones eliminadas;
+    # el AlterField la vuelve a crear a continuación
+    ejecutar(
+        'UPDATE log_operacion SET calificacion_id = NULL WHERE calificacion_id IS NOT NULL '
+        'AND NOT EXISTS (SELECT 1 FROM calificacion_tributaria c WHERE c.id = log_operacion.calificacion_id)'
+    )
+
+    for constraint in CalificacionTributaria._meta.constraints:
+        if isinstance(constraint, models.UniqueConstraint):
+            schema_editor.add_constraint(CalificacionTributaria, constraint)
+    for field in CalificacionTributaria._meta.local_fields:
+        if field.remote_field and field.db_constraint:
+            ejecutar(schema_editor._create_fk_sql(CalificacionTributaria, field, '_fk_%(to_table)s_%(to_column)s'))
+        if field.db_index and not field.unique and not field.primary_key:
+            ejecutar(schema_editor._create_index_sql(CalificacionTributaria, fields=[field]))
+    for index in CalificacionTributaria._meta.indexes:
+        if index.name in indices_existentes:
+            schema_editor.add_index(CalificacionTributaria, index)
+
+    ejecutar('DROP FUNCTION calificacion_ejercicio_cerrado()')
+    ejecutar(CREAR_VISTA)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_tributaria', '0012_restricciones_factores'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='logoperacion',
+            name='calificacion',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='logs', to='gestion_tributaria.calificaciontributaria'),
+        ),
+        migrations.CreateModel(
+            name='EjercicioCerrado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ejercicio', models.IntegerField(unique=True)),
+                ('registros', models.IntegerField(default=0, help_text='Calificaciones movidas a la partición al cerrar')),
+                ('fecha_cierre', models.DateTimeField(auto_now_add=True)),
+                ('usuario', models.ForeignKey(blank=True, help_text='Quién cerró el ejercicio', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Ejercicio Cerrado',
+                'verbose_name_plural': 'Ejercicios Cerrados',
+                'db_table': 'ejercicio_cerrado',
+                'ordering': ['-ejercicio'],
+            },
+        ),
+        migrations.RunPython(particionar_calificaciones, desparticionar_calificaciones),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_tributaria', '0013_ejercicios_cerrados'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='tamano_lote',
+            field=models.PositiveIntegerField(blank=True, help_text='Filas por transacción (vacío: CARGA_MASIVA_TAMANO_LOTE)', null=True),
+        ),
+    ]
@@ -1,7 +1,26 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db.models.functions import Upper
+from django.db.models.lookups import LessThanOrEqual
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
+from datetime import date
+from functools import reduce
+import hashlib
+import operator
+
+from .formato_dj1948 import (
+    CAMPOS_FACTOR,
+    COLUMNAS_BASE,
+    DECIMALES_FACTOR,
+    ESCALA_FACTOR,
+    factor_a_escalado,
+    factor_desde_escalado,
+)
+from .validacion import CAMPOS_SUMA
 
 # ============================================
 # MODELO: PERFIL DE USUARIO
@@ -36,20 +55,63 @@ class CargaMasiva(models.Model):
         ('MONTOS', 'Montos DJ1948'),
     ]
     
+    MODO_CHOICES = [
+        ('INSERTAR', 'Solo insertar'),
+        ('UPSERT', 'Insertar o actualizar'),
+    ]
+    
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('PROCESANDO', 'Procesando'),
+        ('COMPLETADA', 'Completada'),
+        ('FALLIDA', 'Fallida'),
+    ]
+    
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cargas_masivas')
     tipo_carga = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    modo = models.CharField(
+        max_length=10,
+        choices=MODO_CHOICES,
+        default='INSERTAR',
+        help_text='UPSERT actualiza las calificaciones existentes con la misma clave'
+    )
     nombre_archivo = models.CharField(max_length=255)
+    archivo = models.FileField(
+        upload_to='cargas/%Y/%m/',
+        null=True,
+        blank=True,
+        help_text='Archivo a procesar por el worker de cargas (procesar_cargas)'
+    )
     registros_procesados = models.IntegerField(default=0)
     registros_exitosos = models.IntegerField(default=0)
     registros_fallidos = models.IntegerField(default=0)
+    registros_insertados = models.IntegerField(default=0)
+    registros_actualizados = models.IntegerField(default=0)
+    registros_sin_cambios = models.IntegerField(default=0)
     errores_detalle = models.TextField(blank=True, null=True)
     fecha_carga = models.DateTimeField(auto_now_add=True)
     
+    # Cola de procesamiento en segundo plano
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='PENDIENTE')
+    worker = models.CharField(max_length=100, blank=True, help_text='Proceso que tiene tomada la carga')
+    intentos = models.IntegerField(default=0)
+    tamano_lote = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text='Filas por transacción (vacío: CARGA_MASIVA_TAMANO_LOTE)'
+    )
+    latido = models.DateTimeField(null=True, blank=True, help_text='Último lote confirmado por el worker')
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    
     class Meta:
         verbose_name = 'Carga Masiva'
         verbose_name_plural = 'Cargas Masivas'
         db_table = 'carga_masiva'
         ordering = ['-fecha_carga']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_carga']),
+        ]
     
     def __str__(self):
         return f"Carga {self.tipo_carga} - {self.nombre_archivo} ({self.fecha_carga.strftime('%d/%m/%Y')})"
@@ -58,6 +120,133 @@ class CargaMasiva(models.Model):
 # ============================================
 # MODELO: CALIFICACIÓN TRIBUTARIA
 # ============================================
+CLAVE_NATURAL = ['usuario', 'ejercicio', 'mercado', 'instrumento', 'secuencia_evento']
+CAMPOS_CONTENIDO = COLUMNAS_BASE + CAMPOS_FACTOR
+# Columnas de la tabla que guardan CAMPOS_CONTENIDO
+COLUMNAS_CONTENIDO = COLUMNAS_BASE + ['factores']
+
+# Los factores 8-37 se guardan juntos en `factores` (bigint[] en PostgreSQL)
+# como enteros escalados por 10^8: una fila angosta en vez de 30 numeric.
+# Cada factor_N sigue disponible como propiedad Decimal de lectura y
+# escritura; DEFINICION_FACTOR describe el campo para validación y formularios.
+DEFINICION_FACTOR = models.DecimalField(
+    max_digits=9,
+    decimal_places=8,
+    default=Decimal('0.00000000'),
+    validators=[MinValueValidator(0), MaxValueValidator(1)]
+)
+
+AYUDA_FACTORES = {
+    'factor_8': 'Con crédito IDPC >= 01.01.2017',
+    'factor_9': 'Con crédito IDPC <= 31.12.2016',
+    'factor_10': 'Con derecho a crédito IDPC voluntario',
+    'factor_11': 'Sin derecho a crédito',
+    'factor_12': 'Rentas RAP y Diferencia Inicial',
+}
+
+
+def _restricciones_factores():
+    """
+    Restricciones CHECK de `factores`: la cantidad de posiciones, los límites
+    de DEFINICION_FACTOR (0 a 1) para cada factor y la suma de los factores
+    8-16 de clean(). Las escrituras masivas se apoyan en ellas en vez de
+    validar los factores en Python (ver carga_masiva._escribir y
+    correcciones.corregir).
+    """
+    restricciones = [
+        models.CheckConstraint(
+            condition=models.Q(factores__len=len(CAMPOS_FACTOR)),
+            name='calificacion_factores_cantidad',
+        ),
+    ]
+    for indice, campo in enumerate(CAMPOS_FACTOR):
+        restricciones.append(models.CheckConstraint(
+            condition=models.Q(**{f'factores__{indice}__gte': 0, f'factores__{indice}__lte': ESCALA_FACTOR}),
+            name=f'calificacion_{campo}_rango',
+        ))
+    suma = reduce(operator.add, [models.F(f'factores__{CAMPOS_FACTOR.index(campo)}') for campo in CAMPOS_SUMA])
+    restricciones.append(models.CheckConstraint(
+        condition=LessThanOrEqual(suma, ESCALA_FACTOR),
+        name='calificacion_suma_factores',
+    ))
+    return restricciones
+
+
+RESTRICCIONES_FACTORES = _restricciones_factores()
+RESTRICCIONES_EN_CLEAN = frozenset(
+    restriccion.name for restriccion in RESTRICCIONES_FACTORES if restriccion.name != 'calificacion_factores_cantidad'
+)
+
+
+def restriccion_violada(exc):
+    """Nombre de la restricción de `factores` que rechazó una escritura (IntegrityError), o None"""
+    nombre = getattr(getattr(exc.__cause__, 'diag', None), 'constraint_name', None)
+    return nombre if nombre in {restriccion.name for restriccion in RESTRICCIONES_FACTORES} else None
+
+
+def factores_en_cero():
+    return [0] * len(CAMPOS_FACTOR)
+
+
+def _propiedad_factor(indice):
+    def leer(self):
+        return factor_desde_escalado(self.factores[indice])
+
+    def escribir(self, valor):
+        self.factores[indice] = factor_a_escalado(valor)
+
+    return property(leer, escribir)
+
+
+def hash_contenido(datos):
+    """MD5 estable de los valores de CAMPOS_CONTENIDO (independiente de la escala decimal)"""
+    return _md5([_texto_hash(datos[campo]) for campo in CAMPOS_CONTENIDO])
+
+
+def hash_valores(valores):
+    """hash_contenido() desde COLUMNAS_CONTENIDO, con `factores` escalado (sin pasar por Decimal)"""
+    partes = [_texto_hash(valores[campo]) for campo in COLUMNAS_BASE]
+    partes.extend(map(_texto_factor_hash, valores['factores']))
+    return _md5(partes)
+
+
+def _texto_hash(valor):
+    if isinstance(valor, Decimal):
+        return format(valor.normalize(), 'f')
+    if isinstance(valor, bool):
+        return str(int(valor))
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return str(valor)
+
+
+def _texto_factor_hash(escalado):
+    # Igual que format(Decimal.normalize(), 'f'): sin ceros decimales a la derecha
+    if escalado < 0:
+        return '-' + _texto_factor_hash(-escalado)
+    enteros, decimales = divmod(escalado, ESCALA_FACTOR)
+    if not decimales:
+        return str(enteros)
+    return f'{enteros}.{decimales:0{DECIMALES_FACTOR}d}'.rstrip('0')
+
+
+def _md5(partes):
+    return hashlib.md5('|'.join(partes).encode('utf-8')).hexdigest()
+
+
+class CalificacionQuerySet(models.QuerySet):
+
+    def visibles_para(self, usuario_id, ver_todas=False):
+        """
+        Propias más las compartidas del sistema (es_local=False). Cada lado
+        del OR tiene su índice: (usuario, ejercicio, mercado) y el parcial
+        calificacion_compartidas_idx.
+        """
+        if ver_todas:
+            return self
+        return self.filter(models.Q(usuario_id=usuario_id) | models.Q(es_local=False))
+
+
 class CalificacionTributaria(models.Model):
     MERCADO_CHOICES = [
         ('ACN', 'Acciones'),
@@ -117,80 +306,20 @@ class CalificacionTributaria(models.Model):
         default=Decimal('0.00000000')
     )
     
-    # Factores tributarios (8-19)
-    factor_8 = models.DecimalField(
-        max_digits=9, decimal_places=8, default=Decimal('0.00000000'),
-        validators=[MinValueValidator(0), MaxValueValidator(1)],
-        help_text='Con crédito IDPC >= 01.01.2017'
-    )
-    factor_9 = models.DecimalField(
-        max_digits=9, decimal_places=8, default=Decimal('0.00000000'),
-        validators=[MinValueValidator(0), MaxValueValidator(1)],
-        help_text='Con crédito IDPC <= 31.12.2016'
-    )
-    factor_10 = models.DecimalField(
-        max_digits=9, decimal_places=8, default=Decimal('0.00000000'),
-        validators=[MinValueValidator(0), MaxValueValidator(1)],
-        help_text='Con derecho a crédito IDPC voluntario'
-    )
-    factor_11 = models.DecimalField(
-        max_digits=9, decimal_places=8, default=Decimal('0.00000000'),
-        validators=[MinValueValidator(0), MaxValueValidator(1)],
-        help_text='Sin derecho a crédito'
-    )
-    factor_12 = models.DecimalField(
-        max_digits=9, decimal_places=8, default=Decimal('0.00000000'),
-        validators=[MinValueValidator(0), MaxValueValidator(1)],
-        help_text='Rentas RAP y Diferencia Inicial'
-    )
-    factor_13 = models.DecimalField(
-        max_digits=9, decimal_places=8, default=Decimal('0.00000000'),
-        validators=[MinValueValidator(0), MaxValueValidator(1)]
-    )
-    factor_14 = models.DecimalField(
-        max_digits=9, decimal_places=8, default=Decimal('0.00000000'),
-        validators=[MinValueValidator(0), MaxValueValidator(1)]
-    )
-    factor_15 = models.DecimalField(
-        max_digits=9, decimal_places=8, default=Decimal('0.00000000'),
-        validators=[MinValueValidator(0), MaxValueValidator(1)]
-    )
-    factor_16 = models.DecimalField(
-        max_digits=9, decimal_places=8, default=Decimal('0.00000000'),
-        validators=[MinValueValidator(0), MaxValueValidator(1)]
-    )
-    factor_17 = models.DecimalField(
-        max_digits=9, decimal_places=8, default=Decimal('0.00000000'),
-        validators=[MinValueValidator(0), MaxValueValidator(1)]
-    )
-    factor_18 = models.DecimalField(
-        max_digits=9, decimal_places=8, default=Decimal('0.00000000'),
-        validators=[MinValueValidator(0), MaxValueValidator(1)]
-    )
-    factor_19 = models.DecimalField(
-        max_digits=9, decimal_places=8, default=Decimal('0.00000000'),
-        validators=[MinValueValidator(0), MaxValueValidator(1)]
+    # tsvector de la descripción para la búsqueda del admin (ver busqueda.py)
+    descripcion_busqueda = models.GeneratedField(
+        expression=SearchVector('descripcion', config='spanish'),
+        output_field=SearchVectorField(),
+        db_persist=True,
     )
     
-    # Factores 20-37 (mismo patrón)
-    factor_20 = models.DecimalField(max_digits=9, decimal_places=8, default=Decimal('0.00000000'), validators=[MinValueValidator(0), MaxValueValidator(1)])
-    factor_21 = models.DecimalField(max_digits=9, decimal_places=8, default=Decimal('0.00000000'), validators=[MinValueValidator(0), MaxValueValidator(1)])
-    factor_22 = models.DecimalField(max_digits=9, decimal_places=8, default=Decimal('0.00000000'), validators=[MinValueValidator(0), MaxValueValidator(1)])
-    factor_23 = models.DecimalField(max_digits=9, decimal_places=8, default=Decimal('0.00000000'), validators=[MinValueValidator(0), MaxValueValidator(1)])
-    factor_24 = models.DecimalField(max_digits=9, decimal_places=8, default=Decimal('0.00000000'), validators=[MinValueValidator(0), MaxValueValidator(1)])
-    factor_25 = models.DecimalField(max_digits=9, decimal_places=8, default=Decimal('0.00000000'), validators=[MinValueValidator(0), MaxValueValidator(1)])
-    factor_26 = models.DecimalField(max_digits=9, decimal_places=8, default=Decimal('0.00000000'), validators=[MinValueValidator(0), MaxValueValidator(1)])
-    factor_27 = models.DecimalField(max_digits=9, decimal_places=8, default=Decimal('0.00000000'), validators=[MinValueValidator(0), MaxValueValidator(1)])
-    factor_28 = models.DecimalField(max_digits=9, decimal_places=8, default=Decimal('0.00000000'), validators=[MinValueValidator(0), MaxValueValidator(1)])
-    factor_29 = models.DecimalField(max_digits=9, decimal_places=8, default=Decimal('0.00000000'), validators=[MinValueValidator(0), MaxValueValidator(1)])
-    factor_30 = models.DecimalField(max_digits=9, decimal_places=8, default=Decimal('0.00000000'), validators=[MinValueValidator(0), MaxValueValidator(1)])
-    factor_31 = models.DecimalField(max_digits=9, decimal_places=8, default=Decimal('0.00000000'), validators=[MinValueValidator(0), MaxValueValidator(1)])
-    factor_32 = models.DecimalField(max_digits=9, decimal_places=8, default=Decimal('0.00000000'), validators=[MinValueValidator(0), MaxValueValidator(1)])
-    factor_33 = models.DecimalField(max_digits=9, decimal_places=8, default=Decimal('0.00000000'), validators=[MinValueValidator(0), MaxValueValidator(1)])
-    factor_34 = models.DecimalField(max_digits=9, decimal_places=8, default=Decimal('0.00000000'), validators=[MinValueValidator(0), MaxValueValidator(1)])
-    factor_35 = models.DecimalField(max_digits=9, decimal_places=8, default=Decimal('0.00000000'), validators=[MinValueValidator(0), MaxValueValidator(1)])
-    factor_36 = models.DecimalField(max_digits=9, decimal_places=8, default=Decimal('0.00000000'), validators=[MinValueValidator(0), MaxValueValidator(1)])
-    factor_37 = models.DecimalField(max_digits=9, decimal_places=8, default=Decimal('0.00000000'), validators=[MinValueValidator(0), MaxValueValidator(1)])
+    # Factores tributarios 8-37 (ver DEFINICION_FACTOR y las propiedades factor_N)
+    factores = ArrayField(
+        models.BigIntegerField(),
+        size=len(CAMPOS_FACTOR),
+        default=factores_en_cero,
+        help_text='Factores 8 al 37 como enteros escalados por 10^8 (factor_8 es la posición 0)'
+    )
     
     # Metadatos
     origen = models.CharField(max_length=10, choices=ORIGEN_CHOICES, default='MANUAL')
@@ -199,10 +328,19 @@ class CalificacionTributaria(models.Model):
         help_text='True: local del corredor | False: compartido del sistema'
     )
     
+    hash_contenido = models.CharField(
+        max_length=32,
+        blank=True,
+        editable=False,
+        help_text='MD5 de los datos de la calificación, para detectar recargas sin cambios'
+    )
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CalificacionQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Calificación Tributaria'
         verbose_name_plural = 'Calificaciones Tributarias'
@@ -211,22 +349,61 @@ class CalificacionTributaria(models.Model):
         indexes = [
             models.Index(fields=['usuario', 'ejercicio', 'mercado']),
             models.Index(fields=['instrumento', 'fecha_pago']),
+            # Orden por defecto (+ id, que agrega el admin): primera página sin ordenar la tabla
+            models.Index(fields=['-ejercicio', '-fecha_pago', '-id'], name='calificacion_orden_idx'),
+            # Búsqueda: icontains de instrumento (pg_trgm) y texto de la descripción
+            GinIndex(OpClass(Upper('instrumento'), name='gin_trgm_ops'), name='calificacion_instr_trgm_idx'),
+            GinIndex(fields=['descripcion_busqueda'], name='calificacion_desc_busq_idx'),
+            # Compartidas del sistema, el otro lado de visibles_para()
+            models.Index(
+                fields=['ejercicio', 'mercado'],
+                condition=models.Q(es_local=False),
+                name='calificacion_compartidas_idx',
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=CLAVE_NATURAL,
+                name='calificacion_clave_natural',
+            ),
+            *RESTRICCIONES_FACTORES,
         ]
     
     def __str__(self):
         return f"{self.instrumento} - {self.ejercicio} - Sec.{self.secuencia_evento}"
     
+    def save(self, *args, **kwargs):
+        self.hash_contenido = self.calcular_hash_contenido()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'hash_contenido'}
+        super().save(*args, **kwargs)
+    
+    def get_constraints(self):
+        # Los límites y la suma de los factores los valida clean(), con los
+        # mensajes de cada factor_N: Q.check() no puede evaluar posiciones de bigint[]
+        return [
+            (modelo, [restriccion for restriccion in restricciones if restriccion.name not in RESTRICCIONES_EN_CLEAN])
+            for modelo, restricciones in super().get_constraints()
+        ]
+    
+    def calcular_hash_contenido(self):
+        """Hash de los campos que vienen en un archivo DJ1948"""
+        return hash_valores({campo: getattr(self, campo) for campo in COLUMNAS_CONTENIDO})
+    
     def clean(self):
-        """Validación: Suma factores 8-16 <= 1"""
+        """Validación: factores entre 0 y 1, suma factores 8-16 <= 1 (mismas reglas que las cargas masivas) y ejercicio abierto"""
         from django.core.exceptions import ValidationError
-        suma = sum([
-            self.factor_8, self.factor_9, self.factor_10, self.factor_11,
-            self.factor_12, self.factor_13, self.factor_14, self.factor_15, self.factor_16
-        ])
-        if suma > 1:
-            raise ValidationError(
-                f'La suma de los factores 8 al 16 no puede superar 1. Suma actual: {suma}'
-            )
+        from .validacion import a_validation_error, lote_factores, validar_factores
+        errores = validar_factores(lote_factores([self.factores]))[0]
+        if errores:
+            raise a_validation_error(errores)
+        if EjercicioCerrado.objects.filter(ejercicio=self.ejercicio).exists():
+            raise ValidationError({'ejercicio': MENSAJE_EJERCICIO_CERRADO.format(ejercicio=self.ejercicio)})
+
+
+for _indice, _campo in enumerate(CAMPOS_FACTOR):
+    setattr(CalificacionTributaria, _campo, _propiedad_factor(_indice))
 
 
 # ============================================
@@ -238,14 +415,18 @@ class LogOperacion(models.Model):
         ('UPDATE', 'Actualización'),
         ('DELETE', 'Eliminación'),
         ('CARGA', 'Carga Masiva'),
+        ('CORRECCION', 'Corrección Masiva'),
     ]
     
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='logs')
+    # Sin clave foránea en la base: calificacion_tributaria está particionada
+    # por ejercicio y su PK es (id, ejercicio) (ver ejercicios.py)
     calificacion = models.ForeignKey(
         CalificacionTributaria, 
         on_delete=models.SET_NULL, 
         null=True, 
         blank=True,
+        db_constraint=False,
         related_name='logs'
     )
     carga_masiva = models.ForeignKey(
@@ -256,9 +437,19 @@ class LogOperacion(models.Model):
         related_name='logs'
     )
     
+    calificacion_ref = models.BigIntegerField(
+        null=True,
+        blank=True,
+        help_text='Id de la calificación (se conserva aunque la calificación se elimine)'
+    )
+    
     operacion = models.CharField(max_length=10, choices=OPERACION_CHOICES)
-    datos_anteriores = models.JSONField(null=True, blank=True, help_text='Estado antes de la operación')
-    datos_nuevos = models.JSONField(null=True, blank=True, help_text='Estado después de la operación')
+    datos_anteriores = models.JSONField(null=True, blank=True, help_text='Campos modificados: valores anteriores')
+    datos_nuevos = models.JSONField(null=True, blank=True, help_text='Campos modificados: valores nuevos')
+    es_checkpoint = models.BooleanField(
+        default=False,
+        help_text='datos_nuevos contiene el estado completo de la calificación'
+    )
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     fecha_hora = models.DateTimeField(auto_now_add=True)
     
@@ -267,6 +458,74 @@ class LogOperacion(models.Model):
         verbose_name_plural = 'Logs de Operaciones'
         db_table = 'log_operacion'
         ordering = ['-fecha_hora']
+        indexes = [
+            models.Index(fields=['calificacion_ref', 'fecha_hora']),
+            models.Index(fields=['fecha_hora']),
+            # Las correcciones masivas no tienen calificacion_ref (ver auditoria.correcciones_de)
+            models.Index(
+                fields=['fecha_hora'],
+                condition=models.Q(operacion='CORRECCION'),
+                name='log_correccion_fecha_idx',
+            ),
+        ]
     
     def __str__(self):
-        return f"{self.get_operacion_display()} - {self.usuario.username} - {self.fecha_hora.strftime('%d/%m/%Y %H:%M')}"
\ No newline at end of file
+        return f"{self.get_operacion_display()} - {self.usuario.username} - {self.fecha_hora.strftime('%d/%m/%Y %H:%M')}"
+
+# ============================================
+# MODELO: EJERCICIOS CERRADOS
+# ============================================
+MENSAJE_EJERCICIO_CERRADO = 'El ejercicio {ejercicio} está cerrado: sus calificaciones son de solo lectura'
+
+
+class EjercicioCerrado(models.Model):
+    """
+    Ejercicio cuyas calificaciones están en una partición de solo lectura
+    de calificacion_tributaria (ver ejercicios.py).
+    """
+    ejercicio = models.IntegerField(unique=True)
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        help_text='Quién cerró el ejercicio'
+    )
+    registros = models.IntegerField(default=0, help_text='Calificaciones movidas a la partición al cerrar')
+    fecha_cierre = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Ejercicio Cerrado'
+        verbose_name_plural = 'Ejercicios Cerrados'
+        db_table = 'ejercicio_cerrado'
+        ordering = ['-ejercicio']
+    
+    def __str__(self):
+        return f"Ejercicio {self.ejercicio}"
+
+
+# ============================================
+# MODELO: RESUMEN DE CALIFICACIONES
+# ============================================
+class ResumenCalificacion(models.Model):
+    """
+    Vista materializada resumen_calificacion (ver resumenes.py): una fila
+    por ejercicio, mercado, origen y corredor, con sumas que permiten
+    agregar a cualquier nivel sin leer calificacion_tributaria.
+    """
+    pk = models.CompositePrimaryKey('ejercicio', 'mercado', 'origen', 'usuario')
+    ejercicio = models.IntegerField()
+    mercado = models.CharField(max_length=3, choices=CalificacionTributaria.MERCADO_CHOICES)
+    origen = models.CharField(max_length=10, choices=CalificacionTributaria.ORIGEN_CHOICES)
+    usuario = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    cantidad = models.BigIntegerField()
+    suma_valor_historico = models.DecimalField(max_digits=30, decimal_places=2)
+    # Suma de cada posición de `factores` (enteros escalados por 10^8)
+    sumas_factores = ArrayField(models.DecimalField(max_digits=30, decimal_places=0))
+    actualizado = models.DateTimeField(help_text='Momento del último refresco de la vista')
+    
+    class Meta:
+        managed = False
+        db_table = 'resumen_calificacion'
+        verbose_name = 'Resumen de Calificaciones'
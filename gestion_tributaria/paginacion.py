@@ -0,0 +1,34 @@
+"""
+Paginador del admin para tablas grandes.
+
+COUNT(*) sobre millones de filas recorre toda la tabla (o partición) en
+cada página. Este paginador cuenta como máximo CONTEO_EXACTO_MAXIMO filas;
+si hay más, usa la estimación del planificador de PostgreSQL (EXPLAIN) para
+la misma consulta, que no lee la tabla.
+"""
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+CONTEO_EXACTO_MAXIMO = 10000
+
+
+class ConteoEstimadoPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        acotado = queryset[:CONTEO_EXACTO_MAXIMO + 1].count()
+        if acotado <= CONTEO_EXACTO_MAXIMO:
+            return acotado
+        if connections[queryset.db].vendor != 'postgresql':
+            return queryset.count()
+        return max(estimar_filas(queryset), acotado)
+
+
+def estimar_filas(queryset):
+    """Filas que el planificador de PostgreSQL espera para el queryset"""
+    plan = json.loads(queryset.explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
@@ -0,0 +1,162 @@
+"""
+Particiones mensuales de log_operacion (solo PostgreSQL).
+
+La tabla está particionada por RANGE sobre fecha_hora con una partición por
+mes (log_operacion_pAAAAMM, límites en UTC) y una partición DEFAULT que
+recibe las filas de meses sin partición. `manage.py particionar_logs` crea
+por adelantado las particiones de los meses siguientes y archiva las que
+quedan fuera del período de retención: las exporta a un CSV comprimido y
+luego las separa (DETACH) y elimina.
+"""
+import gzip
+import os
+import re
+from datetime import date, timezone as tz
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import LogOperacion
+
+TABLA = LogOperacion._meta.db_table
+PARTICION_DEFAULT = f'{TABLA}_default'
+NOMBRE_PARTICION = re.compile(rf'^{TABLA}_p(\d{{4}})(\d{{2}})$')
+
+
+def disponible():
+    return connection.vendor == 'postgresql'
+
+
+def nombre_particion(mes):
+    return f'{TABLA}_p{mes:%Y%m}'
+
+
+def sumar_meses(mes, meses):
+    total = mes.year * 12 + mes.month - 1 + meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def mes_actual():
+    hoy = timezone.now().astimezone(tz.utc)
+    return date(hoy.year, hoy.month, 1)
+
+
+def particiones_existentes():
+    """Meses (primer día) que ya tienen partición, ordenados"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = %s::regclass',
+            [TABLA],
+        )
+        nombres = [fila[0] for fila in cursor.fetchall()]
+    meses = []
+    for nombre in nombres:
+        coincidencia = NOMBRE_PARTICION.match(nombre)
+        if coincidencia:
+            meses.append(date(int(coincidencia[1]), int(coincidencia[2]), 1))
+    return sorted(meses)
+
+
+def _limites(mes):
+    return f'{mes:%Y-%m-%d} 00:00:00+00', f'{sumar_meses(mes, 1):%Y-%m-%d} 00:00:00+00'
+
+
+# ============================================
+# CREACIÓN
+# ============================================
+def crear_particiones(meses_futuros, simular=False):
+    """
+    Crea las particiones del mes actual y los `meses_futuros` siguientes.
+
+    Si la partición DEFAULT ya tiene filas de un mes (porque faltó su
+    partición), se mueven a la nueva dentro de la misma transacción:
+    PostgreSQL no permite crear la partición con esas filas en DEFAULT.
+    Devuelve los nombres de las particiones creadas.
+    """
+    existentes = set(particiones_existentes())
+    inicio = mes_actual()
+    creadas = []
+    for desplazamiento in range(meses_futuros + 1):
+        mes = sumar_meses(inicio, desplazamiento)
+        if mes in existentes:
+            continue
+        if not simular:
+            _crear_particion(mes)
+        creadas.append(nombre_particion(mes))
+    return creadas
+
+
+def _crear_particion(mes):
+    nombre = nombre_particion(mes)
+    desde, hasta = _limites(mes)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {PARTICION_DEFAULT} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE movidas ON COMMIT DROP AS '
+            f'SELECT * FROM {PARTICION_DEFAULT} WHERE fecha_hora >= %s AND fecha_hora < %s',
+            [desde, hasta],
+        )
+        cursor.execute(
+            f'DELETE FROM {PARTICION_DEFAULT} WHERE fecha_hora >= %s AND fecha_hora < %s',
+            [desde, hasta],
+        )
+        cursor.execute(
+            f'CREATE TABLE {nombre} PARTITION OF {TABLA} FOR VALUES FROM (%s) TO (%s)',
+            [desde, hasta],
+        )
+        cursor.execute(f'INSERT INTO {TABLA} SELECT * FROM movidas')
+        # Dentro de una transacción mayor ON COMMIT DROP no alcanza a
+        # correr antes de la partición siguiente
+        cursor.execute('DROP TABLE movidas')
+
+
+# ============================================
+# RETENCIÓN Y ARCHIVO
+# ============================================
+def particiones_vencidas(retener_meses):
+    """Meses con partición anteriores al período de retención"""
+    limite = sumar_meses(mes_actual(), -retener_meses)
+    return [mes for mes in particiones_existentes() if mes < limite]
+
+
+def archivar_particiones(retener_meses, directorio, simular=False):
+    """
+    Exporta a `directorio` cada partición vencida como <nombre>.csv.gz
+    (COPY con cabecera) y después la separa de la tabla y la elimina.
+
+    La partición solo se elimina una vez que el archivo quedó escrito
+    completo. Devuelve las rutas de los archivos generados.
+    """
+    archivos = []
+    for mes in particiones_vencidas(retener_meses):
+        nombre = nombre_particion(mes)
+        ruta = os.path.join(directorio, f'{nombre}.csv.gz')
+        archivos.append(ruta)
+        if simular:
+            continue
+        os.makedirs(directorio, exist_ok=True)
+        _exportar(nombre, ruta)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {TABLA} DETACH PARTITION {nombre}')
+            cursor.execute(f'DROP TABLE {nombre}')
+    return archivos
+
+
+def _exportar(nombre, ruta):
+    temporal = f'{ruta}.parcial'
+    with connection.cursor() as cursor, gzip.open(temporal, 'wb') as destino:
+        _copiar_a(cursor, f'COPY {nombre} TO STDOUT WITH (FORMAT csv, HEADER)', destino)
+    os.replace(temporal, ruta)
+
+
+def _copiar_a(cursor, sql, destino):
+    crudo = cursor.cursor
+    if hasattr(crudo, 'copy_expert'):
+        # psycopg2
+        crudo.copy_expert(sql, destino)
+        return
+    # psycopg 3
+    with crudo.copy(sql) as copia:
+        for bloque in copia:
+            destino.write(bloque)
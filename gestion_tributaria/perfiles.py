@@ -0,0 +1,85 @@
+"""
+Rol del usuario de la petición y alcance de sus calificaciones.
+
+El rol se guarda en el caché de Django por usuario (PERFIL_ROL_TTL) y,
+dentro de una misma petición, en el propio request: el admin, los filtros
+y la API preguntan por el rol sin volver a consultar Perfil. Los cambios
+de Perfil lo invalidan (ver signals.py).
+
+Las funciones con prefijo `a` son las equivalentes para vistas async.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import CalificacionTributaria, Perfil
+
+CLAVE_ROL = 'perfiles:rol:{}'
+
+
+def rol_de_usuario(usuario_id):
+    """Rol del Perfil ('ADMIN', 'CORREDOR'), o '' si el usuario no tiene perfil"""
+    clave = CLAVE_ROL.format(usuario_id)
+    rol = cache.get(clave)
+    if rol is None:
+        rol = Perfil.objects.filter(usuario_id=usuario_id).values_list('rol', flat=True).first() or ''
+        cache.set(clave, rol, settings.PERFIL_ROL_TTL)
+    return rol
+
+
+async def arol_de_usuario(usuario_id):
+    clave = CLAVE_ROL.format(usuario_id)
+    rol = await cache.aget(clave)
+    if rol is None:
+        rol = await Perfil.objects.filter(usuario_id=usuario_id).values_list('rol', flat=True).afirst() or ''
+        await cache.aset(clave, rol, settings.PERFIL_ROL_TTL)
+    return rol
+
+
+def invalidar_rol(usuario_id):
+    cache.delete(CLAVE_ROL.format(usuario_id))
+
+
+def rol(request):
+    if not hasattr(request, '_rol'):
+        request._rol = rol_de_usuario(request.user.pk) if request.user.is_authenticated else ''
+    return request._rol
+
+
+async def arol(request):
+    if not hasattr(request, '_rol'):
+        usuario = await request.auser()
+        request._rol = await arol_de_usuario(usuario.pk) if usuario.is_authenticated else ''
+    return request._rol
+
+
+def es_administrador(request):
+    """Superusuarios y perfiles ADMIN ven las calificaciones de todos"""
+    return request.user.is_superuser or rol(request) == 'ADMIN'
+
+
+async def aes_administrador(request):
+    usuario = await request.auser()
+    return usuario.is_superuser or await arol(request) == 'ADMIN'
+
+
+def calificaciones_visibles(request):
+    """Calificaciones del usuario más las compartidas del sistema (todas para administradores)"""
+    return CalificacionTributaria.objects.visibles_para(request.user.pk, es_administrador(request))
+
+
+def es_visible(calificacion, usuario_id, ver_todas=False):
+    """Mismo criterio que CalificacionTributaria.objects.visibles_para(), sobre una calificación ya leída"""
+    return ver_todas or calificacion.usuario_id == usuario_id or not calificacion.es_local
+
+
+def puede_modificar(request, calificacion):
+    """Las compartidas (y las de otros corredores) solo las modifican administradores"""
+    return es_administrador(request) or calificacion.usuario_id == request.user.pk
+
+
+def nombre_usuario(usuario):
+    """Nombre para listados; requiere usuario__perfil en select_related"""
+    try:
+        return usuario.perfil.nombre_completo
+    except Perfil.DoesNotExist:
+        return usuario.username
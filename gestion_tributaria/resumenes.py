@@ -0,0 +1,99 @@
+"""
+Resúmenes de calificaciones por ejercicio, mercado, origen y corredor.
+
+Leen la vista materializada resumen_calificacion (modelo
+ResumenCalificacion), que guarda cantidades y sumas por grupo: cualquier
+agrupación más gruesa se obtiene sumando sus filas, así que el costo
+depende de la cantidad de grupos y no de la de calificaciones. La vista se
+actualiza con `manage.py refrescar_resumenes` (REFRESH CONCURRENTLY: las
+lecturas no se bloquean mientras se recalcula).
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+
+from . import perfiles
+from .formato_dj1948 import DECIMALES_FACTOR
+from .models import CalificacionTributaria, ResumenCalificacion
+
+# Nombre en el tablero -> campo de ResumenCalificacion
+DIMENSIONES = {
+    'ejercicio': 'ejercicio',
+    'mercado': 'mercado',
+    'origen': 'origen',
+    'corredor': 'usuario_id',
+}
+ETIQUETAS = {
+    'mercado': dict(CalificacionTributaria.MERCADO_CHOICES),
+    'origen': dict(CalificacionTributaria.ORIGEN_CHOICES),
+}
+CUANTO_FACTOR = Decimal(1).scaleb(-DECIMALES_FACTOR)
+
+
+def refrescar(concurrente=True):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'REFRESH MATERIALIZED VIEW {"CONCURRENTLY " if concurrente else ""}'
+            f'{ResumenCalificacion._meta.db_table}'
+        )
+
+
+def actualizado():
+    """Momento del último refresco (None si la vista está vacía)"""
+    return ResumenCalificacion.objects.values_list('actualizado', flat=True).first()
+
+
+def resumen(agrupar_por, **filtros):
+    """
+    Filas {dimensión: valor, ..., cantidad, suma_valor_historico,
+    promedio_valor_historico, promedios_factores} agrupadas por las
+    `agrupar_por` (claves de DIMENSIONES), ordenadas por ellas.
+    `filtros` se aplican sobre ResumenCalificacion (p. ej. ejercicio=2024).
+    """
+    campos = [DIMENSIONES[dimension] for dimension in agrupar_por]
+    grupos = {}
+    filas = ResumenCalificacion.objects.filter(**filtros).values_list(
+        *campos, 'cantidad', 'suma_valor_historico', 'sumas_factores',
+    )
+    for *clave, cantidad, suma_valor, sumas_factores in filas.iterator():
+        grupo = grupos.get(tuple(clave))
+        if grupo is None:
+            grupos[tuple(clave)] = [cantidad, suma_valor, list(sumas_factores)]
+            continue
+        grupo[0] += cantidad
+        grupo[1] += suma_valor
+        grupo[2] = [acumulada + suma for acumulada, suma in zip(grupo[2], sumas_factores)]
+
+    resultado = []
+    for clave in sorted(grupos):
+        cantidad, suma_valor, sumas_factores = grupos[clave]
+        fila = dict(zip(agrupar_por, clave))
+        fila.update(
+            cantidad=cantidad,
+            suma_valor_historico=suma_valor,
+            promedio_valor_historico=(suma_valor / cantidad).quantize(Decimal('0.01')),
+            promedios_factores=[
+                (suma / cantidad).scaleb(-DECIMALES_FACTOR).quantize(CUANTO_FACTOR) for suma in sumas_factores
+            ],
+        )
+        resultado.append(fila)
+    _agregar_etiquetas(resultado, agrupar_por)
+    return resultado
+
+
+def _agregar_etiquetas(filas, agrupar_por):
+    """Texto de cada valor de dimensión en 'etiquetas' (nombres de corredores en una consulta)"""
+    nombres = {}
+    if 'corredor' in agrupar_por:
+        ids = {fila['corredor'] for fila in filas}
+        nombres = {
+            usuario.pk: perfiles.nombre_usuario(usuario)
+            for usuario in User.objects.filter(pk__in=ids).select_related('perfil')
+        }
+    for fila in filas:
+        fila['etiquetas'] = [
+            nombres.get(fila[dimension], fila[dimension]) if dimension == 'corredor'
+            else ETIQUETAS.get(dimension, {}).get(fila[dimension], fila[dimension])
+            for dimension in agrupar_por
+        ]
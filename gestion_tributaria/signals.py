@@ -0,0 +1,28 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import cache_calificaciones, ejercicios, facetas, perfiles
+from .models import CalificacionTributaria, CargaMasiva, Perfil
+
+
+@receiver([post_save, post_delete], sender=CalificacionTributaria)
+def invalidar_facetas(sender, **kwargs):
+    transaction.on_commit(facetas.invalidar)
+    transaction.on_commit(cache_calificaciones.invalidar)
+
+
+@receiver([post_save, post_delete], sender=Perfil)
+def invalidar_rol(sender, instance, **kwargs):
+    transaction.on_commit(lambda: perfiles.invalidar_rol(instance.usuario_id))
+
+
+@receiver(pre_delete, sender=User)
+def proteger_cerrados_usuario(sender, instance, **kwargs):
+    ejercicios.rechazar_eliminacion(usuarios=[instance])
+
+
+@receiver(pre_delete, sender=CargaMasiva)
+def proteger_cerrados_carga(sender, instance, **kwargs):
+    ejercicios.rechazar_eliminacion(cargas=[instance])
@@ -1,3 +1,1803 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import mmap
+import os
+import tempfile
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta, timezone as tz
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, IntegrityError, connection, connections, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    admin,
+    auditoria,
+    cache_calificaciones,
+    carga_masiva,
+    carga_paralela,
+    conversion,
+    correcciones,
+    datos_sinteticos,
+    ejercicios,
+    exportacion,
+    facetas,
+    formato_dj1948,
+    instrumentacion,
+    lectura_mmap,
+    particiones,
+    perfiles,
+    resumenes,
+    trabajos,
+    validacion,
+    views,
+)
+from .carga_masiva import procesar_carga
+from .models import CalificacionTributaria, CargaMasiva, LogOperacion, Perfil
+
+
+# ============================================
+# CARGA MASIVA
+# ============================================
+class CargaMasivaTest(TestCase):
+
+    CABECERA = 'ejercicio;mercado;instrumento;fecha_pago;secuencia_evento;tipo_sociedad;factor_8'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.corredor = User.objects.create_user('corredor')
+
+    def _archivo(self, lineas, cabecera=None):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8-sig', newline='', delete=False) as archivo:
+            archivo.write('\r\n'.join([cabecera or self.CABECERA, *lineas]) + '\r\n')
+        self.addCleanup(os.remove, archivo.name)
+        return archivo.name
+
+    def _cargar(self, ruta, modo='INSERTAR', **kwargs):
+        carga = CargaMasiva.objects.create(
+            usuario=self.corredor, tipo_carga='FACTORES', modo=modo, nombre_archivo='dj1948.csv',
+        )
+        return procesar_carga(carga, ruta, **kwargs)
+
+    def test_filas_invalidas(self):
+        ruta = self._archivo([
+            '2024;ACN;CHILE;15/05/2024;1;A;0.5',
+            '2024;XXX;CHILE;15/05/2024;2;A;0.5',
+            '2024;ACN;CHILE;31/02/2024;3;A;0.5',
+            '2024;ACN;SQM-B;15/05/2024;4;A;0.25',
+        ])
+        # Un lote por fila: errores_detalle se completa en varias actualizaciones
+        carga = self._cargar(ruta, tamano_lote=1)
+        self.assertEqual(
+            (carga.registros_procesados, carga.registros_exitosos, carga.registros_fallidos), (4, 2, 2),
+        )
+        errores = carga.errores_detalle.splitlines()
+        self.assertEqual([error.split(':')[0] for error in errores], ['Fila 3', 'Fila 4'])
+        self.assertEqual(
+            sorted(CalificacionTributaria.objects.values_list('instrumento', flat=True)), ['CHILE', 'SQM-B'],
+        )
+
+    def test_lote_de_cargar_dj1948(self):
+        ruta = self._archivo([f'2024;ACN;INS{n};15/05/2024;{n};A;0.5' for n in range(5)])
+        with mock.patch.object(trabajos, 'procesar_carga', wraps=trabajos.procesar_carga) as procesar:
+            call_command('cargar_dj1948', ruta, usuario='corredor', lote=2, stdout=io.StringIO())
+        self.assertEqual(procesar.call_args.args[2], 2)
+        self.assertEqual(CalificacionTributaria.objects.count(), 5)
+
+        call_command('cargar_dj1948', ruta, usuario='corredor', lote=3, encolar=True, stdout=io.StringIO())
+        encolada = CargaMasiva.objects.get(estado='PENDIENTE')
+        self.addCleanup(encolada.archivo.delete, save=False)
+        self.assertEqual(encolada.tamano_lote, 3)
+
+    def test_upsert_contadores(self):
+        lineas = [f'2024;ACN;INS{n};15/05/2024;{n};A;0.{n}' for n in range(4)]
+        primera = self._cargar(self._archivo(lineas), 'UPSERT')
+        repetida = self._cargar(self._archivo(lineas), 'UPSERT')
+        lineas[1] = '2024;ACN;INS1;15/05/2024;1;A;0.9'
+        modificada = self._cargar(self._archivo(lineas + ['2024;ACN;INS4;15/05/2024;4;A;0']), 'UPSERT')
+        contadores = ['registros_insertados', 'registros_actualizados', 'registros_sin_cambios', 'registros_fallidos']
+        self.assertEqual(
+            [[getattr(carga, campo) for campo in contadores] for carga in (primera, repetida, modificada)],
+            [[4, 0, 0, 0], [0, 0, 4, 0], [1, 1, 3, 0]],
+        )
+        self.assertEqual(CalificacionTributaria.objects.count(), 5)
+        self.assertEqual(CalificacionTributaria.objects.get(instrumento='INS1').factor_8, Decimal('0.9'))
+        self.assertEqual(LogOperacion.objects.filter(operacion='UPDATE').count(), 1)
+
+    def test_migracion_0002(self):
+        # Las funciones de la migración con el modelo de entonces (factor_N) sobre una tabla temporal
+        migracion = import_module('gestion_tributaria.migrations.0002_carga_upsert')
+        estado = MigrationLoader(connection).project_state(('gestion_tributaria', '0002_carga_upsert')).apps
+        Anterior = estado.get_model('gestion_tributaria', 'CalificacionTributaria')
+        columnas = ', '.join(f'{campo.column} {campo.db_type(connection)}' for campo in Anterior._meta.concrete_fields)
+        with connection.cursor() as cursor:
+            # pg_temp va primero en search_path: tapa a la tabla real en esta sesión
+            cursor.execute(f'CREATE TEMPORARY TABLE calificacion_tributaria ({columnas}, PRIMARY KEY (id))')
+        filas = [(1, 'CHILE', '0.5'), (2, 'CHILE', '0.5'), (3, 'SQM-B', '0.25'), (4, 'SQM-B', '0.3')]
+        for pk, instrumento, factor in filas:
+            Anterior.objects.create(
+                pk=pk, usuario_id=self.corredor.pk, ejercicio=2024, mercado='ACN', instrumento=instrumento,
+                fecha_pago=date(2024, 5, 15), secuencia_evento=1, tipo_sociedad='A', factor_8=Decimal(factor),
+            )
+        log = LogOperacion.objects.create(usuario=self.corredor, operacion='UPDATE', calificacion_id=2)
+
+        with connection.schema_editor() as editor:
+            migracion.calcular_hashes(estado, editor)
+            with self.assertRaisesMessage(RuntimeError, '[3, 4]'):
+                migracion.fusionar_repetidas(estado, editor)
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM calificacion_tributaria WHERE id = 4')
+        with connection.schema_editor() as editor:
+            migracion.fusionar_repetidas(estado, editor)
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id, hash_contenido FROM calificacion_tributaria ORDER BY id')
+            hashes = dict(cursor.fetchall())
+            cursor.execute('DROP TABLE pg_temp.calificacion_tributaria')
+        self.assertEqual(list(hashes), [1, 3])
+        esperada = CalificacionTributaria(
+            usuario=self.corredor, ejercicio=2024, mercado='ACN', instrumento='CHILE',
+            fecha_pago=date(2024, 5, 15), secuencia_evento=1, tipo_sociedad='A',
+        )
+        esperada.factor_8 = Decimal('0.5')
+        self.assertEqual(hashes[1], esperada.calcular_hash_contenido())
+        log.refresh_from_db()
+        self.assertEqual(log.calificacion_id, 1)
+
+    def test_lotes_del_usuario_se_escriben_de_a_uno(self):
+        # Otra sesión con el bloqueo del usuario (una carga en curso): esta espera
+        otra = connections[DEFAULT_DB_ALIAS].copy()
+        self.addCleanup(otra.close)
+        with otra.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock(%s, %s)', [carga_masiva.ESPACIO_BLOQUEO, self.corredor.pk])
+        ruta = self._archivo(['2024;ACN;CHILE;15/05/2024;1;A;0.5'])
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL lock_timeout = '200ms'")
+            self._cargar(ruta, 'UPSERT')
+        with otra.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s, %s)', [carga_masiva.ESPACIO_BLOQUEO, self.corredor.pk])
+        self.assertEqual(self._cargar(ruta, 'UPSERT').registros_insertados, 1)
+
+    def test_recarga_registra_el_factor_cambiado(self):
+        self._cargar(self._archivo(['2024;ACN;CHILE;15/05/2024;1;A;0.5', '2024;ACN;SQM-B;15/05/2024;2;A;0.25']))
+        carga = self._cargar(
+            self._archivo(['2024;ACN;CHILE;15/05/2024;1;A;0.75', '2024;ACN;SQM-B;15/05/2024;2;A;0.25']), 'UPSERT',
+        )
+        self.assertEqual((carga.registros_actualizados, carga.registros_sin_cambios), (1, 1))
+        log = LogOperacion.objects.get(operacion='UPDATE')
+        self.assertEqual(log.calificacion_ref, CalificacionTributaria.objects.get(instrumento='CHILE').pk)
+        self.assertEqual(log.datos_anteriores['factor_8'], '0.50000000')
+        self.assertEqual(log.datos_nuevos['factor_8'], '0.75000000')
+        self.assertEqual(log.datos_nuevos['carga_masiva_id'], carga.pk)
+        self.assertNotIn('factor_9', log.datos_nuevos)
+
+
+# ============================================
+# COLA DE CARGAS (WORKER)
+# ============================================
+class ColaCargasTest(TestCase):
+    """El worker toma, retoma y da por fallidas las cargas según su estado, latido e intentos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.corredor = User.objects.create_user('corredor')
+
+    def setUp(self):
+        self.ruta = self._archivo(5)
+
+    def _archivo(self, filas):
+        lineas = ['ejercicio;mercado;instrumento;fecha_pago;secuencia_evento;tipo_sociedad;factor_8']
+        lineas += [f'2024;ACN;INS{n};15/05/2024;{n};A;0.5' for n in range(filas)]
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as archivo:
+            archivo.write('\n'.join(lineas) + '\n')
+        self.addCleanup(os.remove, archivo.name)
+        return archivo.name
+
+    def _carga(self, **campos):
+        campos = {'archivo': 'cargas/dj1948.csv', **campos}
+        return CargaMasiva.objects.create(
+            usuario=self.corredor, tipo_carga='FACTORES', nombre_archivo='dj1948.csv', **campos,
+        )
+
+    def test_toma_la_mas_antigua_y_no_las_activas(self):
+        activa = self._carga(estado='PROCESANDO', worker='vivo', latido=timezone.now())
+        pendiente = self._carga()
+        self._carga(estado='COMPLETADA')
+        self._carga(archivo='')
+        tomada = trabajos.tomar_siguiente_carga('nuevo')
+        self.assertEqual(tomada.pk, pendiente.pk)
+        self.assertEqual((tomada.estado, tomada.worker, tomada.intentos), ('PROCESANDO', 'nuevo', 1))
+        self.assertIsNone(trabajos.tomar_siguiente_carga('otro'))
+        activa.refresh_from_db()
+        self.assertEqual(activa.worker, 'vivo')
+
+    def test_retoma_abandonada_desde_el_ultimo_lote(self):
+        # El worker anterior confirmó un lote de 2 filas y dejó de latir
+        carga = self._carga(estado='PROCESANDO', worker='muerto', intentos=1)
+        procesar_carga(carga, self._archivo(2), tamano_lote=2, worker='muerto')
+        CargaMasiva.objects.filter(pk=carga.pk).update(
+            latido=timezone.now() - timedelta(seconds=settings.CARGA_MASIVA_LATIDO_MAXIMO + 1),
+        )
+
+        with self.assertLogs('gestion_tributaria.trabajos', 'WARNING'):
+            tomada = trabajos.tomar_siguiente_carga('nuevo')
+        self.assertEqual((tomada.pk, tomada.worker, tomada.intentos), (carga.pk, 'nuevo', 2))
+        carga = trabajos.ejecutar_carga(tomada, self.ruta, worker='nuevo')
+        self.assertEqual(carga.estado, 'COMPLETADA')
+        self.assertEqual(
+            (carga.registros_procesados, carga.registros_insertados, carga.registros_fallidos), (5, 5, 0),
+        )
+        self.assertEqual(CalificacionTributaria.objects.count(), 5)
+        self.assertTrue(LogOperacion.objects.filter(operacion='CARGA', carga_masiva=carga).exists())
+
+    def test_carga_interrumpida_no_escribe(self):
+        # Otro worker la tomó mientras esta seguía: sus lotes se descartan
+        carga = self._carga(estado='PROCESANDO', worker='nuevo', latido=timezone.now())
+        with self.assertLogs('gestion_tributaria.trabajos', 'WARNING') as logs:
+            carga = trabajos.ejecutar_carga(carga, self.ruta, worker='anterior')
+        self.assertIn('ya no está asignada a anterior', logs.output[0])
+        self.assertEqual((carga.estado, carga.worker, carga.registros_procesados), ('PROCESANDO', 'nuevo', 0))
+        self.assertFalse(CalificacionTributaria.objects.exists())
+        self.assertFalse(LogOperacion.objects.exists())
+
+    @override_settings(CARGA_MASIVA_MAX_INTENTOS=2)
+    def test_reintentos_hasta_fallida(self):
+        carga = self._carga()
+        with mock.patch.object(trabajos, 'procesar_carga', side_effect=RuntimeError('sin conexión')):
+            for intento, estado in [(1, 'PENDIENTE'), (2, 'FALLIDA')]:
+                carga = trabajos.tomar_siguiente_carga('worker')
+                with self.assertLogs('gestion_tributaria.trabajos', 'ERROR'):
+                    carga = trabajos.ejecutar_carga(carga, self.ruta, worker='worker')
+                self.assertEqual((carga.estado, carga.intentos, carga.worker), (estado, intento, ''))
+        self.assertIsNone(trabajos.tomar_siguiente_carga('worker'))
+        self.assertIsNotNone(carga.fecha_fin)
+        self.assertEqual(carga.errores_detalle.splitlines(), [
+            'Error interno (intento 1): sin conexión', 'Error interno (intento 2): sin conexión',
+        ])
+        self.assertEqual(LogOperacion.objects.get(operacion='CARGA').datos_nuevos['estado'], 'FALLIDA')
+
+    def test_archivo_invalido_falla_sin_reintentos(self):
+        with open(self.ruta, 'w', encoding='utf-8') as archivo:
+            archivo.write('columna;otra\n1;2\n')
+        carga = trabajos.ejecutar_carga(self._carga(), self.ruta)
+        self.assertEqual((carga.estado, carga.intentos), ('FALLIDA', 0))
+        self.assertTrue(carga.errores_detalle.startswith('Archivo:'))
+
+
+class ColaCargasConcurrenteTest(TransactionTestCase):
+    """Dos workers no toman la misma carga: la bloqueada por uno se salta (SKIP LOCKED)"""
+
+    def test_salta_la_carga_bloqueada(self):
+        corredor = User.objects.create_user('corredor')
+        primera, segunda = [
+            CargaMasiva.objects.create(
+                usuario=corredor, tipo_carga='FACTORES', nombre_archivo='dj1948.csv', archivo='cargas/dj1948.csv',
+            )
+            for _ in range(2)
+        ]
+        otra = connections[DEFAULT_DB_ALIAS].copy()
+        self.addCleanup(otra.close)
+        with otra.cursor() as cursor:
+            # Otro worker en medio de tomar la primera
+            cursor.execute('BEGIN')
+            cursor.execute('SELECT id FROM carga_masiva WHERE id = %s FOR UPDATE', [primera.pk])
+            self.assertEqual(trabajos.tomar_siguiente_carga('este').pk, segunda.pk)
+            self.assertIsNone(trabajos.tomar_siguiente_carga('este'))
+            cursor.execute('ROLLBACK')
+        self.assertEqual(trabajos.tomar_siguiente_carga('este').pk, primera.pk)
+
+
+# ============================================
+# VALIDACIÓN POR LOTES
+# ============================================
+class ValidacionLoteTest(TestCase):
+    """validar_lote da los mismos errores (campo, código, mensaje, parámetros) que full_clean()"""
+
+    CASOS = [
+        {'ejercicio': 1999},
+        {'ejercicio': 2000},
+        {'ejercicio': 2100},
+        {'ejercicio': 2101},
+        {'factor_8': Decimal('0')},
+        {'factor_8': Decimal('1')},
+        {'factor_8': Decimal('-0.00000001')},
+        {'factor_8': Decimal('1.00000001')},
+        {'factor_20': Decimal('-0.5'), 'factor_37': Decimal('1.5')},
+        {'factor_8': Decimal('0.5'), 'factor_16': Decimal('0.5')},
+        {'factor_8': Decimal('0.5'), 'factor_16': Decimal('0.50000001')},
+        {'ejercicio': 1999, 'factor_9': Decimal('2'), 'factor_10': Decimal('0.5')},
+    ]
+
+    @staticmethod
+    def _comparable(error):
+        return {
+            campo: [(e.code, e.message, e.params) for e in errores]
+            for campo, errores in error.error_dict.items()
+        }
+
+    def test_mismos_errores_que_full_clean(self):
+        objetos = []
+        for valores in self.CASOS:
+            objeto = CalificacionTributaria(
+                ejercicio=2024, mercado='ACN', instrumento='CHILE', fecha_pago=date(2024, 5, 15),
+                secuencia_evento=10001, tipo_sociedad='A',
+            )
+            for campo, valor in valores.items():
+                setattr(objeto, campo, valor)
+            objetos.append(objeto)
+
+        errores_lote = validacion.validar_lote(validacion.lote_desde_instancias(objetos))
+        for valores, objeto, errores in zip(self.CASOS, objetos, errores_lote):
+            with self.subTest(**{campo: str(valor) for campo, valor in valores.items()}):
+                # Sin advertencias de restricciones que no se pueden evaluar en Python
+                with self.assertNoLogs('django.db.models', 'WARNING'):
+                    try:
+                        objeto.full_clean(exclude=['usuario'], validate_unique=False)
+                        esperado = {}
+                    except ValidationError as exc:
+                        esperado = self._comparable(exc)
+                obtenido = self._comparable(validacion.a_validation_error(errores)) if errores else {}
+                self.assertEqual(obtenido, esperado)
+        self.assertEqual([bool(errores) for errores in errores_lote], [
+            True, False, False, True, False, False, True, True, True, False, True, True,
+        ])
+
+
+# ============================================
+# AUDITORÍA POR LOTES
+# ============================================
+class AuditoriaLotesTest(TestCase):
+    """Los logs de una carga se escriben por lote y guardan solo los campos que cambian"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.corredor = User.objects.create_user('corredor')
+
+    def _cargar(self, factores_9):
+        lineas = ['ejercicio;mercado;instrumento;fecha_pago;secuencia_evento;tipo_sociedad;factor_8;factor_9']
+        lineas += [f'2024;ACN;INS{n};15/05/2024;{n};A;0.5;{factor}' for n, factor in enumerate(factores_9)]
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as archivo:
+            archivo.write('\n'.join(lineas) + '\n')
+        self.addCleanup(os.remove, archivo.name)
+        carga = CargaMasiva.objects.create(
+            usuario=self.corredor, tipo_carga='FACTORES', modo='UPSERT', nombre_archivo='dj1948.csv',
+        )
+        with CaptureQueriesContext(connection) as consultas:
+            carga = procesar_carga(carga, archivo.name, tamano_lote=3)
+        inserciones = [c for c in consultas.captured_queries if c['sql'].startswith('INSERT INTO "log_operacion"')]
+        return carga, len(inserciones)
+
+    def test_buffer_vacia_por_tamano(self):
+        with CaptureQueriesContext(connection) as consultas, auditoria.BufferAuditoria(tamano=2) as buffer:
+            for _ in range(5):
+                buffer.agregar(self.corredor.pk, 'CREATE', nuevo=auditoria.VALORES_INICIALES)
+            self.assertEqual(LogOperacion.objects.count(), 4)
+        self.assertEqual(LogOperacion.objects.count(), 5)
+        self.assertEqual(len(buffer.escritos), 5)
+        self.assertEqual(sum(c['sql'].startswith('INSERT INTO "log_operacion"') for c in consultas.captured_queries), 3)
+
+        with self.assertRaises(RuntimeError), auditoria.BufferAuditoria() as buffer:
+            buffer.agregar(self.corredor.pk, 'CREATE', nuevo=auditoria.VALORES_INICIALES)
+            raise RuntimeError
+        self.assertEqual(LogOperacion.objects.count(), 5)
+
+    def test_carga_un_insert_por_lote_con_diferencias(self):
+        primera, inserciones = self._cargar(['0'] * 6)
+        self.assertEqual(inserciones, 2)
+        creados = LogOperacion.objects.filter(operacion='CREATE').order_by('calificacion_ref')
+        self.assertEqual(len(creados), 6)
+        self.assertEqual(creados[0].datos_nuevos['factor_8'], '0.50000000')
+        self.assertNotIn('factor_9', creados[0].datos_nuevos)
+        self.assertIsNone(creados[0].datos_anteriores)
+
+        segunda, inserciones = self._cargar(['0', '0.1', '0', '0', '0.2', '0'])
+        self.assertEqual(inserciones, 2)
+        self.assertEqual((segunda.registros_actualizados, segunda.registros_sin_cambios), (2, 4))
+        actualizados = LogOperacion.objects.filter(operacion='UPDATE').order_by('calificacion_ref')
+        self.assertEqual(
+            [(log.datos_anteriores, log.datos_nuevos) for log in actualizados],
+            [
+                (
+                    {'factor_9': '0.00000000', 'carga_masiva_id': primera.pk},
+                    {'factor_9': factor, 'carga_masiva_id': segunda.pk},
+                )
+                for factor in ('0.10000000', '0.20000000')
+            ],
+        )
+
+
+# ============================================
+# HISTORIAL DE CALIFICACIONES
+# ============================================
+class HistorialCalificacionTest(TestCase):
+    """estado_en() reconstruye cualquier estado pasado desde checkpoints o hacia atrás"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.corredor = User.objects.create_user('corredor')
+
+    def setUp(self):
+        self.inicio = timezone.now() - timedelta(hours=2)
+        self.calificacion = CalificacionTributaria.objects.create(
+            usuario=self.corredor, ejercicio=2024, mercado='ACN', instrumento='CHILE',
+            fecha_pago=date(2024, 5, 15), secuencia_evento=10001, tipo_sociedad='A',
+        )
+
+    def _actualizar(self, cantidad):
+        """`cantidad` UPDATE de factor_8; devuelve el estado después de cada uno"""
+        estados = []
+        for n in range(1, cantidad + 1):
+            anterior = auditoria.instantanea(self.calificacion)
+            self.calificacion.factor_8 = Decimal(n) / 100
+            self.calificacion.save()
+            estados.append(auditoria.instantanea(self.calificacion))
+            auditoria.registrar(self.corredor.pk, 'UPDATE', self.calificacion.pk, anterior, estados[-1])
+        return estados
+
+    def _fechar(self):
+        """Un minuto entre logs, en orden de id"""
+        for minuto, pk in enumerate(LogOperacion.objects.order_by('id').values_list('pk', flat=True)):
+            LogOperacion.objects.filter(pk=pk).update(fecha_hora=self.inicio + timedelta(minutes=minuto))
+
+    def _en(self, minuto):
+        return auditoria.estado_en(self.calificacion.pk, self.inicio + timedelta(minutes=minuto, seconds=30))
+
+    def test_checkpoints(self):
+        creada = auditoria.instantanea(self.calificacion)
+        auditoria.registrar(self.corredor.pk, 'CREATE', self.calificacion.pk, nuevo=creada)
+        cantidad = auditoria.CHECKPOINT_CADA * 2 + 3
+        estados = [creada, *self._actualizar(cantidad)]
+        auditoria.registrar(self.corredor.pk, 'DELETE', self.calificacion.pk, anterior=estados[-1])
+        self._fechar()
+
+        checkpoints = LogOperacion.objects.filter(es_checkpoint=True).order_by('id')
+        self.assertEqual(checkpoints.count(), 2)
+        self.assertEqual(checkpoints[0].datos_nuevos, estados[auditoria.CHECKPOINT_CADA])
+        self.assertIsNone(self._en(-1))
+        for minuto in (0, 1, auditoria.CHECKPOINT_CADA - 1, auditoria.CHECKPOINT_CADA,
+                       auditoria.CHECKPOINT_CADA + 1, auditoria.CHECKPOINT_CADA * 2 + 1, cantidad):
+            with self.subTest(minuto=minuto):
+                self.assertEqual(self._en(minuto), estados[minuto])
+        self.assertIsNone(self._en(cantidad + 1))
+
+    def test_sin_checkpoint_ni_create(self):
+        # Calificación anterior a la auditoría: solo hay UPDATE
+        original = auditoria.instantanea(self.calificacion)
+        estados = [original, *self._actualizar(3)]
+        self._fechar()
+        self.assertEqual(self._en(-1), original)
+        for minuto in range(3):
+            self.assertEqual(self._en(minuto), estados[minuto + 1])
+
+    def test_update_despues_de_delete(self):
+        # Historial incompleto: un UPDATE sin estado desde el cual aplicarlo
+        creada = auditoria.instantanea(self.calificacion)
+        auditoria.registrar(self.corredor.pk, 'CREATE', self.calificacion.pk, nuevo=creada)
+        auditoria.registrar(self.corredor.pk, 'DELETE', self.calificacion.pk, anterior=creada)
+        estados = self._actualizar(1)
+        self._fechar()
+        self.assertEqual(self._en(2), estados[0])
+
+
+# ============================================
+# PARTICIONES DE LOG_OPERACION
+# ============================================
+@mock.patch.object(particiones, 'mes_actual', return_value=date(2030, 1, 1))
+class ParticionesLogTest(TestCase):
+    """Particiones mensuales: creación, archivo de las vencidas y filtro por período del admin"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@nuam.cl', 'clave')
+
+    def _log(self, fecha_hora):
+        log = LogOperacion.objects.create(usuario=self.admin, operacion='CREATE')
+        LogOperacion.objects.filter(pk=log.pk).update(fecha_hora=fecha_hora)
+        return log
+
+    def _filas(self, tabla):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id FROM {tabla}')
+            return [fila[0] for fila in cursor.fetchall()]
+
+    def test_crear_particiones(self, _):
+        log = self._log(datetime(2030, 2, 10, tzinfo=tz.utc))
+        esperadas = ['log_operacion_p203001', 'log_operacion_p203002', 'log_operacion_p203003']
+        self.assertEqual(particiones.crear_particiones(2, simular=True), esperadas)
+        self.assertNotIn(date(2030, 1, 1), particiones.particiones_existentes())
+
+        self.assertEqual(particiones.crear_particiones(2), esperadas)
+        self.assertEqual(particiones.particiones_existentes()[-3:], [date(2030, m, 1) for m in (1, 2, 3)])
+        # La fila que había caído en DEFAULT pasa a la partición de su mes
+        self.assertEqual(self._filas('log_operacion_p203002'), [log.pk])
+        self.assertNotIn(log.pk, self._filas(particiones.PARTICION_DEFAULT))
+        self.assertEqual(particiones.crear_particiones(2), [])
+
+    def test_archivar_particiones(self, _):
+        vencidas = particiones.particiones_vencidas(1)
+        self.assertTrue(vencidas)
+        log = self._log(datetime.combine(vencidas[0], datetime.min.time(), tz.utc) + timedelta(days=3))
+        reciente = self._log(datetime(2030, 1, 5, tzinfo=tz.utc))
+        # Las FK diferidas de filas recién insertadas impiden el DROP en la misma transacción
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+        with tempfile.TemporaryDirectory() as directorio:
+            simulados = particiones.archivar_particiones(1, directorio, simular=True)
+            self.assertEqual(os.listdir(directorio), [])
+            self.assertEqual(particiones.archivar_particiones(1, directorio), simulados)
+            self.assertEqual(
+                simulados,
+                [os.path.join(directorio, f'{particiones.nombre_particion(mes)}.csv.gz') for mes in vencidas],
+            )
+            with gzip.open(simulados[0], 'rt') as archivo:
+                filas = list(csv.DictReader(archivo))
+        self.assertEqual([int(fila['id']) for fila in filas], [log.pk])
+        self.assertEqual(particiones.particiones_vencidas(1), [])
+        self.assertEqual(list(LogOperacion.objects.values_list('pk', flat=True)), [reciente.pk])
+
+    def test_comando(self, _):
+        salida = io.StringIO()
+        with tempfile.TemporaryDirectory() as directorio:
+            call_command(
+                'particionar_logs', meses_futuros=1, retener_meses=1, directorio=directorio,
+                simular=True, stdout=salida,
+            )
+        lineas = salida.getvalue().splitlines()
+        self.assertIn('[simulación] Partición creada: log_operacion_p203002', lineas)
+        self.assertEqual(
+            sum(linea.startswith('[simulación] Partición archivada') for linea in lineas),
+            len(particiones.particiones_vencidas(1)),
+        )
+        self.assertNotIn(date(2030, 1, 1), particiones.particiones_existentes())
+
+    def test_filtro_periodo(self, _):
+        ahora = timezone.now()
+        for dias in (10, 200, 500):
+            self._log(ahora - timedelta(days=dias))
+        self.client.force_login(self.admin)
+        url = reverse('admin:gestion_tributaria_logoperacion_changelist')
+        for periodo, cantidad in ((None, 1), ('1', 1), ('12', 2), ('todo', 3), ('otro', 1)):
+            with self.subTest(periodo=periodo):
+                respuesta = self.client.get(url, {'periodo': periodo} if periodo else {})
+                self.assertEqual(respuesta.context['cl'].result_count, cantidad)
+
+
+# ============================================
+# API: PAGINACIÓN POR CURSOR
+# ============================================
+class PaginacionCursorTest(TestCase):
+    """Recorrer la API página a página entrega cada fila una vez; el cursor queda atado a sus filtros"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@nuam.cl', 'clave')
+        corredores = [User.objects.create_user(f'corredor{n}') for n in range(2)]
+        for n in range(9):
+            CalificacionTributaria.objects.create(
+                usuario=corredores[n % 2], ejercicio=2024, mercado='ACN' if n % 3 else 'CFI',
+                instrumento='INS' if n < 6 else 'OTRO', fecha_pago=date(2024, 5, 1 + n % 4),
+                secuencia_evento=10000 + n, tipo_sociedad='A',
+            )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse('gestion_tributaria:calificaciones')
+
+    def _recorrer(self, **parametros):
+        ids, paginas, cursor = [], 0, None
+        while True:
+            datos = self.client.get(self.url, {**parametros, 'campos': 'id', **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(datos.status_code, 200)
+            datos = datos.json()
+            ids += [fila['id'] for fila in datos['resultados']]
+            paginas += 1
+            cursor = datos['siguiente']
+            if cursor is None:
+                return ids, paginas
+
+    def test_orden_clave(self):
+        ids, paginas = self._recorrer(limite=2)
+        esperados = CalificacionTributaria.objects.order_by(*views.ORDENES['clave']).values_list('id', flat=True)
+        self.assertEqual(ids, list(esperados))
+        self.assertEqual(paginas, 5)
+
+    def test_orden_instrumento(self):
+        ids, _ = self._recorrer(limite=1, instrumento='INS', mercado='ACN')
+        esperados = CalificacionTributaria.objects.filter(instrumento='INS', mercado='ACN').order_by(
+            *views.ORDENES['instrumento'],
+        ).values_list('id', flat=True)
+        self.assertEqual(ids, list(esperados))
+
+    def test_cursor_de_otros_filtros(self):
+        cursor = self.client.get(self.url, {'mercado': 'ACN', 'limite': 1}).json()['siguiente']
+        self.assertEqual(self.client.get(self.url, {'mercado': 'acn', 'limite': 1, 'cursor': cursor}).status_code, 200)
+        for parametros in ({'mercado': 'CFI'}, {}, {'mercado': 'ACN', 'ejercicio': 2024}):
+            with self.subTest(parametros=parametros):
+                respuesta = self.client.get(self.url, {**parametros, 'cursor': cursor})
+                self.assertEqual(respuesta.status_code, 400)
+                self.assertEqual(respuesta.json()['error'], 'El cursor no corresponde a estos filtros')
+
+    def test_cursor_invalido(self):
+        for cursor in ('no-es-un-cursor', 'WyJjbGF2ZSIsWzFdXQ'):
+            with self.subTest(cursor=cursor):
+                respuesta = self.client.get(self.url, {'cursor': cursor})
+                self.assertEqual(respuesta.status_code, 400)
+
+
+# ============================================
+# EXPORTACIÓN DJ1948
+# ============================================
+class ExportacionTest(TestCase):
+    """CSV y XLSX salen en flujo, con las mismas filas, y se pueden volver a cargar"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.corredor = User.objects.create_user('corredor')
+        for n, (descripcion, factor) in enumerate([('Dividendo <A&B>', '0.5'), ('Con\x01control', '0.12345678')]):
+            calificacion = CalificacionTributaria(
+                usuario=cls.corredor, ejercicio=2024, mercado='ACN', instrumento=f'INS{n}',
+                fecha_pago=date(2024, 5, 15 + n), secuencia_evento=10001 + n, numero_dividendo=n,
+                descripcion=descripcion, tipo_sociedad='A', acogido_isfut=bool(n),
+                valor_historico=Decimal('1234.56'),
+            )
+            calificacion.factor_8 = Decimal(factor)
+            calificacion.factor_37 = Decimal('1')
+            calificacion.save()
+
+    def setUp(self):
+        self.client.force_login(self.corredor)
+        self.url = reverse('gestion_tributaria:exportar_calificaciones')
+
+    def _exportar(self, **parametros):
+        respuesta = self.client.get(self.url, {'ejercicio': 2024, **parametros})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.streaming)
+        return respuesta, b''.join(respuesta.streaming_content)
+
+    def test_csv(self):
+        respuesta, contenido = self._exportar()
+        self.assertEqual(respuesta['Content-Disposition'], 'attachment; filename="dj1948_2024.csv"')
+        filas = list(csv.reader(io.StringIO(contenido.decode('utf-8-sig')), delimiter=';'))
+        self.assertEqual(filas[0], formato_dj1948.COLUMNAS_EXPORTACION)
+        self.assertEqual(filas[1][:4], ['2024', 'ACN', 'INS0', '2024-05-15'])
+        self.assertEqual((filas[1][11], filas[2][11], filas[1][-1]), ('0.50000000', '0.12345678', '1.00000000'))
+
+        _, comprimido = self._exportar(gzip=1)
+        self.assertEqual(gzip.decompress(comprimido), contenido)
+
+    def test_xlsx(self):
+        from openpyxl import load_workbook
+
+        respuesta, contenido = self._exportar(formato='xlsx')
+        self.assertEqual(respuesta['Content-Type'], exportacion.TIPO_XLSX)
+        filas = list(load_workbook(io.BytesIO(contenido), read_only=True).active.iter_rows(values_only=True))
+        self.assertEqual(list(filas[0]), formato_dj1948.COLUMNAS_EXPORTACION)
+        self.assertEqual(
+            filas[1][:11],
+            (2024, 'ACN', 'INS0', datetime(2024, 5, 15), 10001, 0, 'Dividendo <A&B>', 'A', False, 1234.56, 0),
+        )
+        self.assertEqual(filas[2][6:9], ('Concontrol', 'A', True))
+        self.assertEqual((filas[1][11], filas[2][11], filas[1][-1]), (0.5, 0.12345678, 1))
+
+    def test_xlsx_se_vuelve_a_cargar(self):
+        esperadas = list(CalificacionTributaria.objects.order_by('instrumento').values_list('descripcion', 'factores'))
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'dj1948_2024.xlsx')
+            call_command('exportar_dj1948', ruta, ejercicio=2024, chunk_size=1, stdout=io.StringIO())
+            CalificacionTributaria.objects.all().delete()
+            carga = CargaMasiva.objects.create(
+                usuario=self.corredor, tipo_carga='FACTORES', nombre_archivo='dj1948_2024.xlsx',
+            )
+            carga = procesar_carga(carga, ruta)
+        self.assertEqual((carga.registros_exitosos, carga.registros_fallidos), (2, 0))
+        esperadas[1] = ('Concontrol', esperadas[1][1])
+        self.assertEqual(
+            list(CalificacionTributaria.objects.order_by('instrumento').values_list('descripcion', 'factores')),
+            esperadas,
+        )
+
+    def test_limite_filas_xlsx(self):
+        with mock.patch.object(exportacion, 'MAX_FILAS_XLSX', 1):
+            respuesta = self.client.get(self.url, {'ejercicio': 2024, 'formato': 'xlsx'})
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('use CSV', respuesta.json()['error'])
+
+
+# ============================================
+# FACTORES EN UN ARREGLO ESCALADO
+# ============================================
+class FactoresEscaladosTest(TestCase):
+    """factor_N son posiciones de `factores` (enteros por 10^8), sin redondeos silenciosos"""
+
+    def test_propiedades(self):
+        calificacion = CalificacionTributaria()
+        self.assertEqual(calificacion.factores, [0] * 30)
+        for posicion, campo in enumerate(formato_dj1948.CAMPOS_FACTOR):
+            setattr(calificacion, campo, Decimal(posicion + 1) / 100)
+        self.assertEqual(calificacion.factores[0], 1000000)
+        self.assertEqual(calificacion.factores[29], 30000000)
+        self.assertEqual(calificacion.factor_37, Decimal('0.30000000'))
+
+        calificacion.factor_8 = '0.123456780'
+        calificacion.factor_9 = 0.1
+        calificacion.factor_10 = 1
+        self.assertEqual(calificacion.factores[:3], [12345678, 10000000, 100000000])
+        self.assertEqual(str(calificacion.factor_8), '0.12345678')
+
+    def test_mas_de_8_decimales(self):
+        for valor in (Decimal('0.123456789'), '0.000000001', 0.1234567891):
+            with self.subTest(valor=valor), self.assertRaises(ValidationError) as error:
+                formato_dj1948.factor_a_escalado(valor)
+            self.assertEqual(error.exception.code, 'max_decimal_places')
+        calificacion = CalificacionTributaria()
+        with self.assertRaises(ValidationError):
+            calificacion.factor_8 = Decimal('0.999999999')
+        self.assertEqual(calificacion.factor_8, 0)
+        with self.assertRaises(ValidationError):
+            formato_dj1948.factor_a_escalado(Decimal('NaN'))
+
+    def test_formulario(self):
+        datos = {campo: '0' for campo in formato_dj1948.CAMPOS_FACTOR}
+        self.assertTrue(admin.FactoresForm({**datos, 'factor_8': '0.12345678'}).is_valid())
+        for valor in ('0.123456789', '1.5', '-0.1', 'x'):
+            with self.subTest(valor=valor):
+                formulario = admin.FactoresForm({**datos, 'factor_8': valor})
+                self.assertFalse(formulario.is_valid())
+                self.assertIn('factor_8', formulario.errors)
+
+        calificacion = CalificacionTributaria(factores=[50000000] + [0] * 29)
+        formulario = admin.CalificacionTributariaForm(instance=calificacion)
+        self.assertEqual(formulario.initial['factor_8'], Decimal('0.5'))
+        self.assertEqual(formulario.initial['factor_37'], 0)
+
+    def test_migracion_0006(self):
+        # El SQL de la migración contra una tabla temporal con las columnas factor_N de antes
+        migracion = import_module('gestion_tributaria.migrations.0006_factores_columnares')
+        columnas = ', '.join(f'factor_{n} numeric(9, 8)' for n in formato_dj1948.NUMEROS_FACTOR)
+        valores = [Decimal(n) / 10 ** (n % 7 + 2) for n in range(30)]
+        with connection.cursor() as cursor:
+            # pg_temp va primero en search_path: tapa a la tabla real en esta sesión
+            cursor.execute(f'CREATE TEMPORARY TABLE calificacion_tributaria ({columnas}, factores bigint[])')
+            cursor.execute(f'INSERT INTO calificacion_tributaria VALUES ({", ".join(["%s"] * 30)}, NULL)', valores)
+            cursor.execute(migracion.COPIAR_A_ARREGLO)
+            cursor.execute('SELECT factores FROM calificacion_tributaria')
+            factores = cursor.fetchone()[0]
+            cursor.execute(f'UPDATE calificacion_tributaria SET {columnas.replace(" numeric(9, 8)", " = NULL")}')
+            cursor.execute(migracion.COPIAR_DESDE_ARREGLO)
+            cursor.execute('SELECT * FROM calificacion_tributaria')
+            restaurados = cursor.fetchone()[:30]
+            cursor.execute('DROP TABLE pg_temp.calificacion_tributaria')
+        self.assertEqual(factores, [formato_dj1948.factor_a_escalado(valor) for valor in valores])
+        self.assertEqual(list(restaurados), valores)
+
+
+# ============================================
+# ADMIN: CONSULTAS POR PÁGINA
+# ============================================
+class ConsultasChangelistTest(TestCase):
+    """El listado de cada admin hace las mismas consultas con 2 o con 40 filas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@nuam.cl', 'clave')
+        Perfil.objects.create(usuario=cls.admin, rol='ADMIN', nombre_completo='Administrador', rut='1-9')
+        cls.creados = 0
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def _crear_filas(self, cantidad, dueno=None):
+        """Cada fila con su propio corredor (con y sin perfil), carga y log"""
+        for _ in range(cantidad):
+            n = self.creados = self.creados + 1
+            corredor = User.objects.create_user(f'corredor{n}', is_staff=True)
+            if n % 2:
+                Perfil.objects.create(usuario=corredor, nombre_completo=f'Corredor {n}', rut=f'{n}-K')
+            corredor = dueno or corredor
+            carga = CargaMasiva.objects.create(
+                usuario=corredor, tipo_carga='FACTORES', nombre_archivo=f'carga{n}.csv', estado='COMPLETADA',
+            )
+            calificacion = CalificacionTributaria.objects.create(
+                usuario=corredor,
+                carga_masiva=carga,
+                ejercicio=2024,
+                mercado='ACN',
+                instrumento=f'INS{n}',
+                fecha_pago=date(2024, 5, 15),
+                secuencia_evento=10000 + n,
+                tipo_sociedad='A',
+            )
+            LogOperacion.objects.create(
+                usuario=corredor, calificacion=calificacion, calificacion_ref=calificacion.pk, operacion='CREATE',
+            )
+
+    def _consultas(self, url):
+        # Mismas condiciones en cada medición: facetas sin caché
+        cache.clear()
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as contexto:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return len(contexto.captured_queries)
+
+    def _verificar_constante(self, nombre_url):
+        url = reverse(nombre_url)
+        self._crear_filas(2)
+        con_pocas = self._consultas(url)
+        self._crear_filas(38)
+        self.assertEqual(self._consultas(url), con_pocas)
+
+    def test_calificaciones(self):
+        self._verificar_constante('admin:gestion_tributaria_calificaciontributaria_changelist')
+
+    def test_cargas(self):
+        self._verificar_constante('admin:gestion_tributaria_cargamasiva_changelist')
+
+    def test_logs(self):
+        self._verificar_constante('admin:gestion_tributaria_logoperacion_changelist')
+
+    def test_usuarios(self):
+        self._verificar_constante('admin:auth_user_changelist')
+
+    def test_corredor_con_perfil(self):
+        """Un corredor ve solo lo suyo; su perfil se lee una vez por página"""
+        corredor = User.objects.create_user('corredor', is_staff=True)
+        Perfil.objects.create(usuario=corredor, nombre_completo='Corredor', rut='2-7')
+        corredor.user_permissions.add(Permission.objects.get(codename='view_calificaciontributaria'))
+        self.client.force_login(corredor)
+        url = reverse('admin:gestion_tributaria_calificaciontributaria_changelist')
+        self._crear_filas(2, dueno=corredor)
+        con_pocas = self._consultas(url)
+        self._crear_filas(38, dueno=corredor)
+        self.assertEqual(self._consultas(url), con_pocas)
+
+
+# ============================================
+# FACETAS EN CACHÉ
+# ============================================
+class FacetasTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.corredor = User.objects.create_user('corredor')
+        cls.calificacion = CalificacionTributaria.objects.create(
+            usuario=cls.corredor,
+            ejercicio=2024,
+            mercado='ACN',
+            instrumento='INS1',
+            fecha_pago=date(2024, 5, 15),
+            secuencia_evento=10001,
+            tipo_sociedad='A',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_valores_se_leen_una_vez(self):
+        self.assertEqual(facetas.valores('ejercicio'), [2024])
+        with self.assertNumQueries(0):
+            self.assertEqual(facetas.valores('ejercicio'), [2024])
+
+    def test_escritura_invalida(self):
+        facetas.valores('ejercicio')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.calificacion.ejercicio = 2025
+            self.calificacion.save()
+        self.assertEqual(facetas.valores('ejercicio'), [2025])
+
+    def test_valores_por_usuario(self):
+        otro = User.objects.create_user('otro')
+        self.assertEqual(facetas.valores('ejercicio', otro.pk), [])
+        self.assertEqual(facetas.valores('ejercicio', self.corredor.pk), [2024])
+
+
+# ============================================
+# ADMIN: BÚSQUEDA
+# ============================================
+class BusquedaAdminTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@nuam.cl', 'clave')
+        for secuencia, (instrumento, descripcion) in enumerate([
+            ('CHILE2', ''),
+            ('CHILE', ''),
+            ('FALABELLA', 'Dividendo provisorio con cargo a utilidades'),
+            ('COPEC', ''),
+        ], start=10001):
+            CalificacionTributaria.objects.create(
+                usuario=cls.admin,
+                ejercicio=2024,
+                mercado='ACN',
+                instrumento=instrumento,
+                descripcion=descripcion,
+                fecha_pago=date(2024, 5, 15),
+                secuencia_evento=secuencia,
+                tipo_sociedad='A',
+            )
+
+    def _buscar(self, texto):
+        self.client.force_login(self.admin)
+        respuesta = self.client.get(
+            reverse('admin:gestion_tributaria_calificaciontributaria_changelist'), {'q': texto},
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        return [obj.instrumento for obj in respuesta.context['cl'].result_list]
+
+    def test_instrumento_exacto_primero(self):
+        self.assertEqual(self._buscar('chile'), ['CHILE', 'CHILE2'])
+
+    def test_descripcion_por_palabras(self):
+        self.assertEqual(self._buscar('dividendos provisorios'), ['FALABELLA'])
+
+    def test_usuario(self):
+        self.assertEqual(len(self._buscar('admin')), 4)
+
+    def test_todos_los_usuarios_que_coinciden(self):
+        # Con más de 50 usernames que coinciden también aparecen los del último
+        usuarios = User.objects.bulk_create([User(username=f'corredor{n:03d}') for n in range(60)])
+        CalificacionTributaria.objects.create(
+            usuario=usuarios[-1], ejercicio=2024, mercado='ACN', instrumento='SQM-B',
+            fecha_pago=date(2024, 5, 15), secuencia_evento=10005, tipo_sociedad='A',
+        )
+        self.assertEqual(self._buscar('corredor'), ['SQM-B'])
+
+    def test_migracion_sin_indice_trigramas(self):
+        # Sin pg_trgm el índice está en el estado de las migraciones pero no en la base
+        migracion = import_module('gestion_tributaria.migrations.0008_busqueda_calificaciones')
+
+        def hay_indice():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1 FROM pg_indexes WHERE indexname = %s', [migracion.INDICE_TRIGRAMAS.name])
+                return cursor.fetchone() is not None
+
+        with connection.schema_editor() as editor:
+            migracion.eliminar_indice_trigramas(apps, editor)
+            migracion.eliminar_indice_trigramas(apps, editor)
+        self.assertFalse(hay_indice())
+        self.assertEqual(self._buscar('chile'), ['CHILE', 'CHILE2'])
+
+        with connection.schema_editor() as editor:
+            migracion.crear_indice_trigramas(apps, editor)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+            self.assertEqual(hay_indice(), cursor.fetchone() is not None)
+
+
+# ============================================
+# ALCANCE: PROPIAS MÁS COMPARTIDAS
+# ============================================
+class AlcanceCalificacionesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.corredor = User.objects.create_user('corredor', is_staff=True)
+        Perfil.objects.create(usuario=cls.corredor, nombre_completo='Corredor', rut='2-7')
+        cls.corredor.user_permissions.add(*Permission.objects.filter(
+            codename__in=['view_calificaciontributaria', 'change_calificaciontributaria'],
+        ))
+        otro = User.objects.create_user('otro')
+        cls.propia = cls._crear(cls.corredor, 'PROPIA', es_local=True)
+        cls.compartida = cls._crear(otro, 'COMPARTIDA', es_local=False)
+        cls._crear(otro, 'AJENA', es_local=True)
+
+    @staticmethod
+    def _crear(usuario, instrumento, es_local):
+        return CalificacionTributaria.objects.create(
+            usuario=usuario,
+            ejercicio=2024,
+            mercado='ACN',
+            instrumento=instrumento,
+            fecha_pago=date(2024, 5, 15),
+            secuencia_evento=10001,
+            tipo_sociedad='A',
+            es_local=es_local,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.corredor)
+
+    def test_visibles_para(self):
+        visibles = CalificacionTributaria.objects.visibles_para(self.corredor.pk)
+        self.assertEqual(sorted(visibles.values_list('instrumento', flat=True)), ['COMPARTIDA', 'PROPIA'])
+        self.assertEqual(CalificacionTributaria.objects.visibles_para(self.corredor.pk, ver_todas=True).count(), 3)
+
+    def test_compartida_solo_lectura(self):
+        url = 'admin:gestion_tributaria_calificaciontributaria_change'
+        respuesta = self.client.get(reverse(url, args=[self.compartida.pk]))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertFalse(respuesta.context['has_change_permission'])
+        respuesta = self.client.get(reverse(url, args=[self.propia.pk]))
+        self.assertTrue(respuesta.context['has_change_permission'])
+
+    def test_rol_en_cache(self):
+        self.client.get(reverse('admin:gestion_tributaria_calificaciontributaria_changelist'))
+        with self.assertNumQueries(0):
+            self.assertEqual(perfiles.rol_de_usuario(self.corredor.pk), 'CORREDOR')
+
+    def test_cambio_de_rol_invalida(self):
+        url = reverse('gestion_tributaria:calificaciones')
+        self.assertEqual(len(self.client.get(url).json()['resultados']), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            perfil = Perfil.objects.get(usuario=self.corredor)
+            perfil.rol = 'ADMIN'
+            perfil.save()
+        self.assertEqual(len(self.client.get(url).json()['resultados']), 3)
+
+
+# ============================================
+# RESÚMENES (VISTA MATERIALIZADA)
+# ============================================
+class ResumenesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@nuam.cl', 'clave')
+        cls.corredor = User.objects.create_user('corredor', is_staff=True)
+        for secuencia, (mercado, valor, factor) in enumerate([
+            ('ACN', '100.00', '0.5'),
+            ('ACN', '300.00', '0.25'),
+            ('CFI', '50.00', '1'),
+        ], start=10001):
+            calificacion = CalificacionTributaria(
+                usuario=cls.corredor,
+                ejercicio=2024,
+                mercado=mercado,
+                instrumento='INS',
+                fecha_pago=date(2024, 5, 15),
+                secuencia_evento=secuencia,
+                tipo_sociedad='A',
+                valor_historico=Decimal(valor),
+            )
+            calificacion.factor_8 = Decimal(factor)
+            calificacion.save()
+
+    def test_resumen_por_mercado(self):
+        resumenes.refrescar()
+        acciones, renta_fija = resumenes.resumen(['mercado'])
+        self.assertEqual(acciones['etiquetas'], ['Acciones'])
+        self.assertEqual(acciones['cantidad'], 2)
+        self.assertEqual(acciones['suma_valor_historico'], Decimal('400.00'))
+        self.assertEqual(acciones['promedio_valor_historico'], Decimal('200.00'))
+        self.assertEqual(acciones['promedios_factores'][0], Decimal('0.375'))
+        self.assertEqual(renta_fija['cantidad'], 1)
+
+    def test_tablero_solo_administradores(self):
+        url = reverse('admin:gestion_tributaria_calificaciontributaria_resumen')
+        self.client.force_login(self.admin)
+        respuesta = self.client.get(url, {'agrupar': ['ejercicio', 'corredor']})
+        self.assertEqual(respuesta.status_code, 200)
+        self.client.force_login(self.corredor)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_estado_de_migraciones(self):
+        # Cada columna de la PK compuesta tiene que existir en el estado de 0010 en adelante
+        estado = MigrationLoader(connection).project_state(('gestion_tributaria', '0010_resumen_calificacion'))
+        modelo = estado.apps.get_model('gestion_tributaria', 'ResumenCalificacion')
+        self.assertEqual(
+            [campo.name for campo in modelo._meta.pk_fields], ['ejercicio', 'mercado', 'origen', 'usuario'],
+        )
+        self.assertFalse(modelo._meta.get_field('usuario').db_constraint)
+
+
+# ============================================
+# CACHÉ DE CALIFICACIONES POR EVENTO
+# ============================================
+class CacheCalificacionesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.corredor = User.objects.create_user('corredor')
+        cls.calificacion = CalificacionTributaria.objects.create(
+            usuario=cls.corredor,
+            ejercicio=2024,
+            mercado='ACN',
+            instrumento='CHILE',
+            fecha_pago=date(2024, 5, 15),
+            secuencia_evento=10001,
+            tipo_sociedad='A',
+        )
+        cls.evento = ('CHILE', date(2024, 5, 15), 10001)
+
+    def setUp(self):
+        cache.clear()
+        cache_calificaciones.invalidar()
+        cache_calificaciones.volcar_contadores()
+        cache_calificaciones.reiniciar_estadisticas()
+
+    def test_niveles(self):
+        self.assertEqual(cache_calificaciones.por_evento(*self.evento), [self.calificacion])
+        with self.assertNumQueries(0):
+            cache_calificaciones.por_evento(*self.evento)
+            cache_calificaciones._local.clear()
+            cache_calificaciones.por_evento(*self.evento)
+        cache_calificaciones.volcar_contadores()
+        estadisticas = cache_calificaciones.estadisticas()
+        self.assertEqual(
+            [estadisticas[nombre] for nombre in cache_calificaciones.CONTADORES],
+            [1, 1, 1],
+        )
+
+    def test_escritura_invalida(self):
+        cache_calificaciones.por_evento(*self.evento)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.calificacion.descripcion = 'Corregida'
+            self.calificacion.save()
+        self.assertEqual(cache_calificaciones.por_evento(*self.evento)[0].descripcion, 'Corregida')
+
+    def test_contadores_se_suman_cada_tantos_segundos(self):
+        with mock.patch.object(cache_calificaciones, 'CONTADORES_SEGUNDOS', 0):
+            cache_calificaciones.por_evento(*self.evento)
+        self.assertEqual(cache_calificaciones.estadisticas()['fallos'], 1)
+
+    def test_estadisticas_requieren_cache_compartido(self):
+        with self.assertRaisesMessage(CommandError, 'caché compartido'):
+            call_command('estadisticas_cache', stdout=io.StringIO())
+        with tempfile.TemporaryDirectory() as directorio, override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directorio,
+        }}):
+            cache_calificaciones.por_evento(*self.evento)
+            cache_calificaciones.volcar_contadores()
+            salida = io.StringIO()
+            call_command('estadisticas_cache', stdout=salida)
+        self.assertEqual(json.loads(salida.getvalue())['fallos'], 1)
+
+    def test_claves_validas_para_cualquier_instrumento(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+            for instrumento in ('CHILE B', 'CHILE:B', 'Ñ' * 50):
+                self.assertEqual(cache_calificaciones.por_evento(instrumento, date(2024, 5, 15), 10001), [])
+
+    def test_lru_descarta_lo_menos_usado(self):
+        lru = cache_calificaciones.LRUConTTL(maximo=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+
+    def test_api_evento(self):
+        otro = User.objects.create_user('otro')
+        self.client.force_login(otro)
+        url = reverse('gestion_tributaria:calificaciones_evento')
+        parametros = {'instrumento': 'CHILE', 'fecha_pago': '2024-05-15', 'secuencia_evento': 10001}
+        self.assertEqual(self.client.get(url, parametros).json()['resultados'], [])
+        self.client.force_login(self.corredor)
+        resultados = self.client.get(url, parametros).json()['resultados']
+        self.assertEqual([fila['id'] for fila in resultados], [self.calificacion.pk])
+        self.assertEqual(resultados[0]['factor_8'], '0.00000000')
+        self.assertEqual(self.client.get(url, {'instrumento': 'CHILE'}).status_code, 400)
+
+
+# ============================================
+# API ASYNC
+# ============================================
+class ApiAsyncTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.corredor = User.objects.create_user('corredor')
+        cls.otro = User.objects.create_user('otro')
+        cls.propia = CalificacionTributaria.objects.create(
+            usuario=cls.corredor,
+            ejercicio=2024,
+            mercado='ACN',
+            instrumento='CHILE',
+            fecha_pago=date(2024, 5, 15),
+            secuencia_evento=10001,
+            tipo_sociedad='A',
+        )
+        cls.carga = CargaMasiva.objects.create(
+            usuario=cls.corredor, tipo_carga='FACTORES', nombre_archivo='carga.csv', estado='PROCESANDO',
+            registros_procesados=1000,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_calificacion_detalle(self):
+        url = reverse('gestion_tributaria:calificacion', args=[self.propia.pk])
+        await self.async_client.aforce_login(self.corredor)
+        respuesta = await self.async_client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['instrumento'], 'CHILE')
+        self.assertEqual(respuesta.json()['factor_37'], '0.00000000')
+        await self.async_client.aforce_login(self.otro)
+        self.assertEqual((await self.async_client.get(url)).status_code, 404)
+
+    async def test_avance_de_cargas(self):
+        await self.async_client.aforce_login(self.corredor)
+        respuesta = await self.async_client.get(reverse('gestion_tributaria:cargas'), {'estado': 'procesando'})
+        self.assertEqual(
+            [(fila['id'], fila['registros_procesados']) for fila in respuesta.json()['resultados']],
+            [(self.carga.pk, 1000)],
+        )
+        url = reverse('gestion_tributaria:carga', args=[self.carga.pk])
+        self.assertEqual((await self.async_client.get(url)).json()['estado'], 'PROCESANDO')
+        await self.async_client.aforce_login(self.otro)
+        self.assertEqual((await self.async_client.get(url)).status_code, 404)
+
+    async def test_sin_sesion(self):
+        respuesta = await self.async_client.get(reverse('gestion_tributaria:cargas'))
+        self.assertEqual(respuesta.status_code, 401)
+
+
+# ============================================
+# LECTURA CON MMAP
+# ============================================
+class LecturaMmapTest(TestCase):
+    """lectura_mmap da las mismas filas, valores y errores que csv + Decimal"""
+
+    FACTORES = ['0.5', '', '.25', '0,1', '+0.1', '1e-1', '0.100000000', '0.123456789', '-0.1', 'x', ' 0.2 ', '1.']
+    MONTOS = ['100', '', '33.33', '0,5', '1e2', '1.234', 'x', ' 12.5 ']
+
+    def _archivo(self, tipo_carga, valores):
+        columnas = [f'factor_{n}' for n in (9, 8)] if tipo_carga == 'FACTORES' else ['monto_8', 'monto_9']
+        lineas = [';'.join(['ejercicio', 'mercado', 'instrumento', 'fecha_pago', 'secuencia_evento',
+                            'tipo_sociedad', 'valor_historico', 'descripcion', *columnas])]
+        for n, valor in enumerate(valores * 3):
+            descripcion = ['simple', '"con ; y\nsalto"', 'pulgadas 5" x', '"a""b"'][n % 4]
+            valor_historico = '0' if n == 5 else '1000'
+            lineas.append(f'2024;ACN;INS{n};15/05/2024;{n};A;{valor_historico};{descripcion};{valor};0.0{n % 10}')
+            if n % 7 == 0:
+                lineas.append('' if n % 2 else ';;;')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8-sig', newline='', delete=False) as archivo:
+            archivo.write('\r\n'.join(lineas))
+        self.addCleanup(os.remove, archivo.name)
+        return archivo.name
+
+    def _comparar(self, tipo_carga, valores):
+        ruta = self._archivo(tipo_carga, valores)
+        esperado = list(conversion.convertir_en_lotes(
+            formato_dj1948.leer_filas(ruta, ruta, tipo_carga), tipo_carga, 10,
+        ))
+        obtenido = list(conversion.convertir_en_lotes(
+            lectura_mmap.leer_filas(ruta, tipo_carga), tipo_carga, 10, lectura_mmap.convertir_lote,
+        ))
+        self.assertEqual(obtenido, esperado)
+        self.assertTrue(any(error for *_, error in esperado))
+        self.assertTrue(any(error is None for *_, error in esperado))
+
+    def test_factores(self):
+        self._comparar('FACTORES', self.FACTORES)
+
+    def test_montos(self):
+        self._comparar('MONTOS', self.MONTOS)
+
+    def test_escalados_simples(self):
+        self.assertEqual(
+            lectura_mmap.escalados_simples([b'0.5', b'', b'.25', b'1.', b'2'], 8),
+            [50000000, 0, 25000000, 100000000, 200000000],
+        )
+        for texto in (b'.', b'1,5', b'1;2', b' 1', b'-1', b'0.123456789'):
+            self.assertEqual(lectura_mmap.escalados_simples([texto], 8), [None])
+        self.assertEqual(lectura_mmap.escalados_simples([b'0.5', b'1;2', b''], 8), [50000000, None, 0])
+
+    def test_delimitador_coma(self):
+        # Con ',' una celda puede traer ';': no se confunde con otra celda
+        columnas = ['ejercicio', 'mercado', 'instrumento', 'fecha_pago', 'secuencia_evento',
+                    'tipo_sociedad', 'descripcion', 'factor_9', 'factor_10']
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', newline='', delete=False) as archivo:
+            escritor = csv.writer(archivo, delimiter=',')
+            escritor.writerow(columnas)
+            for n, (factor_9, factor_10) in enumerate([('0.5', '1;2'), ('1;2', '0.5'), ('0,5', '0.25'), ('0.1', '')]):
+                escritor.writerow([2024, 'ACN', f'INS{n}', '15/05/2024', n, 'A', 'coma, y ;', factor_9, factor_10])
+        self.addCleanup(os.remove, archivo.name)
+        esperado = list(conversion.convertir_en_lotes(
+            formato_dj1948.leer_filas(archivo.name, archivo.name, 'FACTORES'), 'FACTORES', 10,
+        ))
+        obtenido = list(conversion.convertir_en_lotes(
+            lectura_mmap.leer_filas(archivo.name, 'FACTORES'), 'FACTORES', 10, lectura_mmap.convertir_lote,
+        ))
+        self.assertEqual(obtenido, esperado)
+        self.assertEqual([error is None for *_, error in esperado], [False, False, True, True])
+
+
+# ============================================
+# CARGA MASIVA EN PARALELO
+# ============================================
+@override_settings(CARGA_MASIVA_PARALELO_DESDE_MB=0)
+class CargaParalelaTest(TestCase):
+    """Repartir la conversión entre procesos no cambia el resultado de la carga"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.secuencial = User.objects.create_user('secuencial')
+        cls.paralela = User.objects.create_user('paralela')
+
+    def setUp(self):
+        lineas = ['ejercicio;mercado;instrumento;fecha_pago;secuencia_evento;tipo_sociedad;descripcion;factor_8']
+        for n in range(120):
+            descripcion = f'"Evento {n};\ncon ""salto"" de linea"' if n % 7 == 0 else f'Evento {n}'
+            mercado = 'XXX' if n % 11 == 0 else 'ACN'
+            lineas.append(f'2024;{mercado};INS{n % 100};15/05/2024;{n % 100};A;{descripcion};0,{n % 10}')
+            if n % 13 == 0:
+                lineas.append('')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8-sig', newline='', delete=False) as archivo:
+            archivo.write('\r\n'.join(lineas) + '\r\n')
+        self.ruta = archivo.name
+        self.addCleanup(os.remove, self.ruta)
+
+    def _cargar(self, usuario, procesos):
+        carga = CargaMasiva.objects.create(
+            usuario=usuario, tipo_carga='FACTORES', modo='UPSERT', nombre_archivo='dj1948.csv',
+        )
+        with mock.patch.object(carga_paralela, 'TAMANO_FRAGMENTO', 300):
+            return procesar_carga(carga, self.ruta, tamano_lote=16, procesos=procesos)
+
+    def test_fragmentos_terminan_fuera_de_comillas(self):
+        with open(self.ruta, 'rb') as archivo:
+            contenido = archivo.read()
+        limites = carga_paralela.limites_fragmentos(self.ruta, contenido.index(b'\n') + 1, 300)
+        self.assertGreater(len(limites), 5)
+        self.assertEqual(limites[-1], len(contenido))
+        for limite in limites[1:-1]:
+            self.assertEqual(contenido[limite - 1:limite], b'\n')
+            self.assertEqual(contenido[:limite].count(b'"') % 2, 0)
+
+    def test_comilla_suelta_en_campo(self):
+        # Una comilla dentro de un campo sin comillas no abre un campo: la paridad no sirve para cortar
+        lineas = ['ejercicio;mercado;instrumento;fecha_pago;secuencia_evento;tipo_sociedad;descripcion;factor_8']
+        for n in range(60):
+            descripcion = ['pulgadas 5" x', '"con ; y\nsalto"', 'simple', '"a ""b""\nc"'][n % 4]
+            lineas.append(f'2024;ACN;INS{n};15/05/2024;{n};A;{descripcion};0.5')
+        with open(self.ruta, 'w', encoding='utf-8-sig', newline='') as archivo:
+            archivo.write('\r\n'.join(lineas) + '\r\n')
+        columnas = lineas[0].split(';')
+
+        with open(self.ruta, 'rb') as archivo, mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            def registros(inicio, fin):
+                leidos = lectura_mmap.leer_registros(mapa, inicio, fin, columnas, ';', 'FACTORES', 'utf-8')
+                return [fila for _, fila in leidos]
+
+            inicio = mapa.find(b'\n') + 1
+            completo = registros(inicio, len(mapa))
+            self.assertEqual(len(completo), 60)
+            for tamano in (1, 40, 97, 300):
+                with self.subTest(tamano=tamano):
+                    limites = carga_paralela.limites_fragmentos(self.ruta, inicio, tamano)
+                    fragmentos = [registros(desde, hasta) for desde, hasta in zip(limites, limites[1:])]
+                    self.assertEqual(sum(fragmentos, []), completo)
+
+    def test_retomar_salta_fragmentos(self):
+        with mock.patch.object(carga_paralela, 'TAMANO_FRAGMENTO', 300):
+            completo = list(carga_paralela.convertir_archivo(self.ruta, 'FACTORES', 2, 16))
+            enviados = []
+            submit = ProcessPoolExecutor.submit
+
+            def registrar(ejecutor, funcion, *args):
+                enviados.append(funcion.__name__)
+                return submit(ejecutor, funcion, *args)
+
+            for saltar in (0, 7, 90, len(completo)):
+                enviados.clear()
+                with self.subTest(saltar=saltar), mock.patch.object(ProcessPoolExecutor, 'submit', registrar):
+                    self.assertEqual(
+                        list(carga_paralela.convertir_archivo(self.ruta, 'FACTORES', 2, 16, saltar=saltar)),
+                        completo[saltar:],
+                    )
+                    if saltar == 90:
+                        self.assertIn('contar_fragmento', enviados)
+                        self.assertLess(enviados.count('convertir_fragmento'), enviados.count('contar_fragmento'))
+
+    def test_mismo_resultado_que_secuencial(self):
+        secuencial = self._cargar(self.secuencial, 1)
+        paralela = self._cargar(self.paralela, 2)
+        contadores = [
+            'registros_procesados', 'registros_exitosos', 'registros_fallidos',
+            'registros_insertados', 'registros_actualizados', 'errores_detalle',
+        ]
+        self.assertEqual(
+            [getattr(paralela, campo) for campo in contadores],
+            [getattr(secuencial, campo) for campo in contadores],
+        )
+        self.assertIn('Fila 2:', paralela.errores_detalle)
+        columnas = ['instrumento', 'secuencia_evento', 'descripcion', 'factores', 'hash_contenido']
+        self.assertEqual(
+            list(CalificacionTributaria.objects.filter(usuario=self.paralela).order_by('instrumento').values_list(*columnas)),
+            list(CalificacionTributaria.objects.filter(usuario=self.secuencial).order_by('instrumento').values_list(*columnas)),
+        )
+
+
+# ============================================
+# CORRECCIONES MASIVAS
+# ============================================
+class CorreccionesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@nuam.cl', 'clave')
+        cls.corredor = User.objects.create_user('corredor')
+        cls.calificaciones = []
+        for secuencia, factor in enumerate(['0.5', '0.25', '0.5', '0'], start=10001):
+            calificacion = CalificacionTributaria(
+                usuario=cls.corredor,
+                ejercicio=2024,
+                mercado='ACN',
+                instrumento='INS' if secuencia < 10004 else 'OTRO',
+                fecha_pago=date(2024, 5, 15),
+                secuencia_evento=secuencia,
+                tipo_sociedad='A',
+                valor_historico=Decimal('1000.00'),
+                factor_actualizacion=Decimal('1.01'),
+            )
+            calificacion.factor_8 = Decimal(factor)
+            calificacion.save()
+            cls.calificaciones.append(calificacion)
+        # Solo la primera tiene historial desde su creación
+        auditoria.registrar(
+            cls.corredor.pk, 'CREATE', cls.calificaciones[0].pk, nuevo=auditoria.instantanea(cls.calificaciones[0]),
+        )
+
+    def _corregir(self, cambios):
+        return correcciones.corregir(
+            CalificacionTributaria.objects.filter(instrumento='INS'), cambios, self.admin.pk, filtro='instrumento=INS',
+        )
+
+    def test_un_log_y_hash_como_save(self):
+        log = self._corregir({'factor_actualizacion': '1.02', 'factor_9': '0.5', 'descripcion': 'Reexpresado'})
+        self.assertEqual(LogOperacion.objects.filter(operacion='CORRECCION').count(), 1)
+        self.assertEqual(log.datos_nuevos['registros'], 3)
+        self.assertEqual(log.datos_nuevos['actualizados'], 3)
+        self.assertEqual(log.datos_nuevos['cambios']['factor_9'], '0.50000000')
+        ids = [calificacion.pk for calificacion in self.calificaciones[:3]]
+        self.assertEqual(log.datos_nuevos['ids'], [[ids[0], ids[2]]])
+        self.assertEqual(log.datos_anteriores['factor_actualizacion'], [['1.01000000', [[ids[0], ids[2]]]]])
+
+        for calificacion in CalificacionTributaria.objects.filter(instrumento='INS'):
+            self.assertEqual(calificacion.factor_actualizacion, Decimal('1.02'))
+            self.assertEqual(calificacion.factor_9, Decimal('0.5'))
+            self.assertEqual(calificacion.hash_contenido, calificacion.calcular_hash_contenido())
+        otra = CalificacionTributaria.objects.get(instrumento='OTRO')
+        self.assertEqual(otra.factor_actualizacion, Decimal('1.01'))
+
+    def test_suma_de_factores_no_cambia_nada(self):
+        with self.assertRaisesMessage(ValidationError, f'Calificación {self.calificaciones[0].pk}: La suma'):
+            self._corregir({'factor_9': '0.6', 'factor_actualizacion': '1.02'})
+        self.assertFalse(LogOperacion.objects.filter(operacion='CORRECCION').exists())
+        self.assertFalse(CalificacionTributaria.objects.filter(factor_actualizacion=Decimal('1.02')).exists())
+
+    def test_valor_invalido(self):
+        with self.assertRaises(ValidationError) as contexto:
+            self._corregir({'tipo_sociedad': 'X', 'instrumento': 'NUEVO'})
+        self.assertEqual(set(contexto.exception.message_dict), {'tipo_sociedad', 'instrumento'})
+
+    def test_estado_en_antes_y_despues(self):
+        antes = timezone.now()
+        self._corregir({'factor_8': '0'})
+        despues = timezone.now()
+        for calificacion in self.calificaciones[:3]:
+            self.assertEqual(auditoria.estado_en(calificacion.pk, despues)['factor_8'], '0.00000000')
+        # Con historial (hacia adelante) y sin él (hacia atrás desde el estado actual)
+        self.assertEqual(auditoria.estado_en(self.calificaciones[0].pk, antes)['factor_8'], '0.50000000')
+        self.assertEqual(auditoria.estado_en(self.calificaciones[1].pk, antes)['factor_8'], '0.25000000')
+
+    def test_accion_admin(self):
+        self.client.force_login(self.admin)
+        url = reverse('admin:gestion_tributaria_calificaciontributaria_changelist')
+        datos = {
+            'action': 'corregir_calificaciones',
+            '_selected_action': [calificacion.pk for calificacion in self.calificaciones[:2]],
+        }
+        respuesta = self.client.post(url, datos)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['cantidad'], 2)
+        respuesta = self.client.post(url, {**datos, 'campo': 'numero_dividendo', 'valor': '7', 'aplicar': '1'})
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(CalificacionTributaria.objects.filter(numero_dividendo=7).count(), 2)
+
+    def test_accion_admin_requiere_permiso_de_cambio(self):
+        lector = User.objects.create_user('lector', is_staff=True)
+        lector.user_permissions.add(Permission.objects.get(codename='view_calificaciontributaria'))
+        self.client.force_login(lector)
+        url = reverse('admin:gestion_tributaria_calificaciontributaria_changelist')
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotContains(respuesta, 'corregir_calificaciones')
+        respuesta = self.client.post(url, {
+            'action': 'corregir_calificaciones',
+            '_selected_action': [calificacion.pk for calificacion in self.calificaciones[:2]],
+            'campo': 'numero_dividendo', 'valor': '7', 'aplicar': '1',
+        })
+        self.assertNotEqual(respuesta.status_code, 302)
+        self.assertFalse(CalificacionTributaria.objects.filter(numero_dividendo=7).exists())
+        self.assertFalse(LogOperacion.objects.filter(operacion='CORRECCION').exists())
+
+
+# ============================================
+# RESTRICCIONES CHECK DE LOS FACTORES
+# ============================================
+class RestriccionesFactoresTest(TestCase):
+    """Los factores se validan en la base y los rechazos vuelven como errores por fila"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.corredor = User.objects.create_user('corredor')
+
+    def _calificacion(self, secuencia, **factores):
+        calificacion = CalificacionTributaria(
+            usuario=self.corredor, ejercicio=2024, mercado='ACN', instrumento='INS',
+            fecha_pago=date(2024, 5, 15), secuencia_evento=secuencia, tipo_sociedad='A',
+        )
+        for campo, valor in factores.items():
+            setattr(calificacion, campo, Decimal(valor))
+        return calificacion
+
+    def test_base_rechaza_factores_invalidos(self):
+        for secuencia, factores in enumerate([{'factor_20': '1.5'}, {'factor_8': '0.6', 'factor_16': '0.6'}], 1):
+            with self.subTest(factores=factores), self.assertRaises(IntegrityError):
+                with transaction.atomic():
+                    CalificacionTributaria.objects.bulk_create([self._calificacion(secuencia, **factores)])
+        calificacion = self._calificacion(3)
+        calificacion.factores = calificacion.factores[:29]
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            calificacion.save()
+
+    def test_carga_aisla_filas_rechazadas(self):
+        lineas = ['ejercicio;mercado;instrumento;fecha_pago;secuencia_evento;tipo_sociedad;factor_8;factor_9;factor_20']
+        invalidas = {5: '0,6;0,6;0', 12: '0;0;1,5', 13: '0;0;-0,1'}
+        for n in range(2, 22):
+            lineas.append(f'2024;ACN;INS{n};15/05/2024;{n};A;{invalidas.get(n, "0,5;0,25;0,75")}')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as archivo:
+            archivo.write('\n'.join(lineas) + '\n')
+        self.addCleanup(os.remove, archivo.name)
+        carga = CargaMasiva.objects.create(
+            usuario=self.corredor, tipo_carga='FACTORES', modo='UPSERT', nombre_archivo='dj1948.csv',
+        )
+
+        carga = procesar_carga(carga, archivo.name, tamano_lote=8)
+        self.assertEqual(carga.registros_insertados, 17)
+        self.assertEqual(carga.registros_fallidos, 3)
+        errores = carga.errores_detalle.splitlines()
+        self.assertEqual([error.split(':')[0] for error in errores], ['Fila 5', 'Fila 12', 'Fila 13'])
+        self.assertIn('La suma de los factores 8 al 16 no puede superar 1. Suma actual: 1.2', errores[0])
+        self.assertIn('factor_20:', errores[1])
+        self.assertIn('factor_20:', errores[2])
+        self.assertFalse(CalificacionTributaria.objects.filter(instrumento__in=['INS5', 'INS12', 'INS13']).exists())
+        self.assertEqual(LogOperacion.objects.filter(operacion='CREATE').count(), 17)
+
+
+# ============================================
+# EJERCICIOS CERRADOS
+# ============================================
+class EjerciciosCerradosTest(TestCase):
+    """Un ejercicio cerrado queda en su partición de solo lectura y se sigue consultando"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@nuam.cl', 'clave')
+        cls.corredor = User.objects.create_user('corredor')
+        for ejercicio in (2023, 2024):
+            for secuencia in (10001, 10002):
+                CalificacionTributaria.objects.create(
+                    usuario=cls.corredor, ejercicio=ejercicio, mercado='ACN', instrumento='INS',
+                    fecha_pago=date(ejercicio, 5, 15), secuencia_evento=secuencia, tipo_sociedad='A',
+                )
+
+    def test_cerrar_y_reabrir(self):
+        cierre = ejercicios.cerrar(2023, self.admin.pk)
+        self.assertEqual(cierre.registros, 2)
+        self.assertEqual(CalificacionTributaria.objects.filter(ejercicio=2023).count(), 2)
+        # El año abierto solo lee la partición DEFAULT
+        plan = CalificacionTributaria.objects.filter(ejercicio=2024).explain()
+        self.assertIn(ejercicios.PARTICION_ABIERTA, plan)
+        self.assertNotIn(ejercicios.nombre_particion(2023), plan)
+
+        cerrada = CalificacionTributaria.objects.filter(ejercicio=2023).first()
+        cerrada.descripcion = 'Cambio'
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            cerrada.save()
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            CalificacionTributaria.objects.all().delete()
+        with self.assertRaises(ValidationError):
+            ejercicios.cerrar(2023)
+
+        self.assertEqual(ejercicios.reabrir(2023), 2)
+        self.assertFalse(ejercicios.esta_cerrado(2023))
+        cerrada.save()
+        self.assertEqual(CalificacionTributaria.objects.filter(descripcion='Cambio').count(), 1)
+
+    def test_escrituras_rechazadas_antes_de_la_base(self):
+        ejercicios.cerrar(2023)
+        nueva = CalificacionTributaria(
+            usuario=self.corredor, ejercicio=2023, mercado='ACN', instrumento='OTRO',
+            fecha_pago=date(2023, 6, 1), secuencia_evento=10003, tipo_sociedad='A',
+        )
+        with self.assertRaisesMessage(ValidationError, 'El ejercicio 2023 está cerrado'):
+            nueva.full_clean()
+        with self.assertRaisesMessage(ValidationError, 'El ejercicio 2023 está cerrado'):
+            correcciones.corregir(CalificacionTributaria.objects.all(), {'numero_dividendo': '7'}, self.admin.pk)
+
+        lineas = ['ejercicio;mercado;instrumento;fecha_pago;secuencia_evento;tipo_sociedad']
+        lineas += [f'{ejercicio};ACN;CARGA;15/05/{ejercicio};10001;A' for ejercicio in (2023, 2024)]
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as archivo:
+            archivo.write('\n'.join(lineas) + '\n')
+        self.addCleanup(os.remove, archivo.name)
+        carga = CargaMasiva.objects.create(usuario=self.corredor, tipo_carga='FACTORES', nombre_archivo='dj1948.csv')
+        carga = procesar_carga(carga, archivo.name)
+        self.assertEqual(carga.registros_insertados, 1)
+        self.assertEqual(carga.errores_detalle.splitlines(), [f'Fila 2: {ejercicios.mensaje_cerrado(2023)}'])
+
+        self.client.force_login(self.admin)
+        cerrada = CalificacionTributaria.objects.filter(ejercicio=2023).first()
+        respuesta = self.client.get(reverse('admin:gestion_tributaria_calificaciontributaria_change', args=[cerrada.pk]))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertFalse(respuesta.context['has_change_permission'])
+
+    def test_eliminar_usuario_o_carga_con_ejercicio_cerrado(self):
+        # Eliminar el usuario borra sus calificaciones y eliminar la carga las
+        # actualiza (carga_masiva en NULL): las dos escriben en la partición
+        cargador = User.objects.create_user('cargador')
+        carga = CargaMasiva.objects.create(usuario=cargador, tipo_carga='FACTORES', nombre_archivo='dj1948.csv')
+        CalificacionTributaria.objects.filter(ejercicio=2023, secuencia_evento=10001).update(carga_masiva=carga)
+        sin_cerradas = User.objects.create_user('sin_cerradas')
+        CalificacionTributaria.objects.create(
+            usuario=sin_cerradas, ejercicio=2024, mercado='ACN', instrumento='OTRO',
+            fecha_pago=date(2024, 5, 15), secuencia_evento=10003, tipo_sociedad='A',
+        )
+        ejercicios.cerrar(2023)
+
+        self.client.force_login(self.admin)
+        for objeto, url in [
+            (self.corredor, reverse('admin:auth_user_delete', args=[self.corredor.pk])),
+            (cargador, reverse('admin:auth_user_delete', args=[cargador.pk])),
+            (carga, reverse('admin:gestion_tributaria_cargamasiva_delete', args=[carga.pk])),
+        ]:
+            with self.subTest(objeto=str(objeto)):
+                respuesta = self.client.post(url, {'post': 'yes'})
+                self.assertEqual(respuesta.status_code, 200)
+                self.assertContains(respuesta, ejercicios.mensaje_cerrado(2023))
+                self.assertTrue(type(objeto).objects.filter(pk=objeto.pk).exists())
+                with self.assertRaisesMessage(ValidationError, ejercicios.mensaje_cerrado(2023)):
+                    with transaction.atomic():
+                        objeto.delete()
+        self.assertEqual(CalificacionTributaria.objects.filter(ejercicio=2023).count(), 2)
+
+        respuesta = self.client.post(reverse('admin:auth_user_delete', args=[sin_cerradas.pk]), {'post': 'yes'})
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertFalse(User.objects.filter(pk=sin_cerradas.pk).exists())
+
+
+# ============================================
+# INSTRUMENTACIÓN SQL
+# ============================================
+@override_settings(SQL_INSTRUMENTACION=True, SQL_PRESUPUESTOS={})
+class InstrumentacionSQLTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@nuam.cl', 'clave')
+        cls.calificacion = CalificacionTributaria.objects.create(
+            usuario=cls.admin, ejercicio=2024, mercado='ACN', instrumento='CHILE',
+            fecha_pago=date(2024, 5, 15), secuencia_evento=10001, tipo_sociedad='A',
+        )
+
+    def setUp(self):
+        instrumentacion.reiniciar_histograma()
+
+    @staticmethod
+    def _registros(logs):
+        return list(instrumentacion.leer_registros(logs.output))
+
+    def test_repetidas_y_duplicadas(self):
+        medicion = instrumentacion.MedicionSQL()
+        with medicion.activa():
+            for pk in (1, 2, 3, 3):
+                User.objects.filter(pk=pk).exists()
+        self.assertEqual(medicion.consultas, 4)
+        self.assertEqual(medicion.duplicadas, 1)
+        self.assertEqual(medicion.max_repeticiones, 4)
+        self.assertEqual([repetida['veces'] for repetida in medicion.repetidas(3)], [4])
+
+    def test_presupuesto_excedido(self):
+        self.client.force_login(self.admin)
+        url = reverse('admin:gestion_tributaria_calificaciontributaria_changelist')
+        vista = 'admin:gestion_tributaria_calificaciontributaria_changelist'
+        with self.assertLogs('gestion_tributaria.instrumentacion', 'INFO') as logs:
+            self.client.get(url)
+            with self.settings(SQL_PRESUPUESTOS={vista: {'consultas': 1}}):
+                self.client.get(url)
+        normal, excedida = self._registros(logs)
+        self.assertEqual(logs.records[0].levelname, 'INFO')
+        self.assertEqual(logs.records[1].levelname, 'WARNING')
+        self.assertEqual(normal['vista'], vista)
+        self.assertEqual(normal['excede'], [])
+        self.assertNotIn('lentas', normal)
+        self.assertEqual(excedida['excede'], ['consultas'])
+        self.assertEqual(len(excedida['lentas']), min(excedida['consultas'], 5))
+        histograma = instrumentacion.histograma()[vista]
+        self.assertEqual((histograma['peticiones'], histograma['excedidas']), (2, 1))
+
+        resumen = instrumentacion.resumir(instrumentacion.leer_registros(f'WARNING {linea}' for linea in logs.output))
+        self.assertEqual(resumen[vista]['peticiones'], 2)
+        self.assertEqual(resumen[vista]['consultas']['max'], normal['consultas'])
+
+    async def test_vista_async(self):
+        await self.async_client.aforce_login(self.admin)
+        with self.assertLogs('gestion_tributaria.instrumentacion', 'INFO') as logs:
+            await self.async_client.get(reverse('gestion_tributaria:calificacion', args=[self.calificacion.pk]))
+        registro, = self._registros(logs)
+        self.assertEqual(registro['vista'], 'gestion_tributaria:calificacion')
+        self.assertGreater(registro['consultas'], 0)
+
+
+# ============================================
+# DATOS SINTÉTICOS Y BENCHMARK
+# ============================================
+class DatosSinteticosTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@nuam.cl', 'clave')
+
+    def test_valores_generados(self):
+        filas = list(datos_sinteticos.generar_valores(300, [2023, 2024], semilla=3, corredores=5))
+        self.assertEqual(filas, list(datos_sinteticos.generar_valores(300, [2023, 2024], semilla=3, corredores=5)))
+        claves = {
+            (indice, valores['ejercicio'], valores['mercado'], valores['instrumento'], valores['secuencia_evento'])
+            for indice, valores in filas
+        }
+        self.assertEqual(len(claves), 300)
+        for _, valores in filas:
+            self.assertTrue(all(0 <= factor <= formato_dj1948.ESCALA_FACTOR for factor in valores['factores']))
+            self.assertLessEqual(sum(valores['factores'][:9]), formato_dj1948.ESCALA_FACTOR)
+
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'sintetico.csv')
+            datos_sinteticos.escribir_csv(ruta, 200, [2024], semilla=3)
+            carga = CargaMasiva.objects.create(usuario=self.admin, tipo_carga='FACTORES', nombre_archivo='sintetico.csv')
+            carga = procesar_carga(carga, ruta)
+        self.assertEqual((carga.registros_exitosos, carga.registros_fallidos), (200, 0))
+
+    def test_poblar(self):
+        creados = datos_sinteticos.poblar(300, 3, [2023, 2024], logs=50, semilla=1, tamano_lote=100)
+        self.assertEqual((creados['corredores'], creados['cargas'], creados['calificaciones']), (3, 6, 300))
+        self.assertEqual(Perfil.objects.filter(usuario__username__startswith='sintetico').count(), 3)
+        self.assertEqual(CalificacionTributaria.objects.count(), 300)
+        masivas = CalificacionTributaria.objects.filter(origen='MASIVO').count()
+        self.assertEqual(sum(CargaMasiva.objects.values_list('registros_insertados', flat=True)), masivas)
+        self.assertEqual(LogOperacion.objects.filter(operacion='CARGA').count(), 6)
+        self.assertEqual(LogOperacion.objects.filter(operacion='UPDATE').count(), creados['logs'] - 6)
+        self.assertLessEqual(creados['logs'] - 6, 50)
+
+    def test_benchmark(self):
+        datos_sinteticos.poblar(200, 2, [2024], semilla=2)
+        with tempfile.TemporaryDirectory() as directorio:
+            salida = os.path.join(directorio, 'benchmark.json')
+            opciones = {'usuario': 'admin', 'repeticiones': 1, 'calentamiento': 0, 'filas_carga': 50, 'stdout': io.StringIO()}
+            call_command('benchmark', salida=salida, **opciones)
+            with open(salida, encoding='utf-8') as archivo:
+                resultado = json.load(archivo)
+            salida_comparacion = io.StringIO()
+            call_command('benchmark', solo='exportacion', comparar=salida, tolerancia=1000, json=True,
+                         **{**opciones, 'stdout': salida_comparacion})
+
+        benchmarks = resultado['benchmarks']
+        self.assertEqual(resultado['entorno']['filas']['calificaciones'], 200)
+        self.assertEqual(benchmarks['carga_masiva']['filas'], 50)
+        self.assertEqual(benchmarks['validacion']['filas'], 50)
+        self.assertEqual(benchmarks['exportacion']['filas'], 200)
+        self.assertEqual(benchmarks['api_filtro']['filas'], CalificacionTributaria.objects.filter(mercado='ACN').count())
+        # La carga del benchmark se deshace
+        self.assertEqual(CalificacionTributaria.objects.count(), 200)
+        comparacion = json.loads(salida_comparacion.getvalue())['comparacion']
+        self.assertEqual(list(comparacion), ['exportacion'])
+        self.assertFalse(comparacion['exportacion']['regresion'])
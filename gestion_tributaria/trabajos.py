@@ -0,0 +1,152 @@
+"""
+Cola de cargas masivas en la base de datos (sin broker externo).
+
+Las CargaMasiva con estado PENDIENTE son los trabajos. Un worker
+(`manage.py procesar_cargas`) toma una con SELECT ... FOR UPDATE SKIP LOCKED,
+la marca PROCESANDO y la procesa lote a lote; cada lote confirmado actualiza
+el progreso y el latido de la carga. Si el worker muere, la carga queda con
+un latido antiguo y otro worker la retoma desde el último lote confirmado.
+"""
+import logging
+import os
+import signal
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import F, Q, TextField, Value
+from django.db.models.functions import Coalesce, Concat
+from django.utils import timezone
+
+from . import auditoria, carga_paralela
+from .carga_masiva import CargaInterrumpida, procesar_carga
+from .formato_dj1948 import ErrorFila
+from .models import CargaMasiva
+
+logger = logging.getLogger(__name__)
+
+
+def nombre_worker():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def tomar_siguiente_carga(worker):
+    """Asigna a `worker` la carga pendiente (o abandonada) más antigua"""
+    ahora = timezone.now()
+    abandonadas = ahora - timedelta(seconds=settings.CARGA_MASIVA_LATIDO_MAXIMO)
+    with transaction.atomic():
+        carga = (
+            CargaMasiva.objects
+            .select_for_update(skip_locked=True)
+            .filter(Q(estado='PENDIENTE') | Q(estado='PROCESANDO', latido__lt=abandonadas))
+            .exclude(archivo='')
+            .exclude(archivo__isnull=True)
+            .order_by('fecha_carga', 'pk')
+            .first()
+        )
+        if carga is None:
+            return None
+        if carga.estado == 'PROCESANDO':
+            logger.warning('Retomando carga %s abandonada por %s', carga.pk, carga.worker)
+        carga.estado = 'PROCESANDO'
+        carga.worker = worker
+        carga.latido = ahora
+        carga.intentos += 1
+        carga.fecha_inicio = carga.fecha_inicio or ahora
+        carga.save(update_fields=['estado', 'worker', 'latido', 'intentos', 'fecha_inicio'])
+    return carga
+
+
+def ejecutar_carga(carga, archivo=None, worker=None):
+    """
+    Procesa la carga y deja su estado final.
+
+    Los errores del archivo (cabecera inválida) la dejan FALLIDA; los errores
+    inesperados la devuelven a PENDIENTE hasta CARGA_MASIVA_MAX_INTENTOS.
+    """
+    procesos = carga_paralela.procesos_lectura()
+    tamano_lote = carga.tamano_lote or settings.CARGA_MASIVA_TAMANO_LOTE
+    try:
+        archivo = archivo or _ruta_local(carga)
+        if archivo is None:
+            with carga.archivo.open('rb') as archivo_carga:
+                procesar_carga(carga, archivo_carga, tamano_lote, worker, procesos)
+        else:
+            procesar_carga(carga, archivo, tamano_lote, worker, procesos)
+    except CargaInterrumpida as exc:
+        logger.warning('%s', exc)
+    except ErrorFila:
+        _finalizar(carga, worker, 'FALLIDA')
+    except (KeyboardInterrupt, SystemExit):
+        _finalizar(carga, worker, 'PENDIENTE')
+        raise
+    except Exception as exc:
+        logger.exception('Error procesando la carga %s', carga.pk)
+        estado = 'PENDIENTE' if carga.intentos < settings.CARGA_MASIVA_MAX_INTENTOS else 'FALLIDA'
+        _finalizar(carga, worker, estado, f'Error interno (intento {carga.intentos}): {exc}')
+    else:
+        _finalizar(carga, worker, 'COMPLETADA')
+    carga.refresh_from_db()
+    if carga.estado in ('COMPLETADA', 'FALLIDA'):
+        auditoria.registrar_carga(carga)
+    return carga
+
+
+def _ruta_local(carga):
+    """Ruta del archivo en disco, si el almacenamiento la tiene (permite leerlo en paralelo)"""
+    try:
+        return carga.archivo.path
+    except NotImplementedError:
+        return None
+
+
+def _finalizar(carga, worker, estado, error=None):
+    cambios = {'estado': estado, 'worker': ''}
+    if estado in ('COMPLETADA', 'FALLIDA'):
+        cambios['fecha_fin'] = timezone.now()
+    if error:
+        cambios['errores_detalle'] = Concat(
+            Coalesce(F('errores_detalle'), Value(''), output_field=TextField()),
+            Value(f'{error}\n'),
+            output_field=TextField(),
+        )
+    cargas = CargaMasiva.objects.filter(pk=carga.pk)
+    if worker is not None:
+        cargas = cargas.filter(worker=worker)
+    cargas.update(**cambios)
+
+
+# ============================================
+# BUCLE DEL WORKER
+# ============================================
+def ejecutar_worker(intervalo=5, una_vez=False):
+    """Procesa cargas hasta recibir SIGTERM/SIGINT (o hasta vaciar la cola con `una_vez`)"""
+    signal.signal(signal.SIGTERM, _detener)
+    worker = nombre_worker()
+    logger.info('Worker de cargas %s iniciado', worker)
+
+    while True:
+        close_old_connections()
+        try:
+            carga = tomar_siguiente_carga(worker)
+        except DatabaseError:
+            logger.exception('No se pudo consultar la cola de cargas')
+            time.sleep(intervalo)
+            continue
+        if carga is None:
+            if una_vez:
+                return
+            time.sleep(intervalo)
+            continue
+        logger.info('Procesando carga %s (%s)', carga.pk, carga.nombre_archivo)
+        carga = ejecutar_carga(carga, worker=worker)
+        logger.info(
+            'Carga %s %s: %s procesados, %s fallidos',
+            carga.pk, carga.estado, carga.registros_procesados, carga.registros_fallidos,
+        )
+
+
+def _detener(signum, frame):
+    raise SystemExit(0)
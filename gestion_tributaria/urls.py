@@ -0,0 +1,14 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'gestion_tributaria'
+
+urlpatterns = [
+    path('calificaciones/', views.calificaciones, name='calificaciones'),
+    path('calificaciones/<int:pk>/', views.calificacion_detalle, name='calificacion'),
+    path('calificaciones/evento/', views.calificaciones_evento, name='calificaciones_evento'),
+    path('calificaciones/exportar/', views.exportar_calificaciones, name='exportar_calificaciones'),
+    path('cargas/', views.cargas, name='cargas'),
+    path('cargas/<int:pk>/', views.carga_detalle, name='carga'),
+]
@@ -0,0 +1,196 @@
+"""
+Validación por lotes de calificaciones tributarias.
+
+Trabaja sobre un lote columnar (dict campo -> lista de valores) en vez de
+instancias del modelo: los campos decimales van como enteros escalados
+(valor * 10**decimal_places), de modo que rangos y sumas se comparan con
+aritmética entera exacta, columna por columna. Los factores 8-37 ya vienen
+escalados desde la columna `factores` del modelo.
+
+Los códigos y mensajes son los mismos que producen los validadores de los
+campos y CalificacionTributaria.clean(), así que el admin y las cargas
+masivas comparten la misma regla.
+
+Los límites de los factores y la suma 8-16 también son restricciones CHECK
+de la tabla (models._restricciones_factores): las cargas masivas validan
+aquí solo los demás campos (factores=False) y dejan los factores a la base.
+"""
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.core.exceptions import ValidationError
+from django.core.validators import DecimalValidator, MaxValueValidator, MinValueValidator
+
+from .formato_dj1948 import CAMPOS_FACTOR, ESCALA_FACTOR
+
+CAMPOS_SUMA = [f'factor_{n}' for n in range(8, 17)]
+CAMPOS_DECIMALES = ['valor_historico', 'factor_actualizacion'] + CAMPOS_FACTOR
+CAMPOS_VALIDADOS = ['ejercicio'] + CAMPOS_DECIMALES
+CAMPOS_SIN_FACTORES = [campo for campo in CAMPOS_VALIDADOS if campo not in CAMPOS_FACTOR]
+MENSAJE_SUMA = 'La suma de los factores 8 al 16 no puede superar 1. Suma actual: {suma}'
+
+
+class ErrorValidacion(NamedTuple):
+    campo: str
+    codigo: str
+    mensaje: str
+    params: dict
+
+
+# ============================================
+# CONVERSIÓN A LOTE COLUMNAR
+# ============================================
+def escala(campo):
+    """10**decimal_places del campo (1 para campos enteros)"""
+    return 10 ** getattr(_campo_modelo(campo), 'decimal_places', 0)
+
+
+def a_escalado(valor, campo):
+    """Decimal -> entero escalado según los decimales del campo"""
+    return int(Decimal(valor).scaleb(_campo_modelo(campo).decimal_places))
+
+
+def desde_escalado(valor, campo):
+    """Entero escalado -> Decimal con los decimales del campo"""
+    return Decimal(valor).scaleb(-_campo_modelo(campo).decimal_places)
+
+
+def lote_desde_filas(filas):
+    """Convierte una lista de dicts (valores del modelo) en un lote columnar"""
+    lote = {'ejercicio': [fila['ejercicio'] for fila in filas]}
+    for campo in CAMPOS_DECIMALES:
+        decimales = _campo_modelo(campo).decimal_places
+        lote[campo] = [int(Decimal(fila[campo]).scaleb(decimales)) for fila in filas]
+    return lote
+
+
+def lote_desde_valores(filas, factores=True):
+    """Lote columnar desde dicts de valores del modelo con `factores` ya escalado"""
+    lote = {'ejercicio': [fila['ejercicio'] for fila in filas]}
+    for campo in ('valor_historico', 'factor_actualizacion'):
+        decimales = _campo_modelo(campo).decimal_places
+        lote[campo] = [int(Decimal(fila[campo]).scaleb(decimales)) for fila in filas]
+    if factores:
+        lote.update(lote_factores([fila['factores'] for fila in filas]))
+    return lote
+
+
+def lote_desde_instancias(objetos):
+    lote = {'ejercicio': [objeto.ejercicio for objeto in objetos]}
+    for campo in ('valor_historico', 'factor_actualizacion'):
+        decimales = _campo_modelo(campo).decimal_places
+        lote[campo] = [int(Decimal(getattr(objeto, campo)).scaleb(decimales)) for objeto in objetos]
+    lote.update(lote_factores([objeto.factores for objeto in objetos]))
+    return lote
+
+
+def lote_factores(listas):
+    """Columnas factor_N a partir de los arreglos `factores` (ya escalados) de cada fila"""
+    if not listas:
+        return {campo: [] for campo in CAMPOS_FACTOR}
+    return dict(zip(CAMPOS_FACTOR, map(list, zip(*listas))))
+
+
+# ============================================
+# VALIDACIÓN
+# ============================================
+def validar_lote(lote, factores=True):
+    """
+    Valida un lote columnar completo.
+
+    Devuelve una lista con una entrada por fila: la lista (posiblemente vacía)
+    de ErrorValidacion de esa fila, en el mismo orden que full_clean(). Con
+    factores=False no se revisan los factores ni su suma (quedan para las
+    restricciones CHECK de la base).
+    """
+    errores = _validar_campos(lote, CAMPOS_SIN_FACTORES)
+    if factores:
+        for errores_fila, errores_factores in zip(errores, validar_factores(lote)):
+            errores_fila.extend(errores_factores)
+    return errores
+
+
+def validar_factores(lote):
+    """Límites de cada factor y suma 8-16 (lo que CalificacionTributaria.clean() revisa), por fila"""
+    errores = _validar_campos(lote, CAMPOS_FACTOR)
+    for i, error in enumerate(validar_suma_factores(lote)):
+        if error:
+            errores[i].append(error)
+    return errores
+
+
+def _validar_campos(lote, campos):
+    errores = [[] for _ in range(len(lote[campos[0]]))]
+    for campo in campos:
+        for validador, fuera_de_rango in _reglas(campo):
+            columna = lote[campo]
+            for i in [i for i, valor in enumerate(columna) if fuera_de_rango(valor)]:
+                errores[i].append(_error_validador(campo, validador, columna[i]))
+    return errores
+
+
+def validar_suma_factores(lote):
+    """Regla de CalificacionTributaria.clean(): suma factores 8-16 <= 1"""
+    sumas = map(sum, zip(*(lote[campo] for campo in CAMPOS_SUMA)))
+    return [
+        _error_suma(suma) if suma > ESCALA_FACTOR else None
+        for suma in sumas
+    ]
+
+
+def a_validation_error(errores):
+    """ErrorValidacion de una fila -> ValidationError como el de full_clean()"""
+    por_campo = {}
+    for error in errores:
+        campo = '__all__' if error.campo is None else error.campo
+        por_campo.setdefault(campo, []).append(
+            ValidationError(error.mensaje, code=error.codigo, params=error.params)
+        )
+    return ValidationError(por_campo)
+
+
+def _error_suma(suma_escalada):
+    suma = desde_escalado(suma_escalada, 'factor_8')
+    return ErrorValidacion(None, 'suma_factores', MENSAJE_SUMA.format(suma=suma), None)
+
+
+def _error_validador(campo, validador, valor_escalado):
+    valor = valor_escalado if campo == 'ejercicio' else desde_escalado(valor_escalado, campo)
+    if isinstance(validador, DecimalValidator):
+        params = {'max': validador.max_digits, 'value': valor}
+        return ErrorValidacion(campo, 'max_digits', validador.messages['max_digits'], params)
+    params = {'limit_value': validador.limit_value, 'show_value': valor, 'value': valor}
+    return ErrorValidacion(campo, validador.code, validador.message, params)
+
+
+# ============================================
+# REGLAS POR CAMPO (derivadas de los validadores del modelo)
+# ============================================
+_REGLAS = {}
+
+
+def _campo_modelo(campo):
+    from .models import DEFINICION_FACTOR, CalificacionTributaria
+    if campo in CAMPOS_FACTOR:
+        return DEFINICION_FACTOR
+    return CalificacionTributaria._meta.get_field(campo)
+
+
+def _reglas(campo):
+    """Pares (validador, predicado sobre el valor escalado) del campo"""
+    if campo not in _REGLAS:
+        factor = escala(campo)
+        reglas = []
+        for validador in _campo_modelo(campo).validators:
+            if isinstance(validador, MinValueValidator):
+                limite = int(Decimal(validador.limit_value) * factor)
+                reglas.append((validador, lambda valor, limite=limite: valor < limite))
+            elif isinstance(validador, MaxValueValidator):
+                limite = int(Decimal(validador.limit_value) * factor)
+                reglas.append((validador, lambda valor, limite=limite: valor > limite))
+            elif isinstance(validador, DecimalValidator):
+                enteros = validador.max_digits - validador.decimal_places
+                limite = 10 ** enteros * factor
+                reglas.append((validador, lambda valor, limite=limite: abs(valor) >= limite))
+        _REGLAS[campo] = reglas
+    return _REGLAS[campo]
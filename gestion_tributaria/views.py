@@ -1,3 +1,355 @@
-from django.shortcuts import render
+"""
+API JSON de solo lectura sobre calificaciones tributarias.
 
-# Create your views here.
+GET /api/calificaciones/ devuelve páginas con paginación por cursor
+(keyset): cada página filtra "después de la última fila de la anterior"
+sobre las columnas de un índice, así que pedir la página 10.000 cuesta lo
+mismo que pedir la primera. Las filas salen de .values() y se serializan
+directamente, sin instanciar modelos.
+
+GET /api/calificaciones/evento/ devuelve las calificaciones de un evento
+(instrumento, fecha_pago, secuencia_evento) desde un caché de lectura
+(ver cache_calificaciones.py).
+
+GET /api/calificaciones/<id>/, /api/calificaciones/evento/, /api/cargas/ y
+/api/cargas/<id>/ son vistas async (ORM y caché asíncronos): con un
+servidor ASGI un mismo proceso atiende muchas consultas concurrentes.
+
+GET /api/calificaciones/exportar/ descarga las calificaciones de un
+ejercicio en el formato DJ1948 (ver exportacion.py).
+"""
+import base64
+import binascii
+import hashlib
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_GET
+
+from . import cache_calificaciones, exportacion, perfiles
+from .formato_dj1948 import CAMPOS_FACTOR, texto_factor
+from .models import CalificacionTributaria, CargaMasiva
+
+LIMITE_POR_DEFECTO = 100
+LIMITE_MAXIMO = 1000
+
+CAMPOS_EXCLUIDOS_API = {'hash_contenido', 'factores', 'descripcion_busqueda'}
+COLUMNAS_API = [
+    campo for campo in CalificacionTributaria._meta.concrete_fields
+    if campo.name not in CAMPOS_EXCLUIDOS_API
+]
+CAMPOS_API = [campo.name for campo in COLUMNAS_API] + CAMPOS_FACTOR
+# Lo que se lee con .values() para armar una fila completa con _fila_api()
+COLUMNAS_VALORES = [campo.name for campo in COLUMNAS_API] + ['factores']
+INDICE_FACTOR = {campo: indice for indice, campo in enumerate(CAMPOS_FACTOR)}
+GRUPOS_CAMPOS = {'factores': CAMPOS_FACTOR}
+
+# Orden de cada recorrido; ambos coinciden con un índice de calificacion_tributaria
+ORDENES = {
+    # Índice único de la clave natural (empieza por usuario, ejercicio, mercado)
+    'clave': ['usuario', 'ejercicio', 'mercado', 'instrumento', 'secuencia_evento'],
+    # Índice (instrumento, fecha_pago); id desempata
+    'instrumento': ['instrumento', 'fecha_pago', 'id'],
+}
+
+
+class ErrorConsulta(Exception):
+    """Parámetro inválido en la consulta: se responde 400"""
+
+
+# ============================================
+# API: CALIFICACIONES
+# ============================================
+@require_GET
+def calificaciones(request):
+    """
+    Parámetros (todos opcionales):
+      ejercicio, mercado, instrumento, usuario (solo administradores)
+      campos   lista separada por comas; 'factores' equivale a factor_8..factor_37
+      limite   filas por página (máximo LIMITE_MAXIMO)
+      cursor   valor de 'siguiente' de la página anterior
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Autenticación requerida'}, status=401)
+
+    try:
+        filtros = _filtros(request)
+        queryset = perfiles.calificaciones_visibles(request).filter(**filtros)
+        campos = _campos(request.GET.get('campos'))
+        limite = _entero(request.GET.get('limite'), 'limite', LIMITE_POR_DEFECTO)
+        limite = min(max(limite, 1), LIMITE_MAXIMO)
+        orden = 'instrumento' if request.GET.get('instrumento') else 'clave'
+        columnas = ORDENES[orden]
+        cursor = request.GET.get('cursor')
+        if cursor:
+            queryset = queryset.filter(_despues_de(columnas, _leer_cursor(cursor, orden, filtros)))
+    except ErrorConsulta as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    # Los factor_N salen del arreglo `factores`, que se lee una sola vez
+    columnas_campos = ['factores' if campo in INDICE_FACTOR else campo for campo in campos]
+    seleccion = list(dict.fromkeys(columnas_campos + columnas))
+    filas = list(queryset.order_by(*columnas).values(*seleccion)[:limite + 1])
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = _crear_cursor(orden, filtros, [filas[-1][columna] for columna in columnas])
+
+    if seleccion != campos:
+        filas = [_fila_api(fila, campos) for fila in filas]
+    return JsonResponse({'resultados': filas, 'siguiente': siguiente}, encoder=DjangoJSONEncoder)
+
+
+@require_GET
+async def calificaciones_evento(request):
+    """
+    Parámetros obligatorios: instrumento, fecha_pago (AAAA-MM-DD) y
+    secuencia_evento. Devuelve todas las calificaciones visibles del evento.
+    """
+    usuario = await request.auser()
+    if not usuario.is_authenticated:
+        return JsonResponse({'error': 'Autenticación requerida'}, status=401)
+    try:
+        instrumento = request.GET.get('instrumento')
+        fecha_pago = _fecha(request.GET.get('fecha_pago'), 'fecha_pago')
+        secuencia_evento = _entero(request.GET.get('secuencia_evento'), 'secuencia_evento')
+        if not instrumento or fecha_pago is None or secuencia_evento is None:
+            raise ErrorConsulta('Debe indicar instrumento, fecha_pago y secuencia_evento')
+    except ErrorConsulta as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    ver_todas = await perfiles.aes_administrador(request)
+    filas = [
+        _fila_api(_valores_api(calificacion), CAMPOS_API)
+        for calificacion in await cache_calificaciones.apor_evento(instrumento, fecha_pago, secuencia_evento)
+        if perfiles.es_visible(calificacion, usuario.pk, ver_todas)
+    ]
+    return JsonResponse({'resultados': filas}, encoder=DjangoJSONEncoder)
+
+
+@require_GET
+async def calificacion_detalle(request, pk):
+    """Una calificación visible para el usuario, con los mismos campos que la lista"""
+    usuario = await request.auser()
+    if not usuario.is_authenticated:
+        return JsonResponse({'error': 'Autenticación requerida'}, status=401)
+    ver_todas = await perfiles.aes_administrador(request)
+    fila = await (
+        CalificacionTributaria.objects
+        .visibles_para(usuario.pk, ver_todas)
+        .filter(pk=pk)
+        .values(*COLUMNAS_VALORES)
+        .afirst()
+    )
+    if fila is None:
+        return JsonResponse({'error': 'Calificación no encontrada'}, status=404)
+    return JsonResponse(_fila_api(fila, CAMPOS_API), encoder=DjangoJSONEncoder)
+
+
+@require_GET
+def exportar_calificaciones(request):
+    """
+    Parámetros: ejercicio (obligatorio), mercado, instrumento, usuario,
+      formato  csv (por defecto) o xlsx
+      gzip     1 para recibir el CSV comprimido (.csv.gz)
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Autenticación requerida'}, status=401)
+    if not request.GET.get('ejercicio'):
+        return JsonResponse({'error': 'Debe indicar el ejercicio'}, status=400)
+    formato = request.GET.get('formato', 'csv').lower()
+    if formato not in ('csv', 'xlsx'):
+        return JsonResponse({'error': 'formato debe ser csv o xlsx'}, status=400)
+    try:
+        queryset = _filtrar(perfiles.calificaciones_visibles(request), request)
+    except ErrorConsulta as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    nombre = f'dj1948_{int(request.GET["ejercicio"])}'
+    if formato == 'xlsx':
+        try:
+            bloques = exportacion.generar_xlsx(queryset)
+        except exportacion.ErrorExportacion as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+        tipo, extension = exportacion.TIPO_XLSX, 'xlsx'
+    elif request.GET.get('gzip') in ('1', 'true'):
+        bloques = exportacion.generar_csv(queryset, comprimir=True)
+        tipo, extension = 'application/gzip', 'csv.gz'
+    else:
+        bloques = exportacion.generar_csv(queryset)
+        tipo, extension = 'text/csv; charset=utf-8', 'csv'
+
+    respuesta = StreamingHttpResponse(bloques, content_type=tipo)
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre}.{extension}"'
+    return respuesta
+
+
+# ============================================
+# API: ESTADO DE CARGAS MASIVAS
+# ============================================
+CAMPOS_CARGA = [
+    'id', 'tipo_carga', 'modo', 'nombre_archivo', 'estado', 'fecha_carga', 'fecha_inicio', 'fecha_fin',
+    'latido', 'intentos', 'registros_procesados', 'registros_exitosos', 'registros_fallidos',
+    'registros_insertados', 'registros_actualizados', 'registros_sin_cambios',
+]
+LIMITE_CARGAS = 50
+
+
+@require_GET
+async def cargas(request):
+    """
+    Últimas cargas del usuario (todas para administradores), para consultar
+    su avance. Parámetro opcional: estado (PENDIENTE, PROCESANDO, ...).
+    """
+    usuario = await request.auser()
+    if not usuario.is_authenticated:
+        return JsonResponse({'error': 'Autenticación requerida'}, status=401)
+    queryset = await _cargas_visibles(request, usuario)
+    if request.GET.get('estado'):
+        queryset = queryset.filter(estado=request.GET['estado'].upper())
+    filas = [
+        fila async for fila in queryset.order_by('-fecha_carga').values(*CAMPOS_CARGA)[:LIMITE_CARGAS]
+    ]
+    return JsonResponse({'resultados': filas}, encoder=DjangoJSONEncoder)
+
+
+@require_GET
+async def carga_detalle(request, pk):
+    usuario = await request.auser()
+    if not usuario.is_authenticated:
+        return JsonResponse({'error': 'Autenticación requerida'}, status=401)
+    queryset = await _cargas_visibles(request, usuario)
+    try:
+        fila = await queryset.values(*CAMPOS_CARGA).aget(pk=pk)
+    except CargaMasiva.DoesNotExist:
+        return JsonResponse({'error': 'Carga no encontrada'}, status=404)
+    return JsonResponse(fila, encoder=DjangoJSONEncoder)
+
+
+async def _cargas_visibles(request, usuario):
+    if await perfiles.aes_administrador(request):
+        return CargaMasiva.objects.all()
+    return CargaMasiva.objects.filter(usuario_id=usuario.pk)
+
+
+def _fila_api(fila, campos):
+    return {
+        campo: texto_factor(fila['factores'][INDICE_FACTOR[campo]]) if campo in INDICE_FACTOR else fila[campo]
+        for campo in campos
+    }
+
+
+def _valores_api(calificacion):
+    """Lo mismo que .values() entrega para una fila, desde una instancia"""
+    valores = {campo.name: getattr(calificacion, campo.attname) for campo in COLUMNAS_API}
+    valores['factores'] = calificacion.factores
+    return valores
+
+
+def _filtrar(queryset, request):
+    return queryset.filter(**_filtros(request))
+
+
+def _filtros(request):
+    """Filtros de la consulta ya normalizados; los parámetros vacíos se omiten"""
+    parametros = request.GET
+    filtros = {}
+    if parametros.get('ejercicio'):
+        filtros['ejercicio'] = _entero(parametros['ejercicio'], 'ejercicio')
+    if parametros.get('mercado'):
+        filtros['mercado'] = parametros['mercado'].upper()
+    if parametros.get('instrumento'):
+        filtros['instrumento'] = parametros['instrumento']
+    if parametros.get('usuario'):
+        filtros['usuario_id'] = _entero(parametros['usuario'], 'usuario')
+    return filtros
+
+
+def _campos(valor):
+    if not valor:
+        return list(CAMPOS_API)
+    campos = []
+    for nombre in valor.split(','):
+        nombre = nombre.strip()
+        if nombre in GRUPOS_CAMPOS:
+            campos.extend(GRUPOS_CAMPOS[nombre])
+        elif nombre in CAMPOS_API:
+            campos.append(nombre)
+        elif nombre:
+            raise ErrorConsulta(f'Campo desconocido: {nombre}')
+    if not campos:
+        raise ErrorConsulta('Debe indicar al menos un campo')
+    return list(dict.fromkeys(campos))
+
+
+def _entero(valor, nombre, por_defecto=None):
+    if not valor:
+        return por_defecto
+    try:
+        return int(valor)
+    except ValueError:
+        raise ErrorConsulta(f'{nombre} debe ser un número entero')
+
+
+def _fecha(valor, nombre):
+    if not valor:
+        return None
+    try:
+        fecha = parse_date(valor)
+    except ValueError:
+        fecha = None
+    if fecha is None:
+        raise ErrorConsulta(f'{nombre} debe ser una fecha AAAA-MM-DD')
+    return fecha
+
+
+# ============================================
+# CURSOR (KEYSET)
+# ============================================
+def _crear_cursor(orden, filtros, valores):
+    datos = json.dumps([orden, _huella(filtros), valores], cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(datos.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _leer_cursor(cursor, orden, filtros):
+    """
+    Valores de la última fila entregada, convertidos al tipo de cada columna.
+    El cursor solo sirve con los mismos filtros con que se creó.
+    """
+    try:
+        datos = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        orden_cursor, huella, valores = json.loads(datos)
+    except (binascii.Error, ValueError, TypeError):
+        raise ErrorConsulta('Cursor inválido')
+    if orden_cursor != orden or huella != _huella(filtros) or len(valores) != len(ORDENES[orden]):
+        raise ErrorConsulta('El cursor no corresponde a estos filtros')
+    try:
+        return [
+            CalificacionTributaria._meta.get_field(columna).to_python(valor)
+            for columna, valor in zip(ORDENES[orden], valores)
+        ]
+    except ValidationError:
+        raise ErrorConsulta('Cursor inválido')
+
+
+def _huella(filtros):
+    """Resumen corto de los filtros normalizados ('acn' y 'ACN' dan lo mismo)"""
+    datos = json.dumps(filtros, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(datos.encode('utf-8')).hexdigest()[:16]
+
+
+def _despues_de(columnas, valores):
+    """
+    Filas posteriores a `valores` en el orden de `columnas`:
+    (a, b, c) > (x, y, z) expandido a OR, más a >= x para acotar el
+    recorrido del índice desde su primera columna.
+    """
+    condicion = Q()
+    for posicion, columna in enumerate(columnas):
+        iguales = {columnas[i]: valores[i] for i in range(posicion)}
+        condicion |= Q(**iguales, **{f'{columna}__gt': valores[posicion]})
+    return Q(**{f'{columnas[0]}__gte': valores[0]}) & condicion
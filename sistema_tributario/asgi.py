@@ -3,6 +3,9 @@ ASGI config for sistema_tributario project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Con ASGI las conexiones persistentes (DB_CONN_MAX_AGE) no se reutilizan
+entre peticiones: usar DB_POOL=True (ver .env.example).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
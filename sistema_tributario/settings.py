@@ -37,10 +37,13 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'gestion_tributaria',
 ]
 
 MIDDLEWARE = [
+    # Primero: mide también las consultas de sesión y autenticación (solo con SQL_INSTRUMENTACION)
+    'gestion_tributaria.instrumentacion.InstrumentacionSQLMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,9 +86,32 @@ DATABASES = {
         'PASSWORD': config('DB_PASSWORD'),
         'HOST': config('DB_HOST'),
         'PORT': config('DB_PORT', cast=int),
+        # Conexiones persistentes: se reutilizan entre peticiones hasta
+        # DB_CONN_MAX_AGE segundos (0 = una conexión nueva por petición) y
+        # se verifican antes de reutilizarlas
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+        # Necesario detrás de PgBouncer en modo transacción: los cursores del
+        # lado del servidor (.iterator(), exportaciones) no sobreviven entre
+        # transacciones
+        'DISABLE_SERVER_SIDE_CURSORS': config('DB_DISABLE_SERVER_SIDE_CURSORS', default=False, cast=bool),
+        'OPTIONS': {
+            'connect_timeout': config('DB_CONNECT_TIMEOUT', default=10, cast=int),
+        },
     }
 }
 
+# Pool de conexiones de Django (requiere psycopg 3: pip install "psycopg[binary,pool]").
+# Recomendado para ASGI, donde las conexiones persistentes no se reutilizan
+# entre peticiones; con pool, CONN_MAX_AGE debe ser 0.
+if config('DB_POOL', default=False, cast=bool):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': config('DB_POOL_MIN', default=2, cast=int),
+        'max_size': config('DB_POOL_MAX', default=10, cast=int),
+        'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+    }
+
 
 
 # Password validation
@@ -124,6 +150,100 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Archivos subidos (cargas masivas)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = config('MEDIA_ROOT', default=str(BASE_DIR / 'media'))
+
+
+# Worker de cargas masivas (manage.py procesar_cargas)
+
+CARGA_MASIVA_PROCESOS = config('CARGA_MASIVA_PROCESOS', default=2, cast=int)
+CARGA_MASIVA_TAMANO_LOTE = config('CARGA_MASIVA_TAMANO_LOTE', default=1000, cast=int)
+# Segundos sin confirmar un lote tras los cuales la carga se considera abandonada
+CARGA_MASIVA_LATIDO_MAXIMO = config('CARGA_MASIVA_LATIDO_MAXIMO', default=300, cast=int)
+CARGA_MASIVA_MAX_INTENTOS = config('CARGA_MASIVA_MAX_INTENTOS', default=3, cast=int)
+# Conversión en paralelo de los CSV grandes (carga_paralela): procesos por
+# carga (0 = uno por CPU, 1 = siempre secuencial) y tamaño mínimo del archivo
+CARGA_MASIVA_PROCESOS_LECTURA = config('CARGA_MASIVA_PROCESOS_LECTURA', default=0, cast=int)
+CARGA_MASIVA_PARALELO_DESDE_MB = config('CARGA_MASIVA_PARALELO_DESDE_MB', default=64, cast=int)
+
+
+# Caché (por defecto en memoria de cada proceso; para que la invalidación
+# llegue a todos los procesos usar uno compartido, p. ej.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache). Las
+# estadísticas del caché de calificaciones (manage.py estadisticas_cache)
+# requieren uno compartido.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+# Segundos que se guardan los valores de los filtros del admin
+FACETAS_TTL = config('FACETAS_TTL', default=600, cast=int)
+# Segundos que se guarda el rol de cada usuario (se invalida al cambiar su Perfil)
+PERFIL_ROL_TTL = config('PERFIL_ROL_TTL', default=300, cast=int)
+# Caché de calificaciones por evento (cache_calificaciones.py): segundos en el
+# caché compartido, y segundos y entradas del LRU de cada proceso
+CALIFICACIONES_CACHE_TTL = config('CALIFICACIONES_CACHE_TTL', default=3600, cast=int)
+CALIFICACIONES_CACHE_TTL_LOCAL = config('CALIFICACIONES_CACHE_TTL_LOCAL', default=30, cast=int)
+CALIFICACIONES_CACHE_MAX_LOCAL = config('CALIFICACIONES_CACHE_MAX_LOCAL', default=10000, cast=int)
+
+
+# Particiones mensuales de log_operacion (manage.py particionar_logs)
+
+LOG_OPERACION_MESES_FUTUROS = config('LOG_OPERACION_MESES_FUTUROS', default=3, cast=int)
+# Meses que se conservan en la base de datos; los anteriores se archivan (0 = sin límite)
+LOG_OPERACION_RETENCION_MESES = config('LOG_OPERACION_RETENCION_MESES', default=24, cast=int)
+LOG_OPERACION_ARCHIVO_DIR = config('LOG_OPERACION_ARCHIVO_DIR', default=str(BASE_DIR / 'archivo_logs'))
+
+
+# Instrumentación SQL por petición (instrumentacion.py, manage.py informe_sql)
+
+SQL_INSTRUMENTACION = config('SQL_INSTRUMENTACION', default=False, cast=bool)
+# Presupuesto de cada petición: consultas, milisegundos en SQL y veces que se
+# repite una misma sentencia (N+1); al superarlo se registra un WARNING (0 = sin límite)
+SQL_PRESUPUESTO_CONSULTAS = config('SQL_PRESUPUESTO_CONSULTAS', default=50, cast=int)
+SQL_PRESUPUESTO_MS = config('SQL_PRESUPUESTO_MS', default=500, cast=int)
+SQL_PRESUPUESTO_REPETICIONES = config('SQL_PRESUPUESTO_REPETICIONES', default=10, cast=int)
+# Presupuestos por vista (nombre de la URL), sobre los globales
+SQL_PRESUPUESTOS = {
+    'admin:gestion_tributaria_calificaciontributaria_changelist': {'consultas': 15},
+    'admin:gestion_tributaria_logoperacion_changelist': {'consultas': 15},
+    'gestion_tributaria:calificaciones': {'consultas': 10},
+    'gestion_tributaria:exportar_calificaciones': {'ms': 0},
+}
+# Sentencias más lentas y mínimo de repeticiones que se detallan en el registro
+SQL_LENTAS = config('SQL_LENTAS', default=5, cast=int)
+SQL_REPETIDAS_MINIMO = config('SQL_REPETIDAS_MINIMO', default=3, cast=int)
+# True: el detalle (lentas, repetidas) va en todas las líneas, no solo en las que exceden
+SQL_INSTRUMENTACION_DETALLE = config('SQL_INSTRUMENTACION_DETALLE', default=False, cast=bool)
+# Archivo de las líneas JSON ('' = consola)
+SQL_INSTRUMENTACION_ARCHIVO = config('SQL_INSTRUMENTACION_ARCHIVO', default='')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'mensaje': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'instrumentacion': {
+            'class': 'logging.FileHandler' if SQL_INSTRUMENTACION_ARCHIVO else 'logging.StreamHandler',
+            'formatter': 'mensaje',
+            **({'filename': SQL_INSTRUMENTACION_ARCHIVO} if SQL_INSTRUMENTACION_ARCHIVO else {}),
+        },
+    },
+    'loggers': {
+        'gestion_tributaria.instrumentacion': {
+            'handlers': ['instrumentacion'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 